@@ -1,18 +1,35 @@
-import pyaudio
-import numpy as np
-import threading
-import queue
-import time
-import wave
-import io
-import requests
+import sys
+import startup
+# 起動計測（--startup-report）は以降の import も含める / Startup timing (--startup-report) covers the imports below
+startup.begin(sys.argv)
+
 from collections import deque
 import tkinter as tk
 from tkinter import ttk
 import os
-from datetime import datetime
+import threading
 import json
 
+from startup import lazy_import
+from ui_dispatcher import UIDispatcher
+from subtitle_history import SubtitleHistory
+from transcription_engine import TranscriptionEngine
+from subtitle_export import format_timestamp, format_for_path
+
+capture_sources = lazy_import('capture_sources')   # 復元時のラベル付けのみ / Only for labelling recovered transcripts
+
+startup.mark('imports')
+
+EXPORT_FLAG = '--export'
+
+
+def __getattr__(name):
+    """サーバー側実装（オプション）は参照されたときに読み込む / The server-side implementation (optional) loads when referenced"""
+    if name == 'RealtimeTranscriberServer':
+        from transcriber_server import RealtimeTranscriberServer
+        return RealtimeTranscriberServer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 class FloatingSubtitleWindow:
     """浮動字幕表示ウィンドウクラス / Floating Subtitle Display Window Class"""
     def __init__(self, parent):
@@ -33,6 +50,9 @@ class FloatingSubtitleWindow:
         
         # 字幕履歴（最新2件を保持） / Subtitle history (keep last two entries)
         self.subtitle_history = deque(maxlen=2)
+        # 確定前の途中経過 (ソース, 番号) -> テキスト / In-progress text per (source, seq) until it is committed
+        self.partials = {}
+        self.committed_seq = {}   # ソースごとの確定済みの最大番号 / Highest committed seq per source
         
         # フォントサイズ設定 / Font size settings
         self.font_size = 14
@@ -298,19 +318,51 @@ class FloatingSubtitleWindow:
             self.window = None
         self.is_visible = False
         
-    def update_subtitle(self, text):
-        """字幕表示を更新 / Update subtitle display"""
-        if text.strip():
-            self.subtitle_history.append(text.strip())
-            
-            # 最新2件の字幕を表示 / Display the latest two subtitles
-            display_text = '\n'.join(self.subtitle_history)
+    def update_subtitle(self, text, key=None, partial=False):
+        """字幕表示を更新（partial は key＝(ソース, 番号) の確定字幕が届くまで仮に表示） / Update subtitle display; partial text stands in until the committed subtitle for key = (source, seq) arrives"""
+        if partial:
+            self.show_partials({key: text})
+        else:
+            self.update_subtitles([text], [key] if key else ())
+        
+    def update_subtitles(self, texts, committed=()):
+        """複数の字幕をまとめて追加し、表示は1回だけ更新（committed のキーまでの途中経過は置き換える） / Append several subtitles and redraw once, replacing in-progress text up to the committed keys"""
+        texts = [text.strip() for text in texts if text.strip()]
+        for source, seq in committed:
+            self.committed_seq[source] = max(seq, self.committed_seq.get(source, -1))
+        if committed:
+            # 空や失敗で確定字幕の来ないチャンクも、後続の確定で消える / Chunks that never commit (empty, failed) are cleared by a later one
+            self.partials = {key: text for key, text in self.partials.items()
+                             if key[1] > self.committed_seq.get(key[0], -1)}
+        self.subtitle_history.extend(texts)
+        if texts or committed:
+            self.redraw()
             
-            if self.window and self.is_visible:
-                self.subtitle_label.configure(text=display_text)
-                # テキストの wraplength を更新 / Update wraplength for text
-                current_width = self.window.winfo_width()
-                self.subtitle_label.configure(wraplength=current_width - 20)
+    def show_partials(self, partials):
+        """途中経過を表示（確定済みのチャンクの分は無視） / Show in-progress text, ignoring chunks already committed"""
+        for (source, seq), text in partials.items():
+            if seq > self.committed_seq.get(source, -1):
+                self.partials[(source, seq)] = text.strip()
+        self.redraw()
+        
+    def clear_partials(self):
+        """途中経過を消す（録音の開始・停止時） / Drop in-progress text (when recording starts or stops)"""
+        self.partials = {}
+        self.committed_seq = {}
+        self.redraw()
+        
+    def redraw(self):
+        """確定字幕に続けて途中経過を並べ、最新2行を表示 / Show the latest two lines, committed subtitles followed by in-progress text"""
+        lines = list(self.subtitle_history) + [text for _, text in sorted(self.partials.items()) if text]
+        
+        # 最新2件の字幕を表示 / Display the latest two subtitles
+        display_text = '\n'.join(lines[-self.subtitle_history.maxlen:])
+        
+        if self.window and self.is_visible:
+            self.subtitle_label.configure(text=display_text)
+            # テキストの wraplength を更新 / Update wraplength for text
+            current_width = self.window.winfo_width()
+            self.subtitle_label.configure(wraplength=current_width - 20)
 
 class RealtimeJapaneseTranscriber:
     """リアルタイム字幕転写システム（キーワード付き） / Real-time Japanese Subtitle Transcription System (with keyword)"""
@@ -340,7 +392,12 @@ class RealtimeJapaneseTranscriber:
                 'response_time': '応答時間',
                 'prompt_length': 'プロンプト長',
                 'buffer_length': 'バッファ長',
-                'gui_language': '言語'
+                'upload_label': 'アップロード',
+                'lag_label': '遅延',
+                'pending_label': '処理待ち',
+                'vad_label': '無音区間で区切る（VAD）',
+                'gui_language': '言語',
+                'recovered_session': '前回のセッション（異常終了）を復元しました'
             },
             'en': {
                 'window_title': 'Real-time Subtitle System (with keyword)',
@@ -364,7 +421,12 @@ class RealtimeJapaneseTranscriber:
                 'response_time': 'Response time',
                 'prompt_length': 'Prompt length',
                 'buffer_length': 'Buffer length',
-                'gui_language': 'Language'
+                'upload_label': 'Upload',
+                'lag_label': 'Lag',
+                'pending_label': 'Pending',
+                'vad_label': 'Split at pauses (VAD)',
+                'gui_language': 'Language',
+                'recovered_session': 'Recovered the previous session (ended unexpectedly)'
             },
             'zh': {
                 'window_title': '实时字幕系统（带关键词）',
@@ -388,7 +450,12 @@ class RealtimeJapaneseTranscriber:
                 'response_time': '响应时间',
                 'prompt_length': '提示长度',
                 'buffer_length': '缓冲区长度',
-                'gui_language': '语言'
+                'upload_label': '上传',
+                'lag_label': '延迟',
+                'pending_label': '待处理',
+                'vad_label': '按静音分段（VAD）',
+                'gui_language': '语言',
+                'recovered_session': '已恢复上次会话（异常结束）'
             },
             'ko': {
                 'window_title': '실시간 자막 시스템 (키워드 포함)',
@@ -412,7 +479,12 @@ class RealtimeJapaneseTranscriber:
                 'response_time': '응답 시간',
                 'prompt_length': '프롬프트 길이',
                 'buffer_length': '버퍼 길이',
-                'gui_language': '언어'
+                'upload_label': '업로드',
+                'lag_label': '지연',
+                'pending_label': '대기',
+                'vad_label': '무음 구간에서 분할 (VAD)',
+                'gui_language': '언어',
+                'recovered_session': '이전 세션(비정상 종료)을 복구했습니다'
             }
         }
         
@@ -422,41 +494,20 @@ class RealtimeJapaneseTranscriber:
         # Load saved language preference
         self.load_language_preference()
         
-        # オーディオ設定 / Audio configuration
-        self.CHUNK = 1024
-        self.FORMAT = pyaudio.paInt16
-        self.CHANNELS = 1
-        self.RATE = 16000
-        self.CHUNK_DURATION = 4.0    # 各チャンクの長さ（秒） / Each chunk duration (seconds)
-        self.OVERLAP_DURATION = 0.8    # 重なり部分の長さ（秒） / Overlap duration (seconds)
-        
-        # API設定 / API configuration
-        self.api_key = api_key
-        self.api_url = "https://api.openai.com/v1/audio/transcriptions"
-        
-        # 状態管理 / State management
-        self.is_recording = False
-        self.audio_queue = queue.Queue()
-        self.transcription_queue = queue.Queue()
-        self.context_history = deque(maxlen=4)  # 最新3チャンクの文脈を保持 / Keep last 3 chunks of context
-        
-        # キーワード / Keyword
-        self.meeting_topic = ""  # GUIから入力されたキーワードを格納 / Store keyword entered in GUI
-        
-        # オーディオバッファ / Audio buffer
-        self.audio_buffer = []
-        self.overlap_buffer = []
-        
-        # PyAudio初期化 / Initialize PyAudio
-        self.audio = pyaudio.PyAudio()
-        self.stream = None
-        
-        # スレッド管理 / Thread management
-        self.processing_thread = None
-        self.transcription_thread = None
+        # 文字起こしエンジン（録音・チャンク分割・API・ジャーナル・メトリクス）。設定は transcription_engine.py を参照
+        # Transcription engine (capture, chunking, API, journal, metrics); its settings live in transcription_engine.py
+        self.engine = TranscriptionEngine(api_key)
+        # 文字起こしのジャーナル（作業ディレクトリではなくユーザーのデータディレクトリに、None で無効）
+        # Transcript journal, kept in the user's data directory rather than the working directory (None disables it)
+        self.engine.JOURNAL_FILE = os.path.join(os.path.expanduser('~'), '.realtime_transcription', 'transcript_journal.jsonl')
+        self.engine.client_renders = True  # 字幕を描画した時点までを計測 / Timelines run until subtitles are drawn
         
         # 浮動字幕ウィンドウ / Floating subtitle window
         self.floating_subtitle = None
+        self.UI_FRAME_MS = 50  # GUI更新の間隔（ミリ秒） / Interval between GUI updates (ms)
+        self.SUBTITLE_HISTORY_LINES = 500  # 字幕欄に保持する行数（古い行はディスクへ） / Lines kept in the subtitle view; older ones live on disk
+        self.SUBTITLE_PAGE_LINES = 100     # スクロール時に読み戻す行数 / Lines paged back in per scroll
+        self.SUBTITLE_SPILL_FILE = None    # 履歴ファイル（None なら一時ファイル） / History file (temporary file when None)
         
         # カラーテーマ / Color theme
         self.colors = {
@@ -476,8 +527,30 @@ class RealtimeJapaneseTranscriber:
         # GUI components that need text updates
         self.gui_components = {}
         
+        startup.mark('config')
+        
         # GUI初期化 / Initialize GUI
         self.setup_gui()
+        startup.mark('gui')
+        
+        # GUI更新はフレームごとにまとめて反映 / GUI updates are applied once per frame
+        self.ui = UIDispatcher(self.root, self.UI_FRAME_MS)
+        self.ui.on_update('level', self.update_audio_level)
+        self.ui.on_batch('result', self.render_results)
+        self.ui.on_batch('partial', self.render_partials)
+        self.ui.on_update('stopped', self.on_engine_stopped)
+        self.ui.start()
+        
+        # エンジンのイベントはワーカースレッドから届くので次のフレームで反映 / Engine events arrive on worker threads and are applied on the next frame
+        self.engine.on('level', lambda level: self.ui.update('level', level))
+        self.engine.on('transcript', lambda event: self.ui.append('result', event))
+        self.engine.on('partial', lambda event: self.ui.append('partial', event))
+        self.engine.on('recovered', self.show_recovered)
+        self.engine.on('stopped', lambda _: self.ui.update('stopped', True))
+        
+        # ジャーナルを開き、異常終了したセッションがあれば復元 / Open the journal and recover a session that ended abnormally
+        self.engine.open()
+        startup.mark('journal')
         
     def load_language_preference(self):
         """Load saved language preference"""
@@ -670,6 +743,8 @@ class RealtimeJapaneseTranscriber:
             self.topic_label.config(text=self.get_text('keyword_label'))
         if hasattr(self, 'language_label'):
             self.language_label.config(text=self.get_text('language_label'))
+        if hasattr(self, 'vad_check'):
+            self.vad_check.config(text=self.get_text('vad_label'))
         if hasattr(self, 'start_button'):
             self.start_button.config(text=self.get_text('start_button'))
         if hasattr(self, 'stop_button'):
@@ -690,16 +765,16 @@ class RealtimeJapaneseTranscriber:
             
         # Update status label based on current state
         if hasattr(self, 'status_label'):
-            if self.is_recording:
+            if self.engine.is_recording:
                 self.status_label.config(text=self.get_text('recording_status'))
-            elif hasattr(self, '_stopped') and self._stopped:
+            elif self.engine.stopped:
                 self.status_label.config(text=self.get_text('stopped_status'))
             else:
                 self.status_label.config(text=self.get_text('waiting_status'))
                 
         # Update debug info
         if hasattr(self, 'debug_info'):
-            if not self.is_recording:
+            if not self.engine.is_recording:
                 self.debug_info.set(self.get_text('system_idle'))
         
     def create_header(self, parent):
@@ -789,8 +864,20 @@ class RealtimeJapaneseTranscriber:
         ]
         self.language_combo['values'] = language_options
         self.language_combo.set("ja - 日本語 (Japanese)")
+        self.language_combo.bind('<<ComboboxSelected>>', self.on_transcription_language_change)
         self.language_combo.pack(fill=tk.X)
         
+        # VAD区切りの切り替え / Toggle pause-driven (VAD) segmentation
+        self.vad_var = tk.BooleanVar(value=self.engine.SEGMENTATION_MODE == 'vad')
+        self.vad_check = tk.Checkbutton(topic_inner,
+                                        text=self.get_text('vad_label'),
+                                        variable=self.vad_var,
+                                        font=('Yu Gothic', 11),
+                                        fg=self.colors['text'],
+                                        bg=self.colors['surface'],
+                                        activebackground=self.colors['surface'])
+        self.vad_check.pack(anchor=tk.W, pady=(10, 0))
+        
     def create_control_section(self, parent):
         """録音制御ボタンセクション作成 / Create recording control button section"""
         control_frame = tk.Frame(parent, bg=self.colors['background'])
@@ -900,7 +987,12 @@ class RealtimeJapaneseTranscriber:
         
         # カスタムスクロールバー / Custom scrollbar
         scrollbar = ttk.Scrollbar(text_frame, orient=tk.VERTICAL, command=self.subtitle_text.yview)
-        self.subtitle_text.configure(yscrollcommand=scrollbar.set)
+        
+        # 行数に上限を設け、古い行はスクロール時に読み戻す / Cap the lines held and page older ones back in on scroll
+        self.transcript_view = SubtitleHistory(self.subtitle_text, scrollbar,
+                                               max_lines=self.SUBTITLE_HISTORY_LINES,
+                                               page_lines=self.SUBTITLE_PAGE_LINES,
+                                               spill_path=self.SUBTITLE_SPILL_FILE)
         
         self.subtitle_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -935,223 +1027,82 @@ class RealtimeJapaneseTranscriber:
             
     def on_closing(self):
         """ウィンドウ閉じるイベント処理 / Handle window closing event"""
-        self.stop_recording()
+        # 送信中の結果をジャーナルに残してから閉じる / Wait for results in flight so they reach the journal before exiting
+        self.engine.stop()
+        self.ui.stop()
         if self.floating_subtitle:
             self.floating_subtitle.destroy()
         self.root.destroy()
         
-    def audio_callback(self, in_data, frame_count, time_info, status):
-        """オーディオストリームコールバック / Audio stream callback"""
-        if self.is_recording:
-            self.audio_queue.put(in_data)
-        return (in_data, pyaudio.paContinue)
-    
     def start_recording(self):
         """録音開始 / Start recording"""
-        # 録音開始前にキーワードを取得 / Get keyword before starting recording
-        self.meeting_topic = self.topic_entry.get().strip()
+        # 録音開始前にキーワードと設定をエンジンへ渡す / Hand the keyword and settings to the engine before recording starts
+        engine = self.engine
+        engine.keyword = self.topic_entry.get().strip()
+        engine.SEGMENTATION_MODE = 'vad' if self.vad_var.get() else 'fixed'
+        engine.language = self.get_selected_language()
+        engine.prompt_lang = self.current_lang
         
-        self.is_recording = True
-        self._stopped = False
         self.start_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.NORMAL)
         self.status_label.config(text=self.get_text('recording_status'), fg=self.colors['success'])
+        # 番号は録音ごとに 0 から / Sequence numbers restart with each recording
+        self.floating_subtitle.clear_partials()
         
-        # オーディオストリームを開く / Open audio stream
-        self.stream = self.audio.open(
-            format=self.FORMAT,
-            channels=self.CHANNELS,
-            rate=self.RATE,
-            input=True,
-            frames_per_buffer=self.CHUNK,
-            stream_callback=self.audio_callback
-        )
-        
-        # スレッド起動 / Start processing and transcription threads
-        self.audio_queue = queue.Queue()
-        self.transcription_queue = queue.Queue()
-        self.context_history.clear()
-        
-        self.processing_thread = threading.Thread(target=self.process_audio, daemon=True)
-        self.processing_thread.start()
-        
-        self.transcription_thread = threading.Thread(target=self.transcribe_audio, daemon=True)
-        self.transcription_thread.start()
-        
-        # GUI更新ループ開始 / Start GUI update loop
-        self.update_gui()
+        if not engine.start():
+            self.stop_recording()
         
     def stop_recording(self):
-        """録音停止 / Stop recording"""
-        self.is_recording = False
-        self._stopped = True
-        self.start_button.config(state=tk.NORMAL)
+        """録音停止（送信中のリクエストを待つため別スレッドで） / Stop recording, on another thread since it waits for requests in flight"""
+        self.start_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.DISABLED)
         self.status_label.config(text=self.get_text('stopped_status'), fg=self.colors['danger'])
-        
-        # オーディオストリームを閉じる / Close audio stream
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-            self.stream = None
-        
-        # バッファをクリア / Clear buffers
-        self.audio_buffer = []
-        self.overlap_buffer = []
-        self.context_history.clear()
-        
-    def process_audio(self):
-        """オーディオデータを処理し、チャンクを転写キューに投入 / Process audio data and enqueue chunks for transcription"""
-        chunk_samples = int(self.RATE * self.CHUNK_DURATION)
-        overlap_samples = int(self.RATE * self.OVERLAP_DURATION)
-        
-        while self.is_recording:
-            try:
-                audio_data = self.audio_queue.get(timeout=0.1)
-                audio_array = np.frombuffer(audio_data, dtype=np.int16)
-                
-                # オーディオレベルを計算し、プログレスバーを更新 / Calculate audio level and update progress bar
-                audio_level = np.abs(audio_array).mean() / 32768.0
-                self.root.after(0, self.update_audio_level, audio_level)
-                
-                # バッファに追加 / Add to buffer
-                self.audio_buffer.extend(audio_array)
-                
-                # チャンクサイズに到達したか確認 / Check if buffer has reached chunk size
-                if len(self.audio_buffer) >= chunk_samples:
-                    chunk = self.audio_buffer[:chunk_samples]
-                    
-                    # overlap_bufferがあれば結合 / If overlap_buffer exists, concatenate
-                    if self.overlap_buffer:
-                        full_chunk = np.concatenate([self.overlap_buffer, chunk])
-                    else:
-                        full_chunk = chunk
-                    
-                    # 次回用に最後のoverlap部分を保存 / Save last overlap portion for next iteration
-                    self.overlap_buffer = chunk[-overlap_samples:]
-                    
-                    # 処理済みデータをバッファから削除 / Remove processed data from buffer
-                    self.audio_buffer = self.audio_buffer[chunk_samples:]
-                    
-                    # チャンクを転写キューに追加 / Enqueue the full_chunk for transcription
-                    self.transcription_queue.put(full_chunk)
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"音声処理エラー / Audio processing error: {e}")
-                
-    def transcribe_audio(self):
-        """音声を文字起こし（gpt-4o-transcribeを使用） / Transcribe audio using gpt-4o-transcribe"""
-        first_request = True  # 最初のリクエストかどうかを判定 / Flag to mark first API request
-        while self.is_recording:
-            try:
-                audio_chunk = self.transcription_queue.get(timeout=0.1)
-                
-                # WAV形式に変換 / Convert to WAV format
-                wav_data = self.numpy_to_wav(audio_chunk)
-                
-                # コンテキストプロンプトを構築 / Build context prompt
-                if first_request and self.meeting_topic:
-                    if self.current_lang == 'ja':
-                        prompt = f"以下の音声は「{self.meeting_topic}」というキーワードに関連しています。このキーワードを念頭に置いて、正確に文字起こししてください。"
-                    elif self.current_lang == 'en':
-                        prompt = f"The following audio is related to the keyword '{self.meeting_topic}'. Please transcribe accurately while keeping this keyword in mind."
-                    elif self.current_lang == 'zh':
-                        prompt = f"以下音频与关键词{self.meeting_topic}相关。请在记住此关键词的同时准确转录。"
-                    elif self.current_lang == 'ko':
-                        prompt = f"다음 오디오는 '{self.meeting_topic}' 키워드와 관련이 있습니다. 이 키워드를 염두에 두고 정확하게 전사해 주세요."
-                    first_request = False
-                else:
-                    prompt = self.build_context_prompt()
-                
-                # API呼び出し / Call API for transcription
-                start_time = time.time()
-                transcription = self.call_transcription_api(wav_data, prompt)
-                latency = int((time.time() - start_time) * 1000)
-                
-                if transcription:
-                    # コンテキスト履歴を更新 / Update context history
-                    self.context_history.append(transcription)
-                    
-                    # GUIに字幕を表示 / Display subtitle in GUI
-                    self.root.after(0, self.display_subtitle, transcription)
-                    
-                    # デバッグ情報を更新 / Update debug info
-                    debug_text = f"{self.get_text('response_time')}: {latency}ms | {self.get_text('prompt_length')}: {len(prompt)} | {self.get_text('buffer_length')}: {len(self.audio_buffer)/self.RATE:.1f}s"
-                    self.root.after(0, self.debug_info.set, debug_text)
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"文字起こしエラー / Transcription error: {e}")
-                
-    def numpy_to_wav(self, audio_array):
-        """NumPy配列をWAVに変換し、BytesIOバッファを返す / Convert NumPy array to WAV and return BytesIO buffer"""
-        buffer = io.BytesIO()
-        with wave.open(buffer, 'wb') as wav_file:
-            wav_file.setnchannels(self.CHANNELS)
-            wav_file.setsampwidth(self.audio.get_sample_size(self.FORMAT))
-            wav_file.setframerate(self.RATE)
-            wav_file.writeframes(audio_array.astype(np.int16).tobytes())
-        buffer.seek(0)
-        return buffer
-        
-    def build_context_prompt(self):
-        """コンテキストプロンプトを構築: 直近の文字起こし結果を結合 / Build context prompt by joining recent transcriptions"""
-        if not self.context_history:
-            return ""
-        context_text = " ".join(self.context_history)
-        
-        if self.current_lang == 'ja':
-            return f"これは音声の続きです。前の文脈：{context_text}"
-        elif self.current_lang == 'en':
-            return f"This is a continuation of audio. Previous context: {context_text}"
-        elif self.current_lang == 'zh':
-            return f"这是音频的延续。之前的上下文：{context_text}"
-        elif self.current_lang == 'ko':
-            return f"이것은 오디오의 연속입니다. 이전 컨텍스트: {context_text}"
-        
-    def call_transcription_api(self, wav_data, prompt):
-        """文字起こしAPIを呼び出し（gpt-4o-transcribeを使用） / Call transcription API (using gpt-4o-transcribe)"""
-        try:
-            # 選択された言語コードを取得 / Get selected language code
-            selected_language = self.get_selected_language()
-            
-            files = {
-                'file': ('audio.wav', wav_data, 'audio/wav')
-            }
-            data = {
-                'model': 'gpt-4o-transcribe',
-                'response_format': 'json'
-            }
-            
-            # 自動検出モードでない場合のみ言語を指定 / Specify language only if not auto-detect
-            if selected_language != 'auto':
-                data['language'] = selected_language
+        threading.Thread(target=self.engine.stop, name='engine-stop', daemon=True).start()
+        self.floating_subtitle.clear_partials()
+
+    def on_engine_stopped(self, _):
+        """エンジンが最後の結果を出し終えたら再び開始できる / Recording can start again once the engine has released its last result"""
+        if not self.engine.is_recording:
+            self.start_button.config(state=tk.NORMAL)
+        
+    def on_transcription_language_change(self, event=None):
+        """文字起こし言語の変更（録音中は次のリクエストから） / Transcription language changed; applies from the next request while recording"""
+        self.engine.language = self.get_selected_language()
+        
+    def show_recovered(self, recovered):
+        """異常終了したセッションを字幕欄に復元 / Restore a session that ended abnormally into the subtitle view"""
+        start, transcripts = recovered
+        lines = [f"--- {self.get_text('recovered_session')} ({start['time'][:19].replace('T', ' ')}) ---"]
+        # 開始秒のない古いジャーナルは記録時刻 / Older journals without a start offset fall back to the record time
+        lines += [f"[{format_timestamp(record['start'])[:8] if record.get('start') is not None else record['time'][11:19]}] "
+                  f"{capture_sources.label_text(record.get('source'), record['text'])}"
+                  for record in transcripts]
+        self.transcript_view.append(lines)
+        
+    def render_results(self, events):
+        """1フレーム分の字幕をまとめて表示し、タイムラインを記録（メインスレッド） / Show a frame's subtitles at once and record their timelines (main thread)"""
+        self.display_subtitles([event.text for event in events],
+                               [event.text for event in events if event.overlay],
+                               [(event.source, event.seq) for event in events],
+                               [event.start for event in events])
+        self.engine.rendered(events)
+        
+        # デバッグ情報は最新の結果のみ / Debug info for the latest result only
+        audio_chunk, result = events[-1].chunk, events[-1].result
+        timeline = audio_chunk.timeline
+        # バッファ＝チャンク確定までの時間、遅延＝音声末尾から表示までの時間 / Buffer = time until the chunk was cut, lag = end of audio until rendered
+        debug_text = (f"{self.get_text('response_time')}: {result.latency_ms}ms | "
+                      f"{self.get_text('prompt_length')}: {result.prompt_length} | "
+                      f"{self.get_text('buffer_length')}: {timeline.interval('captured', 'enqueued'):.1f}s | "
+                      f"{self.get_text('upload_label')}: {len(audio_chunk.payload) / 1024:.0f}KB/{audio_chunk.payload.encode_ms:.0f}ms | "
+                      f"{self.get_text('lag_label')}: {timeline.lag():.1f}s | "
+                      f"{self.get_text('pending_label')}: {self.engine.pending}")
+        sources = self.engine.sources
+        if len(sources) > 1:
+            # 入力ごとの遅れ / Lag per input
+            debug_text += " | " + " ".join(f"{source.name} {source.lag or 0.0:.1f}s" for source in sources)
+        self.debug_info.set(debug_text)
                 
-            if prompt:
-                data['prompt'] = prompt
-            
-            headers = {
-                'Authorization': f'Bearer {self.api_key}'
-            }
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                files=files,
-                data=data,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('text', '').strip()
-            else:
-                print(f"APIエラー / API error: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            print(f"API呼び出しに失敗しました / Failed to call API: {e}")
-            return None
-            
     def get_selected_language(self):
         """現在選択されている言語コードを取得 / Get currently selected language code"""
         try:
@@ -1166,40 +1117,45 @@ class RealtimeJapaneseTranscriber:
         """オーディオレベル表示を更新 / Update audio level display"""
         self.level_bar['value'] = min(level * 500, 100)
         
-    def display_subtitle(self, text):
-        """GUIに字幕を表示 / Display subtitle in GUI"""
-        if text:
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            # メインウィンドウにタイムスタンプ付き字幕を表示 / Show timestamped subtitle in main window
-            self.subtitle_text.insert(tk.END, f"[{timestamp}] {text}\n")
-            self.subtitle_text.see(tk.END)
+    def display_subtitle(self, text, start=0.0):
+        """GUIに字幕を表示（start はセッション開始からの秒） / Display subtitle in GUI (start in seconds since the session started)"""
+        self.display_subtitles([text], starts=[start])
+        
+    def render_partials(self, events):
+        """途中経過を浮動字幕に表示（同じチャンクは最新のみ、メインスレッド） / Show in-progress text on the floating subtitle, latest per chunk (main thread)"""
+        if self.engine.is_recording:
+            self.floating_subtitle.show_partials({(event.source, event.seq): event.text for event in events})
+        
+    def display_subtitles(self, texts, overlay_texts=None, committed=(), starts=None):
+        """複数の字幕を1回の挿入で表示（overlay_texts は浮動ウィンドウ用、既定は texts と同じ。committed は途中経過を置き換えるチャンク、starts は各字幕の開始秒） / Display several subtitles with a single insert; overlay_texts go to the floating window (texts by default), replacing the in-progress text of the committed chunks; starts are each text's offset in seconds"""
+        if starts is None:
+            starts = [0.0] * len(texts)
+        lines = [(start, text) for start, text in zip(starts, texts) if text]
+        texts = [text for _, text in lines]
+        if overlay_texts is None:
+            overlay_texts = texts
+        if texts:
+            # 時刻は表示時刻ではなくチャンクのサンプル位置（字幕ファイルと同じ） / Stamp with the chunk's sample offset, as in the subtitle file, not the render time
+            self.transcript_view.append([f"[{format_timestamp(start)[:8]}] {text}" for start, text in lines])
             
             # 浮動ウィンドウにタイムスタンプなしの字幕を表示 / Show subtitle without timestamp in floating window
-            self.floating_subtitle.update_subtitle(text)
-            
-    def update_gui(self):
-        """GUIを定期更新（プログレスバーアニメーション維持） / Periodically update GUI (keep progress bar animated)"""
-        if self.is_recording:
-            self.root.after(100, self.update_gui)
+            self.floating_subtitle.update_subtitles(overlay_texts, committed)
             
+
+    def on_window_shown(self):
+        """ウィンドウ表示までの起動レポート（--startup-report 時） / Startup report up to the window being shown (with --startup-report)"""
+        startup.mark('window shown')
+        startup.finish()
+        
     def run(self):
         """メインループ実行 / Run main loop"""
+        # 最初にイベントループが空いた時点（ウィンドウ表示後）で起動レポート / Startup report once the event loop first idles, after the window is shown
+        self.root.after_idle(self.on_window_shown)
         self.root.mainloop()
         
         # 終了時にリソースをクリーンアップ / Clean up resources on exit
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-        self.audio.terminate()
-
-
-class RealtimeTranscriberServer:
-    """サーバー側実装（オプション） / Server-side implementation (optional) - WebSocket for better real-time"""
-    def __init__(self, api_key, websocket_port=8765):
-        self.api_key = api_key
-        self.websocket_port = websocket_port
-        # WebSocketサーバーのロジックをここに拡張可能 / You can extend WebSocket server logic here
-        pass
+        self.engine.close()
+        self.transcript_view.close()
 
 
 if __name__ == "__main__":
@@ -1219,8 +1175,24 @@ if __name__ == "__main__":
         print("読み込まれた API Key が空です。API_Key.txt の内容を確認してください。 / Loaded API Key is empty. Check the contents of API_Key.txt.")
         exit(1)
 
+    # --export PATH で字幕ファイル（.srt/.vtt、strftime 書式可）を書き出す / --export PATH writes a subtitle file (.srt/.vtt, strftime codes allowed)
+    export_path = None
+    for i, arg in enumerate(sys.argv[1:], 1):
+        if arg == EXPORT_FLAG and i + 1 < len(sys.argv):
+            export_path = sys.argv[i + 1]
+        elif arg.startswith(EXPORT_FLAG + '='):
+            export_path = arg.partition('=')[2]
+    if export_path:
+        try:
+            format_for_path(export_path)
+        except ValueError as e:
+            print(f"字幕ファイルの形式が不明です / Unknown subtitle format: {e}")
+            exit(1)
+
     # 転写器を作成して実行 / Create and run transcriber
     transcriber = RealtimeJapaneseTranscriber(API_KEY)
+    if export_path:
+        transcriber.engine.SUBTITLE_EXPORT_FILE = export_path
     try:
         transcriber.run()
     except KeyboardInterrupt:
@@ -6,7 +6,10 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # lazy_import() で名前だけ渡すモジュールは解析で見えないため明示する
+    # Modules bound by name with lazy_import() are invisible to the analysis
+    hiddenimports=['pyaudio', 'numpy', 'audio_processing', 'transcription_pipeline', 'audio_encoding',
+                   'api_client', 'transcription_backends', 'capture_sources', 'metrics_server'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,481 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PooledHTTPSession:
+    """接続プール付きの永続HTTPセッション / Persistent HTTP session with connection pooling
+
+    同時リクエスト数に合わせてプールサイズを決め、Keep-Aliveで接続を使い回す。
+    warm_up() で事前に接続（TCP＋TLSハンドシェイク）を確立しておく。
+    The pool is sized to the number of concurrent requests and connections
+    are reused through keep-alive. warm_up() opens the connections (TCP + TLS
+    handshake) ahead of the first real request.
+    """
+    def __init__(self, pool_size=3, verify=True):
+        self.pool_size = max(int(pool_size), 1)
+        self.verify = verify
+        self.session = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        """セッションを作成（既にあれば再利用） / Create the session (reused if already open)"""
+        with self.lock:
+            if self.session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['Connection'] = 'keep-alive'
+                self.session = session
+            return self.session
+
+    def warm_up(self, url, timeout=5):
+        """pool_size 本の接続を並列に確立 / Open pool_size connections in parallel
+
+        オリジンに HEAD を送るだけなので応答コードは問わない。
+        Only sends HEAD to the origin; the status code does not matter.
+        """
+        session = self.open()
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}/"
+
+        def touch():
+            try:
+                session.head(origin, timeout=timeout, verify=self.verify)
+            except requests.RequestException as e:
+                print(f"接続の事前確立に失敗しました / Connection warm-up failed: {e}")
+
+        threads = [threading.Thread(target=touch, daemon=True) for _ in range(self.pool_size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def warm_up_async(self, url):
+        """バックグラウンドで warm_up を実行 / Run warm_up in the background"""
+        thread = threading.Thread(target=self.warm_up, args=(url,), daemon=True)
+        thread.start()
+        return thread
+
+    def post(self, url, **kwargs):
+        """プールされた接続でPOST / POST over a pooled connection"""
+        kwargs.setdefault('verify', self.verify)
+        return self.open().post(url, **kwargs)
+
+    def close(self):
+        """全接続を閉じる / Close all connections"""
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+
+class TranscriptionAPIError(Exception):
+    """文字起こしAPI呼び出しの失敗 / Transcription API call failed"""
+
+
+class CircuitOpenError(TranscriptionAPIError):
+    """サーキットブレーカーが開いているため送信しなかった / Not sent because the circuit breaker is open"""
+
+
+class DeadlineExceededError(TranscriptionAPIError):
+    """チャンクの期限内に応答が得られなかった / No response within the chunk deadline"""
+
+
+# 再試行する応答コード / Status codes worth retrying
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Retry-After ヘッダーを秒数に変換 / Convert a Retry-After header to seconds"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class LatencyTracker:
+    """直近の成功応答時間を保持し分位点を返す / Keep recent successful latencies and report percentiles"""
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q):
+        """q（0〜100）分位点、サンプルがなければ None / q-th percentile (0-100), None without samples"""
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return ordered[min(int(len(ordered) * q / 100.0), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """連続失敗でリクエストを遮断するサーキットブレーカー / Circuit breaker that fails fast after consecutive failures
+
+    closed → (failure_threshold 回連続失敗) → open → (cooldown 秒後) → half-open → 試行1件の成否で closed/open。
+    closed -> (failure_threshold consecutive failures) -> open -> (after cooldown
+    seconds) -> half-open -> a single probe decides between closed and open.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, cooldown=15.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """リクエストを送ってよいか / Whether a request may be sent now"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"サーキットブレーカーを開きます / Opening circuit breaker after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.probe_in_flight = False
+
+
+class ResilientTransport:
+    """再試行・期限・サーキットブレーカー・ヘッジ付きのPOST / POST with retries, deadline, circuit breaker and hedging
+
+    - 再試行: ジッター付き指数バックオフ、429 では Retry-After を優先
+    - 期限: チャンクごとの deadline 秒を超えたら DeadlineExceededError
+    - サーキットブレーカー: 不調な間は即座に CircuitOpenError
+    - ヘッジ: 応答が直近の p95 を超えたら同じリクエストをもう1本送り、先に成功した方を使う
+    - Retries: jittered exponential backoff; Retry-After wins on 429
+    - Deadline: DeadlineExceededError once the per-chunk deadline has passed
+    - Circuit breaker: CircuitOpenError immediately while the endpoint is unhealthy
+    - Hedging: once an attempt outlives the recent p95 latency, a duplicate
+      request is sent and the first successful response wins
+    """
+    def __init__(self, session, max_retries=3, base_delay=0.25, max_delay=4.0,
+                 deadline=15.0, attempt_timeout=10.0, breaker=None,
+                 hedge=False, hedge_percentile=95, hedge_min_samples=20):
+        self.session = session
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        # ヘッジ時はセッションのプールを同時リクエスト数の2倍にしておく / With hedging, the session pool should be twice the concurrent requests
+        self.executor = ThreadPoolExecutor(max_workers=session.pool_size, thread_name_prefix='hedge') if hedge else None
+        # attempt_failures は失敗した試行、failures は再試行し尽くして諦めたリクエスト（チャンク）
+        # attempt_failures counts failed attempts; failures counts requests (chunks) given up after all retries
+        self.stats = {'attempts': 0, 'retries': 0, 'hedges': 0, 'attempt_failures': 0, 'failures': 0, 'rejected': 0}
+        self.stats_lock = threading.Lock()
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def backoff(self, attempt, response=None):
+        """次の再試行までの待ち時間（秒） / Delay before the next retry in seconds"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if response is not None and response.status_code in (429, 503):
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    def post(self, url, read=None, **kwargs):
+        """期限内に成功するまで再試行してPOST / POST, retrying until success or the deadline
+
+        再試行しないエラー応答（400や401など）はそのまま返す。
+        read(response, deadline) を渡すと、200 応答の本文の読み取り（ストリーミングなど）も同じ試行に含め、
+        そこでの失敗（切断、エラーイベント、期限切れ）も再試行・バックオフ・サーキットブレーカーの対象にする。
+        Non-retryable error responses (400, 401, ...) are returned as-is.
+        With read(response, deadline), reading the body of a 200 response
+        (a stream, say) is part of the same attempt, so failures there
+        (dropped connection, error event, deadline) are retried, backed off
+        and counted by the circuit breaker like any other.
+        """
+        deadline = time.monotonic() + self.deadline
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self.count('rejected')
+                raise CircuitOpenError("circuit breaker is open")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt:
+                self.count('retries')
+
+            response = None
+            try:
+                response = self.send(url, min(self.attempt_timeout, remaining), deadline, kwargs)
+                if read is not None and response.status_code == 200:
+                    read(response, deadline)
+            except (requests.RequestException, TranscriptionAPIError) as e:
+                last_error = e
+                response = None
+            except BaseException:
+                # 想定外の例外（read の中など）でも半開のプローブを終わらせる / End a half-open probe even on unexpected errors (from read, say)
+                if response is not None:
+                    response.close()
+                self.breaker.record_failure()
+                self.count('attempt_failures')
+                self.count('failures')
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    # 4xx はエンドポイントの不調ではない / 4xx does not mean the endpoint is unhealthy
+                    self.breaker.record_success()
+                    return response
+                last_error = TranscriptionAPIError(f"HTTP {response.status_code}")
+                response.close()   # ストリーミング時も接続をプールに戻す / Return the connection to the pool, also when streaming
+            self.breaker.record_failure()
+            self.count('attempt_failures')
+
+            if attempt == self.max_retries:
+                break
+            delay = self.backoff(attempt, response)
+            if time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+
+        self.count('failures')
+        if time.monotonic() >= deadline:
+            raise DeadlineExceededError(f"no response within {self.deadline:.1f}s: {last_error}")
+        raise TranscriptionAPIError(f"gave up after {self.max_retries + 1} attempts: {last_error}")
+
+    def send(self, url, timeout, deadline, kwargs):
+        """1回分の送信（必要ならヘッジ、ストリーミングはヘッジしない） / One attempt, hedged when enabled (streaming requests never are)"""
+        hedge_after = self.hedge_delay()
+        if hedge_after is None or hedge_after >= timeout or kwargs.get('stream'):
+            return self.timed_post(url, timeout, kwargs)
+
+        futures = {self.executor.submit(self.timed_post, url, timeout, kwargs)}
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done and time.monotonic() < deadline:
+            # p95 を超えたので複製リクエストを送る / Past p95: send a duplicate request
+            self.count('hedges')
+            futures.add(self.executor.submit(self.timed_post, url, max(deadline - time.monotonic(), 0.1), kwargs))
+
+        error = None
+        response = None
+        pending = futures
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                if response is not None:
+                    response.close()
+                response = result
+                if response.status_code not in RETRYABLE_STATUS:
+                    # 負けた方の応答は届き次第閉じて接続をプールに戻す / Close the losing responses as they arrive, returning their connections to the pool
+                    for other in futures:
+                        if other is not future:
+                            other.add_done_callback(close_response)
+                    return response
+        if response is not None:
+            return response
+        raise error
+
+    def hedge_delay(self):
+        """ヘッジを送るまでの待ち時間（無効なら None） / Delay before hedging, None when disabled"""
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def timed_post(self, url, timeout, kwargs):
+        """応答時間を記録しながらPOST（ストリーミングはヘッダーまでなので記録しない） / POST while recording latency (not for streaming, which returns at the headers)"""
+        self.count('attempts')
+        start = time.monotonic()
+        response = self.session.post(url, timeout=timeout, **kwargs)
+        if response.status_code == 200 and not kwargs.get('stream'):
+            self.latency.add(time.monotonic() - start)
+        return response
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+
+
+def close_response(future):
+    """使われなかったヘッジの応答を閉じる（Future の完了コールバック） / Close an unused hedged response (a Future done-callback)"""
+    try:
+        response = future.result()
+    except Exception:
+        return
+    response.close()
+
+
+def iter_sse_data(lines):
+    """server-sent events の行から各イベントの data を取り出す / Yield the data of each server-sent event from its lines
+
+    複数行の data は改行で連結する。コメント行（":" で始まる）と他のフィールドは無視する。
+    Multi-line data is joined with newlines; comment lines (starting with
+    ":") and other fields are ignored.
+    """
+    data = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line:
+            # 空行でイベントが終わる / A blank line ends the event
+            if data:
+                yield '\n'.join(data)
+                data = []
+            continue
+        if line.startswith(':'):
+            continue
+        field, _, value = line.partition(':')
+        if field == 'data':
+            data.append(value[1:] if value.startswith(' ') else value)
+    if data:
+        yield '\n'.join(data)
+
+
+def read_transcription_stream(response, on_partial=None, deadline=None):
+    """ストリーミング応答を読み、途中経過を on_partial に渡して最終テキストを返す / Read a streamed response, handing the text so far to on_partial, and return the final text
+
+    transcript.text.delta の差分を連結し、transcript.text.done があればその text を最終結果とする。
+    deadline（time.monotonic）を過ぎても届き続ける場合は DeadlineExceededError。
+    Deltas from transcript.text.delta are concatenated; the text of
+    transcript.text.done, when present, is the final result. A stream still
+    trickling in past deadline (time.monotonic) raises DeadlineExceededError.
+    ストリームが transcript.text.done も [DONE] もなく終わった場合は途中のテキストを返さず
+    TranscriptionAPIError を送出し、再試行させる。
+    A stream that ends with neither transcript.text.done nor [DONE] raises
+    TranscriptionAPIError instead of returning the partial text, so it is retried.
+    """
+    text = ''
+    final = None
+    finished = False
+    try:
+        for data in iter_sse_data(response.iter_lines()):
+            if deadline is not None and time.monotonic() > deadline:
+                raise DeadlineExceededError("stream still running at the chunk deadline")
+            if data == '[DONE]':
+                finished = True
+                break
+            try:
+                event = json.loads(data)
+            except ValueError:
+                raise TranscriptionAPIError(f"malformed event in stream: {data[:200]}")
+            if event.get('type') == 'error' or 'error' in event:
+                error = event.get('error') or event
+                message = error.get('message', error) if isinstance(error, dict) else error
+                raise TranscriptionAPIError(f"stream error: {message}")
+            if event.get('type') == 'transcript.text.delta':
+                text += event.get('delta', '')
+                if on_partial is not None:
+                    on_partial(text.strip())
+            elif event.get('type') == 'transcript.text.done':
+                final = event.get('text', text)
+    except requests.RequestException as e:
+        raise TranscriptionAPIError(f"stream interrupted: {e}")
+    finally:
+        response.close()
+    if final is None and not finished:
+        raise TranscriptionAPIError("stream ended before transcript.text.done")
+    return (text if final is None else final).strip()
+
+
+def request_transcription(transport, url, api_key, payload, language='auto', prompt='',
+                          model='gpt-4o-transcribe', on_partial=None):
+    """文字起こしAPIへ1チャンク分のリクエストを送りテキストを返す / Send one chunk to the transcription API and return its text
+
+    payload は EncodedAudio。200以外の応答では TranscriptionAPIError を送出する。
+    on_partial を渡すとストリーミング（server-sent events）で要求し、届いた時点までのテキストで呼ぶ。
+    payload is an EncodedAudio. Raises TranscriptionAPIError on any non-200 response.
+    With on_partial the response is requested as a stream of server-sent
+    events and on_partial is called with the text received so far.
+    """
+    # 再試行・ヘッジで再送できるようバイト列で渡す / Pass bytes so retries and hedges can resend
+    files = {
+        'file': (payload.filename, payload.data, payload.mime)
+    }
+    data = {
+        'model': model,
+        'response_format': 'json'
+    }
+
+    # 自動検出モードでない場合のみ言語を指定 / Specify language only if not auto-detect
+    if language and language != 'auto':
+        data['language'] = language
+
+    if prompt:
+        data['prompt'] = prompt
+
+    headers = {
+        'Authorization': f'Bearer {api_key}'
+    }
+    if on_partial is None:
+        response = transport.post(url, headers=headers, files=files, data=data)
+        if response.status_code != 200:
+            raise TranscriptionAPIError(f"{response.status_code} - {response.text}")
+        return response.json().get('text', '').strip()
+
+    # ストリームの読み取りも再試行の対象になるよう、転送層の試行の中で読む
+    # Read the stream inside the transport's attempt, so failures while reading are retried too
+    data['stream'] = 'true'
+    received = {}
+
+    def read(response, deadline):
+        # ストリーミングに対応しないサーバーは通常の JSON を返す / Servers without streaming answer with plain JSON
+        if response.headers.get('Content-Type', '').startswith('text/event-stream'):
+            received['text'] = read_transcription_stream(response, on_partial, deadline)
+        else:
+            received['text'] = response.json().get('text', '').strip()
+
+    response = transport.post(url, read=read, headers=headers, files=files, data=data, stream=True)
+    if response.status_code != 200:
+        raise TranscriptionAPIError(f"{response.status_code} - {response.text}")
+    return received['text']
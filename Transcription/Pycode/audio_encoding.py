@@ -0,0 +1,161 @@
+import io
+import struct
+import threading
+import time
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:  # libsndfile がない環境では WAV のみ / WAV only without libsndfile
+    soundfile = None
+
+
+class EncodedAudio:
+    """アップロード用にエンコードされた音声 / Audio encoded for upload"""
+    __slots__ = ('data', 'filename', 'mime', 'encode_ms', 'raw_bytes', 'seconds')
+
+    def __init__(self, data, filename, mime, encode_ms=0.0, raw_bytes=0, seconds=0.0):
+        self.data = data
+        self.filename = filename
+        self.mime = mime
+        self.encode_ms = encode_ms
+        self.raw_bytes = raw_bytes
+        self.seconds = seconds      # 音声の長さ / Duration of the audio
+
+    def __len__(self):
+        return len(self.data)
+
+
+class WavEncoder:
+    """非圧縮PCM WAV（常に利用可能な代替） / Uncompressed PCM WAV (always-available fallback)"""
+    name = 'wav'
+    filename = 'audio.wav'
+    mime = 'audio/wav'
+
+    def __init__(self, rate=16000, channels=1):
+        self.rate = rate
+        self.channels = channels
+
+    def encode_bytes(self, samples):
+        """ヘッダーを直接組み立て、int16 のサンプルはそのまま書き出す / Build the header directly and write int16 samples as-is"""
+        pcm = np.ascontiguousarray(samples, dtype=np.int16)
+        size = pcm.nbytes
+        header = struct.pack('<4sI4s4sIHHIIHH4sI',
+                             b'RIFF', 36 + size, b'WAVE', b'fmt ', 16, 1, self.channels,
+                             self.rate, self.rate * self.channels * 2, self.channels * 2, 16,
+                             b'data', size)
+        return header + pcm.tobytes()
+
+
+class SoundFileEncoder(WavEncoder):
+    """libsndfile（soundfile）によるエンコード / Encoding through libsndfile (soundfile)"""
+    format = None
+    subtype = None
+    options = {}    # soundfile.write へ渡す追加の引数 / Extra arguments for soundfile.write
+
+    def encode_bytes(self, samples):
+        while True:
+            buffer = io.BytesIO()
+            try:
+                soundfile.write(buffer, np.asarray(samples), self.rate, format=self.format, subtype=self.subtype,
+                                **self.options)
+                return buffer.getvalue()
+            except TypeError:
+                # soundfile 0.12 未満は compression_level/bitrate_mode を受け付けない / soundfile < 0.12 takes neither option
+                if not self.options:
+                    raise
+                print(f"{self.name} の設定を使えないため既定値でエンコードします / {self.name} options unsupported, using defaults")
+                self.options = {}
+
+
+class FlacEncoder(SoundFileEncoder):
+    """可逆圧縮FLAC / Lossless FLAC"""
+    name = 'flac'
+    filename = 'audio.flac'
+    mime = 'audio/flac'
+    format = 'FLAC'
+    subtype = 'PCM_16'
+
+
+class OpusEncoder(SoundFileEncoder):
+    """低ビットレートの Ogg Opus / Low-bitrate Ogg Opus"""
+    name = 'opus'
+    filename = 'audio.ogg'
+    mime = 'audio/ogg'
+    format = 'OGG'
+    subtype = 'OPUS'
+    BITRATE = 24000         # 音声向けの目標（bps、チャンネルあたり） / Speech target in bits/s per channel
+    # libsndfile 1.2 は compression_level と同時に指定すると失敗する / libsndfile 1.2 rejects it together with compression_level
+    BITRATE_MODE = None     # 'CONSTANT'、'AVERAGE'、'VARIABLE'
+
+    def __init__(self, rate=16000, channels=1):
+        super().__init__(rate, channels)
+        # libsndfile は 0.0→256kbps、1.0→6kbps（チャンネルあたり）に線形で対応させる / libsndfile maps 0.0 to 256 kbps and 1.0 to 6 kbps per channel, linearly
+        level = (256000 - self.BITRATE) / 250000
+        self.options = {'compression_level': min(max(level, 0.0), 1.0)}
+        if self.BITRATE_MODE:
+            self.options['bitrate_mode'] = self.BITRATE_MODE
+
+
+ENCODERS = {
+    'wav': WavEncoder,
+    'flac': FlacEncoder,
+    'opus': OpusEncoder,
+}
+
+
+def create_encoder(name, rate=16000, channels=1):
+    """名前からエンコーダーを作成、使えなければ WAV / Create an encoder by name, falling back to WAV"""
+    encoder_class = ENCODERS.get(name, WavEncoder)
+    if issubclass(encoder_class, SoundFileEncoder):
+        if soundfile is None or encoder_class.subtype not in soundfile.available_subtypes(encoder_class.format):
+            print(f"{name} エンコーダーが使えないため WAV を使用します / {name} encoder unavailable, using WAV")
+            encoder_class = WavEncoder
+    return encoder_class(rate, channels)
+
+
+class EncoderStats:
+    """チャンクごとのエンコード時間と送信サイズの集計 / Per-chunk encode time and payload size totals"""
+    def __init__(self):
+        self.chunks = 0
+        self.encode_seconds = 0.0
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+        self.audio_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, encoded):
+        with self.lock:
+            self.chunks += 1
+            self.encode_seconds += encoded.encode_ms / 1000.0
+            self.raw_bytes += encoded.raw_bytes
+            self.encoded_bytes += len(encoded)
+            self.audio_seconds += encoded.seconds
+
+    def summary(self):
+        """集計のスナップショット / Snapshot of the totals"""
+        with self.lock:
+            ratio = self.encoded_bytes / self.raw_bytes if self.raw_bytes else 1.0
+            return {
+                'chunks': self.chunks,
+                'encode_ms_avg': self.encode_seconds * 1000.0 / self.chunks if self.chunks else 0.0,
+                'raw_bytes': self.raw_bytes,
+                'encoded_bytes': self.encoded_bytes,
+                'bytes_saved': self.raw_bytes - self.encoded_bytes,
+                'ratio': ratio,
+                # 実際に送ったビットレート / Bitrate actually uploaded
+                'bitrate_kbps': self.encoded_bytes * 8 / self.audio_seconds / 1000.0 if self.audio_seconds else 0.0,
+            }
+
+
+def encode_chunk(encoder, samples, stats=None):
+    """サンプルをエンコードし計測値付きで返す / Encode samples and return them with measurements"""
+    start = time.perf_counter()
+    data = encoder.encode_bytes(samples)
+    encoded = EncodedAudio(data, encoder.filename, encoder.mime,
+                           (time.perf_counter() - start) * 1000.0, len(samples) * 2,
+                           len(samples) / encoder.channels / encoder.rate)
+    if stats is not None:
+        stats.record(encoded)
+    return encoded
@@ -0,0 +1,395 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class PCMRingBuffer:
+    """固定容量のPCMリングバッファ / Fixed-capacity PCM ring buffer
+
+    サンプルを二重に書き込む（ミラー領域）ことで、容量以下の任意の窓を
+    コピーなしの連続ビューとして取り出せる。
+    Every sample is written twice (into a mirrored half) so that any window
+    no longer than the capacity can be handed out as a contiguous zero-copy view.
+    位置はセッション開始からの絶対サンプル番号で扱う。
+    Positions are absolute sample indices counted from the start of the session.
+    """
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = int(capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=dtype)
+        self.write_pos = 0    # 書き込み済みサンプル総数 / Total samples written
+        self.read_pos = 0     # 未読データの先頭位置 / Start of unread data
+        self.dropped = 0      # 上書きで失われた未読サンプル数 / Unread samples lost to overwrite
+
+    def __len__(self):
+        """未読サンプル数 / Number of unread samples"""
+        return self.write_pos - self.read_pos
+
+    @property
+    def oldest(self):
+        """バッファ内に残っている最古の位置 / Oldest position still held in the buffer"""
+        return max(self.write_pos - self.capacity, 0)
+
+    def write(self, samples):
+        """サンプルを追加（満杯なら最古を上書き） / Append samples (overwrite oldest when full)"""
+        samples = np.asarray(samples, dtype=self._data.dtype)
+        n = len(samples)
+        if n == 0:
+            return
+        if n > self.capacity:
+            # 容量を超える分は先頭を捨てる / Drop the head of oversized writes
+            self.write_pos += n - self.capacity
+            samples = samples[-self.capacity:]
+            n = self.capacity
+
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        mirror = start + self.capacity
+        self._data[start:start + first] = samples[:first]
+        self._data[mirror:mirror + first] = samples[:first]
+        rest = n - first
+        if rest:
+            self._data[:rest] = samples[first:]
+            self._data[self.capacity:self.capacity + rest] = samples[first:]
+        self.write_pos += n
+
+        # 未読データが上書きされた場合は読み取り位置を進める / Advance reader past overwritten data
+        if self.read_pos < self.oldest:
+            self.dropped += self.oldest - self.read_pos
+            self.read_pos = self.oldest
+
+    def view(self, start, length):
+        """絶対位置startからlengthサンプルの読み取り専用ビュー / Read-only view of length samples from absolute start"""
+        if length > self.capacity or start < self.oldest or start + length > self.write_pos:
+            raise ValueError(f"window [{start}, {start + length}) is not held in the buffer")
+        offset = start % self.capacity
+        window = self._data[offset:offset + length]
+        window.flags.writeable = False
+        return window
+
+    def consume(self, count):
+        """未読データをcountサンプル分読み進める / Mark count unread samples as consumed"""
+        self.read_pos = min(self.read_pos + count, self.write_pos)
+
+    def is_intact(self, start):
+        """startからのビューがまだ上書きされていないか / Whether a view starting at start is still intact"""
+        return start >= self.write_pos - self.capacity
+
+
+class AudioChunk:
+    """転写キューに流すオーディオチャンク / Audio chunk handed to the transcription queue"""
+    __slots__ = ('samples', 'start_sample', 'buffer', 'seq', 'payload', 'timeline', 'source')
+
+    def __init__(self, samples, start_sample=0, buffer=None, seq=0):
+        self.samples = samples
+        self.start_sample = start_sample
+        self.buffer = buffer
+        self.seq = seq          # 捕捉順のシーケンス番号 / Sequence number in capture order
+        self.payload = None     # エンコード済み音声（EncodedAudio） / Encoded audio (EncodedAudio)
+        self.timeline = None    # 段階ごとの時刻（ChunkTimeline） / Per-stage stamps (ChunkTimeline)
+        self.source = None      # 入力ソース（AudioSource、単一入力では None） / Input source (AudioSource; None with a single input)
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def end_sample(self):
+        """チャンク終端の絶対位置 / Absolute position of the end of the chunk"""
+        return self.start_sample + len(self.samples)
+
+    def lag_samples(self):
+        """現在の捕捉位置からの遅れ（サンプル数） / How far the capture position has moved past this chunk (samples)"""
+        if self.buffer is None:
+            return 0
+        return self.buffer.write_pos - self.end_sample
+
+    def is_intact(self):
+        """リングバッファ上のビューが有効か / Whether the ring buffer view is still valid"""
+        return self.buffer is None or self.buffer.is_intact(self.start_sample)
+
+
+class FixedChunker:
+    """固定長＋重なりでチャンクを切り出す / Cut fixed-length chunks with overlap
+
+    リングバッファの未読データが chunk_samples に達するたびに、
+    直前の overlap_samples を先頭に含むビューを返す。
+    Whenever chunk_samples of unread data are available, yields a view that
+    also includes the preceding overlap_samples.
+    """
+    def __init__(self, buffer, chunk_samples, overlap_samples):
+        self.buffer = buffer
+        self.chunk_samples = int(chunk_samples)
+        self.overlap_samples = int(overlap_samples)
+
+    def set_target_length(self, samples):
+        """次のチャンクからの長さを変更 / Change the length of the chunks cut from now on"""
+        self.chunk_samples = max(int(samples), 1)
+
+    def pop_chunks(self):
+        """切り出せるチャンクをすべて返す / Return every chunk that can be cut now"""
+        chunks = []
+        buffer = self.buffer
+        while len(buffer) >= self.chunk_samples:
+            start = max(buffer.read_pos - self.overlap_samples, buffer.oldest)
+            end = buffer.read_pos + self.chunk_samples
+            chunks.append(AudioChunk(buffer.view(start, end - start), start, buffer))
+            buffer.consume(self.chunk_samples)
+        return chunks
+
+    def flush(self):
+        """残りの未読データを最後のチャンクとして返す / Return remaining unread data as a final chunk"""
+        buffer = self.buffer
+        if len(buffer) == 0:
+            return []
+        start = max(buffer.read_pos - self.overlap_samples, buffer.oldest)
+        chunk = AudioChunk(buffer.view(start, buffer.write_pos - start), start, buffer)
+        buffer.consume(len(buffer))
+        return [chunk]
+
+
+class VoiceActivitySegmenter:
+    """エネルギーベースのVADで発話区間を切り出す / Cut speech segments with an energy-based VAD
+
+    フレームごとのRMSをまとめてベクトル計算し、適応的なノイズフロアと比較する。
+    一定時間の無音で区間を閉じ、無音のみの区間は転写キューに流さない。
+    ノイズフロアはすぐに下がるが、上がるのは毎秒 noise_rise_db までなので、大きな音が続いてもノイズとはみなさない。
+    Frame RMS is computed in one vectorized pass and compared with an adaptive
+    noise floor. A segment is closed after a pause; silence-only audio is never
+    enqueued. The floor falls at once but rises at most noise_rise_db per
+    second, so steady loud input is not taken for noise. Segments are kept
+    between min_segment and max_segment seconds; at max_segment the cut is
+    placed at the quietest frame.
+    """
+    def __init__(self, buffer, rate, frame_duration=0.03, threshold_db=-50.0, noise_ratio=3.0,
+                 silence_duration=0.5, min_segment=1.0, max_segment=10.0,
+                 pre_roll=0.2, post_roll=0.2, min_speech=0.15, noise_window=10.0,
+                 noise_rise_db=1.0):
+        self.buffer = buffer
+        self.rate = rate
+        self.frame = max(int(rate * frame_duration), 1)
+        self.abs_threshold = 32768.0 * 10 ** (threshold_db / 20.0)
+        self.noise_ratio = noise_ratio
+        self.silence_samples = int(rate * silence_duration)
+        self.min_samples = int(rate * min_segment)
+        self.max_samples = int(rate * max_segment)
+        self.pre_roll = int(rate * pre_roll)
+        self.post_roll = min(int(rate * post_roll), self.silence_samples)
+        self.min_speech = int(rate * min_speech)
+
+        # ノイズフロア推定用のRMS履歴 / RMS history for noise floor estimation
+        self.noise_history = np.full(max(int(noise_window / frame_duration), 1), self.abs_threshold, dtype=np.float32)
+        self.noise_index = 0
+        self.noise_floor = self.abs_threshold
+        self.noise_rise = 10 ** (noise_rise_db / 20.0)   # 1秒あたりの上昇の上限（倍率） / Largest rise per second, as a ratio
+
+        self.scan_pos = buffer.read_pos
+        self.segment_start = None
+        self.last_speech_end = 0
+        self.speech_samples = 0
+        self.segment_frames = []    # (frame_end, rms, is_speech)
+        self.skipped_samples = 0    # 送信せずに捨てた無音サンプル数 / Silent samples never uploaded
+
+    def set_target_length(self, samples):
+        """区間の最大長を変更（最小長より短くはしない） / Change the maximum segment length (never below the minimum)"""
+        self.max_samples = max(int(samples), self.min_samples)
+
+    @property
+    def threshold(self):
+        """現在の発話判定しきい値 / Current speech threshold"""
+        return max(self.abs_threshold, self.noise_floor * self.noise_ratio)
+
+    def update_noise_floor(self, rms):
+        """RMS履歴の下位10%をノイズフロアとする（最小統計法） / Use the 10th percentile of recent frame RMS as the noise floor (minimum statistics)
+
+        上昇は毎秒 noise_rise_db までに抑える。履歴が大きな音だけになっても発話の途中で
+        しきい値が追いつかず、最大長での切断後も区間が続く。
+        Rises are limited to noise_rise_db per second, so a window filled with
+        loud input does not lift the threshold past the speech and the
+        segment carries on after a max-length cut.
+        """
+        size = len(self.noise_history)
+        rms = rms[-size:]
+        end = self.noise_index + len(rms)
+        if end <= size:
+            self.noise_history[self.noise_index:end] = rms
+        else:
+            split = size - self.noise_index
+            self.noise_history[self.noise_index:] = rms[:split]
+            self.noise_history[:end - size] = rms[split:]
+        self.noise_index = end % size
+        # np.percentile より軽い部分ソートで下位10%の値を得る / Partial sort is much cheaper than np.percentile
+        k = size // 10
+        floor = float(np.partition(self.noise_history, k)[k])
+        limit = self.noise_floor * self.noise_rise ** (len(rms) * self.frame / self.rate)
+        self.noise_floor = min(floor, limit)
+
+    def pop_chunks(self):
+        """新しいフレームを解析し、確定した発話区間を返す / Analyze new frames and return finished segments"""
+        buffer = self.buffer
+        if self.scan_pos < buffer.oldest:
+            self.scan_pos = buffer.oldest
+        count = (buffer.write_pos - self.scan_pos) // self.frame
+        if count <= 0:
+            return []
+
+        # フレームRMSをまとめて計算 / Compute frame RMS in one vectorized pass
+        frames = buffer.view(self.scan_pos, count * self.frame).reshape(count, self.frame).astype(np.float32)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        is_speech = rms > self.threshold
+        self.update_noise_floor(rms)
+
+        chunks = []
+        for i in range(count):
+            frame_end = self.scan_pos + (i + 1) * self.frame
+            chunk = self.step(frame_end, bool(is_speech[i]), float(rms[i]))
+            if chunk is not None:
+                chunks.append(chunk)
+        self.scan_pos += count * self.frame
+
+        if self.segment_start is None:
+            # 無音部分は送信せずに読み捨て（プリロール分は保持） / Drop silence without uploading, keep pre-roll
+            keep_from = max(self.scan_pos - self.pre_roll, buffer.read_pos)
+            self.skipped_samples += keep_from - buffer.read_pos
+            buffer.consume(keep_from - buffer.read_pos)
+        return chunks
+
+    def step(self, frame_end, speech, rms):
+        """1フレーム分の状態遷移 / Advance the state machine by one frame"""
+        if self.segment_start is None:
+            if not speech:
+                return None
+            self.segment_start = max(frame_end - self.frame - self.pre_roll, self.buffer.read_pos)
+            self.speech_samples = 0
+            self.segment_frames = []
+
+        if speech:
+            self.last_speech_end = frame_end
+            self.speech_samples += self.frame
+        self.segment_frames.append((frame_end, rms, speech))
+
+        length = frame_end - self.segment_start
+        if frame_end - self.last_speech_end >= self.silence_samples:
+            if self.speech_samples < self.min_speech:
+                # 短いノイズは破棄 / Discard short noise bursts
+                self.segment_start = None
+                return None
+            if length >= self.min_samples:
+                end = max(self.last_speech_end + self.post_roll, self.segment_start + self.min_samples)
+                return self.emit(min(end, frame_end))
+        if length >= self.max_samples:
+            return self.emit(self.quietest_cut(frame_end), reopen=True)
+        return None
+
+    def quietest_cut(self, frame_end):
+        """最大長に達した区間の切断位置（後半で最も静かなフレーム） / Cut position for an overlong segment (quietest frame in its second half)"""
+        earliest = self.segment_start + max(self.min_samples, self.max_samples // 2)
+        candidates = [(rms, end) for end, rms, _ in self.segment_frames if end >= earliest]
+        if not candidates:
+            return frame_end
+        return min(candidates)[1]
+
+    def emit(self, end, reopen=False):
+        """区間[segment_start, end)をチャンクとして確定 / Finish segment [segment_start, end) as a chunk"""
+        start = self.segment_start
+        chunk = AudioChunk(self.buffer.view(start, end - start), start, self.buffer)
+        self.buffer.consume(end - self.buffer.read_pos)
+        if reopen:
+            # 切断後の部分で区間を継続 / Continue the segment after the cut
+            self.segment_frames = [frame for frame in self.segment_frames if frame[0] > end]
+            self.segment_start = end
+            self.speech_samples = sum(self.frame for frame in self.segment_frames if frame[2])
+        else:
+            self.segment_start = None
+            self.segment_frames = []
+        return chunk
+
+    def flush(self):
+        """録音終了時に開いている区間を返す / Return the open segment at end of input"""
+        chunks = self.pop_chunks()
+        if self.segment_start is not None and self.speech_samples >= self.min_speech:
+            chunks.append(self.emit(self.scan_pos))
+        self.segment_start = None
+        return chunks
+
+
+class StreamingResampler:
+    """ストリーミング用のポリフェーズ・リサンプラー / Streaming polyphase resampler
+
+    in_rate から out_rate へ有理比 up/down で変換する。カイザー窓の sinc フィルタを up 個の位相に分け、
+    ブロックごとに全出力サンプルの入力窓をまとめて取り出し、1回の積和で計算する。
+    直前のブロックの末尾（taps - 1 サンプル）と位相をまたいで保持するため、コールバック境界で不連続は生じない。
+    Converts in_rate to out_rate by the rational ratio up/down. A
+    Kaiser-windowed sinc filter is split into `up` phases; for each block the
+    input windows of all output samples are gathered at once and reduced with
+    a single multiply-sum. The tail of the previous block (taps - 1 samples)
+    and the phase carry over, so callback boundaries leave no seams.
+
+    process() は int16 を受け取り int16 を返す。出力数はブロックごとに変わる。
+    process() takes and returns int16; the output count varies per block.
+    """
+    def __init__(self, in_rate, out_rate=16000, zero_crossings=16, beta=8.0):
+        divisor = np.gcd(int(in_rate), int(out_rate))
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        self.up = int(out_rate) // divisor
+        self.down = int(in_rate) // divisor
+        # 低い方のレートで片側 zero_crossings 周期分の長さ / zero_crossings periods of the lower rate on each side
+        self.taps = int(np.ceil(2 * zero_crossings * max(self.up, self.down) / self.up))
+        self.phases = self.design_phases(self.taps, beta)
+        self.work = np.zeros(0, dtype=np.float32)   # 直前の末尾＋現ブロック / Previous tail plus the current block
+        self.windows = None                          # work のスライド窓ビュー / Sliding-window view of work
+        self.reserve(4096)
+        self.offset = 0    # 次の出力の位置（アップサンプル後の単位、現ブロック先頭から） / Next output position in upsampled units, from the current block start
+
+    def design_phases(self, taps_per_phase, beta):
+        """ローパスフィルタを設計し (up, taps) の位相行列にする / Design the low-pass filter as an (up, taps) phase matrix"""
+        length = taps_per_phase * self.up
+        # 低い方のナイキスト周波数の少し手前で切る / Cut a little below the lower Nyquist frequency
+        cutoff = 0.45 / max(self.up, self.down)
+        n = np.arange(length) - (length - 1) / 2.0
+        h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta)
+        h *= self.up / h.sum()
+        # phases[p, j] = h[p + (taps - 1 - j) * up]: 古い順に並んだ入力窓と掛ける / multiplied by the input window, oldest first
+        return np.ascontiguousarray(h.reshape(taps_per_phase, self.up).T[:, ::-1], dtype=np.float32)
+
+    def reserve(self, block_length):
+        """block_length サンプルのブロックが入るよう作業領域を確保（履歴は保つ） / Make room for a block of block_length samples, keeping the history"""
+        keep = self.taps - 1
+        if len(self.work) >= keep + block_length:
+            return
+        work = np.zeros(keep + block_length, dtype=np.float32)
+        if len(self.work):
+            work[:keep] = self.work[:keep]
+        self.work = work
+        # 呼び出しごとにビューを作らないよう一度だけ作る / Built once rather than per call
+        self.windows = sliding_window_view(work, self.taps)
+
+    def process(self, samples):
+        """1ブロックを変換 / Resample one block"""
+        if self.up == self.down:
+            return np.asarray(samples, dtype=np.int16)
+        length = len(samples)
+        keep = self.taps - 1
+        self.reserve(length)
+        work = self.work
+        work[keep:keep + length] = samples
+        total = length * self.up
+        if self.offset >= total:
+            output = np.zeros(0, dtype=np.float32)
+            self.offset -= total
+        else:
+            count = (total - self.offset + self.down - 1) // self.down
+            position = self.offset + np.arange(count) * self.down
+            base, phase = np.divmod(position, self.up)
+            # 各出力の入力窓（古い順）をスライド窓ビューの行として取り出す / Input window of each output, oldest first, as rows of the sliding-window view
+            output = np.einsum('ij,ij->i', self.windows[base], self.phases[phase])
+            self.offset = int(position[-1]) + self.down - total
+        # 末尾を次のブロックの履歴として先頭へ / Move the tail to the front as the next block's history
+        work[:keep] = work[length:length + keep]
+        return np.clip(np.rint(output), -32768, 32767).astype(np.int16)
+
+
+def downmix(frames):
+    """(フレーム, チャンネル) の int16 をモノラルに / Mix (frames, channels) int16 down to mono"""
+    if frames.ndim == 1 or frames.shape[1] == 1:
+        return frames.reshape(-1)
+    # float64 の中間配列を作らない / Avoid a float64 intermediate
+    return frames.mean(axis=1, dtype=np.float32).astype(np.int16)
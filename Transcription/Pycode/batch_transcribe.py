@@ -0,0 +1,329 @@
+"""録音ファイルのバッチ文字起こし（GUI・マイク不要） / Batch transcription of recorded files (no GUI, no microphone)
+
+WAV/FLAC ファイルまたはディレクトリを受け取り、GUIと同じチャンク分割でリクエストを並列送信する。
+完了したチャンクはマニフェスト（JSONL）に記録されるため、中断しても続きから再開できる。
+最後に重なりを除いた文字起こしを <名前>.txt（--subtitles で .srt/.vtt も）に書き出す。
+Takes WAV/FLAC files or directories, splits them with the same chunking as
+the GUI and submits chunks concurrently. Finished chunks are checkpointed in
+a JSONL manifest, so an interrupted run resumes where it left off. The
+stitched transcript is written to <name>.txt (and .srt/.vtt with --subtitles).
+tkinter と pyaudio は一切インポートしない。
+Never imports tkinter or pyaudio.
+
+    python batch_transcribe.py meeting.wav recordings/ --concurrency 6 --language ja
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_processing import PCMRingBuffer, FixedChunker, VoiceActivitySegmenter, StreamingResampler, downmix
+from audio_encoding import create_encoder, encode_chunk, EncoderStats, soundfile
+from transcription_backends import create_backend
+from prompt_builder import PromptBuilder
+from transcript_stitching import TranscriptStitcher
+from subtitle_export import SubtitleWriter
+
+RATE = 16000
+BLOCK = 1024    # GUIのコールバックと同じ単位で投入 / Feed audio in the same blocks as the GUI callback
+READ_FRAMES = 8192    # ファイルから一度に読むフレーム数（リサンプラーの作業領域もこれに比例） / Frames read from the file at a time (the resampler scratch scales with it)
+AUDIO_EXTENSIONS = ('.wav', '.flac')
+API_URL = "https://api.openai.com/v1/audio/transcriptions"
+
+
+def find_audio_files(paths):
+    """ファイル・ディレクトリから音声ファイルを列挙 / List audio files from files and directories"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found.extend(os.path.join(root, name) for name in names
+                             if name.lower().endswith(AUDIO_EXTENSIONS))
+        elif os.path.isfile(path):
+            found.append(path)
+        else:
+            print(f"見つかりません / Not found: {path}")
+    return sorted(found)
+
+
+def read_audio_blocks(path, frames=READ_FRAMES):
+    """16kHz int16 モノラルのブロックを順に返す（ファイル全体は読み込まない） / Yield 16 kHz int16 mono blocks without loading the whole file
+
+    ヘッダは呼び出し時に検証し、サンプルはブロックごとにダウンミックスとリサンプラーを通す。
+    The header is checked on the call; samples go through the downmix and the
+    streaming resampler one block at a time.
+    """
+    if path.lower().endswith('.wav'):
+        f = wave.open(path, 'rb')
+        if f.getsampwidth() != 2:
+            f.close()
+            raise ValueError("16-bit PCM WAV only")
+        rate = f.getframerate()
+        channels = f.getnchannels()
+
+        def read():
+            with f:
+                while True:
+                    data = f.readframes(frames)
+                    if not data:
+                        return
+                    yield np.frombuffer(data, dtype=np.int16).reshape(-1, channels)
+    else:
+        if soundfile is None:
+            raise ValueError("FLAC input needs the soundfile package")
+        f = soundfile.SoundFile(path)
+        rate = f.samplerate
+
+        def read():
+            with f:
+                yield from f.blocks(blocksize=frames, dtype='int16', always_2d=True)
+
+    resampler = StreamingResampler(rate, RATE)
+    return (resampler.process(downmix(block)) for block in read())
+
+
+def read_audio(path):
+    """ファイル全体を16kHz int16 モノラルの配列に（ベンチマーク用） / Read a whole file as one 16 kHz int16 mono array (for benchmarks)"""
+    blocks = list(read_audio_blocks(path))
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.int16)
+
+
+def iter_chunks(blocks, args):
+    """GUIと同じ分割ロジックでチャンクを順に生成 / Yield chunks using the same splitting logic as the GUI
+
+    呼び出し側は次のチャンクを要求する前にエンコードすること（ビューが上書きされるため）。
+    Callers must encode each chunk before asking for the next one, since the
+    ring buffer reuses its memory.
+    """
+    buffer = PCMRingBuffer(int(RATE * max(30.0, 2 * (args.chunk + args.overlap), 2 * args.max_segment)))
+    if args.mode == 'vad':
+        chunker = VoiceActivitySegmenter(buffer, RATE,
+                                         silence_duration=args.silence,
+                                         min_segment=args.min_segment,
+                                         max_segment=args.max_segment)
+    else:
+        chunker = FixedChunker(buffer, int(RATE * args.chunk), int(RATE * args.overlap))
+    seq = 0
+    for samples in blocks:
+        for offset in range(0, len(samples), BLOCK):
+            buffer.write(samples[offset:offset + BLOCK])
+            for chunk in chunker.pop_chunks():
+                chunk.seq = seq
+                seq += 1
+                yield chunk
+    for chunk in chunker.flush():
+        chunk.seq = seq
+        seq += 1
+        yield chunk
+
+
+class Manifest:
+    """完了チャンクの追記型チェックポイント / Append-only checkpoint of finished chunks
+
+    1行目に分割設定を記録し、設定が変わっていれば最初からやり直す。
+    The first line records the splitting config; a changed config restarts the file.
+    """
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.lock = threading.Lock()
+        self.file = None
+
+    def load(self):
+        """完了済みチャンクを読み込み、追記用に開く / Load finished chunks and open for appending"""
+        done = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+            header = json.loads(lines[0]) if lines else {}
+            if header.get('config') == self.config:
+                for line in lines[1:]:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue    # 書きかけの最終行 / Partially written last line
+                    done[entry['seq']] = entry
+            else:
+                print(f"設定が変わったため最初からやり直します / Config changed, restarting: {self.path}")
+                os.replace(self.path, self.path + '.old')
+        if not os.path.exists(self.path):
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'config': self.config}, ensure_ascii=False) + '\n')
+        self.file = open(self.path, 'a', encoding='utf-8')
+        return done
+
+    def record(self, entry):
+        """1チャンク分を追記してディスクへ書き出す / Append one chunk and flush it to disk"""
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def format_offset(seconds):
+    """開始からの経過時間を HH:MM:SS に / Format an offset from the start as HH:MM:SS"""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def write_transcript(base, entries, subtitle_formats=()):
+    """重なりを除いて文字起こしと字幕を書き出す / Write the stitched transcript and subtitle files"""
+    stitcher = TranscriptStitcher()
+    previous_end = 0
+    writers = [SubtitleWriter(f"{base}.{fmt}", fmt) for fmt in subtitle_formats]
+    try:
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            for entry in sorted(entries, key=lambda e: e['seq']):
+                if entry['start'] < previous_end:
+                    text = stitcher.stitch(entry['text'])
+                else:
+                    text = stitcher.push(entry['text'])
+                previous_end = entry['end']
+                if text:
+                    f.write(f"[{format_offset(entry['start'] / RATE)}] {text}\n")
+                    for writer in writers:
+                        writer.add(entry['start'] / RATE, entry['end'] / RATE, text)
+    finally:
+        for writer in writers:
+            writer.close()
+
+
+def transcribe_file(path, args, backend, stats):
+    """1ファイルを文字起こし、成功なら True / Transcribe one file, True on success"""
+    base = os.path.join(args.output_dir or os.path.dirname(path), os.path.splitext(os.path.basename(path))[0])
+    config = {key: getattr(args, key) for key in
+              ('mode', 'chunk', 'overlap', 'silence', 'min_segment', 'max_segment',
+               'format', 'language', 'keyword', 'backend', 'model')}
+    blocks = read_audio_blocks(path)
+    manifest = Manifest(base + '.manifest.jsonl', config)
+    done = manifest.load()
+    encoder = create_encoder(args.format, RATE)
+    # チャンクは並列に送るため文脈は使わず用語集のみ / Chunks run concurrently, so the prompt is the glossary only
+    prompt = PromptBuilder(args.prompt_lang, args.keyword).build()
+
+    failures = []
+    submitted = 0
+    total_samples = 0
+    slots = threading.BoundedSemaphore(args.concurrency * 2)    # 先読みするチャンク数の上限 / Bound on chunks encoded ahead
+
+    def work(seq, start, end, payload):
+        try:
+            text = backend.transcribe(payload, args.language, prompt)
+            entry = {'seq': seq, 'start': start, 'end': end, 'text': text}
+            manifest.record(entry)
+            done[seq] = entry
+        except Exception as e:
+            print(f"チャンク{seq}の文字起こしに失敗しました / Chunk {seq} failed: {e}")
+            failures.append(seq)
+        finally:
+            slots.release()
+
+    def counted(blocks):
+        nonlocal total_samples
+        for samples in blocks:
+            total_samples += len(samples)
+            yield samples
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for chunk in iter_chunks(counted(blocks), args):
+            if chunk.seq in done:
+                continue
+            payload = encode_chunk(encoder, chunk.samples, stats)
+            slots.acquire()
+            executor.submit(work, chunk.seq, chunk.start_sample, chunk.end_sample, payload)
+            submitted += 1
+    manifest.close()
+
+    elapsed = time.monotonic() - started
+    audio_seconds = total_samples / RATE
+    print(f"{path}: {submitted} chunks sent, {len(done)} done, {len(failures)} failed, "
+          f"{audio_seconds:.0f}s audio in {elapsed:.0f}s")
+    if failures:
+        print("失敗したチャンクは再実行で再送されます / Failed chunks will be retried on the next run")
+        return False
+    write_transcript(base, done.values(), args.subtitles or ())
+    return True
+
+
+def load_api_key(path):
+    """APIキーを環境変数 OPENAI_API_KEY またはファイルから読む / Read the API key from OPENAI_API_KEY or a file"""
+    if os.environ.get('OPENAI_API_KEY'):
+        return os.environ['OPENAI_API_KEY']
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='WAV/FLAC files or directories')
+    parser.add_argument('--output-dir', help='where transcripts and manifests go (default: next to each input)')
+    parser.add_argument('--concurrency', type=int, default=4, help='requests in flight')
+    parser.add_argument('--language', default='ja', help="language code or 'auto'")
+    parser.add_argument('--keyword', default='', help='topic keyword sent as prompt')
+    parser.add_argument('--prompt-lang', default='ja', choices=['ja', 'en', 'zh', 'ko'], help='language of the prompt template')
+    parser.add_argument('--mode', default='vad', choices=['vad', 'fixed'], help='segmentation mode')
+    parser.add_argument('--chunk', type=float, default=4.0, help='fixed mode chunk duration (s)')
+    parser.add_argument('--overlap', type=float, default=0.8, help='fixed mode overlap duration (s)')
+    parser.add_argument('--silence', type=float, default=0.5, help='VAD pause that ends a segment (s)')
+    parser.add_argument('--min-segment', type=float, default=1.0, help='VAD minimum segment (s)')
+    parser.add_argument('--max-segment', type=float, default=10.0, help='VAD maximum segment (s)')
+    parser.add_argument('--subtitles', action='append', choices=['srt', 'vtt'],
+                        help='also write <name>.srt / <name>.vtt (repeatable)')
+    parser.add_argument('--format', default='flac', choices=['flac', 'opus', 'wav'], help='upload encoding')
+    parser.add_argument('--backend', default='openai', choices=['openai', 'fake'],
+                        help="'fake' answers offline with canned text")
+    parser.add_argument('--model', default='gpt-4o-transcribe')
+    parser.add_argument('--api-url', default=API_URL)
+    parser.add_argument('--api-key-file', default='API_Key.txt')
+    parser.add_argument('--deadline', type=float, default=60.0, help='per-chunk deadline (s)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.backend == 'openai':
+        try:
+            api_key = load_api_key(args.api_key_file)
+        except OSError as e:
+            print(f"APIキーを読み込めません / Cannot read API key: {e}")
+            return 1
+        backend = create_backend('openai', api_key=api_key, url=args.api_url, model=args.model,
+                                 pool_size=args.concurrency, max_retries=5, attempt_timeout=30.0,
+                                 deadline=args.deadline, failure_threshold=10)
+    else:
+        backend = create_backend(args.backend)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    backend.warm_up()
+    stats = EncoderStats()
+    ok = True
+    try:
+        for path in find_audio_files(args.inputs):
+            try:
+                ok = transcribe_file(path, args, backend, stats) and ok
+            except (OSError, ValueError, wave.Error) as e:
+                print(f"{path} を処理できません / Cannot process {path}: {e}")
+                ok = False
+    finally:
+        backend.close()
+    summary = stats.summary()
+    print(f"uploaded {summary['encoded_bytes'] / 1e6:.1f} MB ({summary['ratio'] * 100:.0f}% of PCM, {summary['bitrate_kbps']:.1f} kbps)")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""オーディオバッファのマイクロベンチマーク / Micro-benchmark for the audio buffer
+
+旧来のリスト方式と PCMRingBuffer を比較し、音声1秒あたりの
+CPU時間とメモリ割り当てを表示する。
+Compares the legacy list-based buffer with PCMRingBuffer and reports CPU time
+and memory allocations per audio-second.
+
+    python benchmarks/bench_audio_buffer.py [--seconds 120]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_processing import PCMRingBuffer, FixedChunker
+
+RATE = 16000
+FRAMES = 1024
+CHUNK_DURATION = 4.0
+OVERLAP_DURATION = 0.8
+
+
+def make_blocks(seconds):
+    """PyAudioコールバック相当のバイト列を生成 / Generate byte blocks like the PyAudio callback"""
+    rng = np.random.default_rng(0)
+    count = int(seconds * RATE / FRAMES)
+    return [rng.integers(-3000, 3000, FRAMES, dtype=np.int16).tobytes() for _ in range(count)]
+
+
+def run_legacy(blocks, sink):
+    """旧実装（list.extend + スライス + concatenate） / Legacy implementation (list.extend + slicing + concatenate)"""
+    chunk_samples = int(RATE * CHUNK_DURATION)
+    overlap_samples = int(RATE * OVERLAP_DURATION)
+    audio_buffer = []
+    overlap_buffer = []
+    for data in blocks:
+        audio_array = np.frombuffer(data, dtype=np.int16)
+        audio_buffer.extend(audio_array)
+        if len(audio_buffer) >= chunk_samples:
+            chunk = audio_buffer[:chunk_samples]
+            if overlap_buffer:
+                full_chunk = np.concatenate([overlap_buffer, chunk])
+            else:
+                full_chunk = chunk
+            overlap_buffer = chunk[-overlap_samples:]
+            audio_buffer = audio_buffer[chunk_samples:]
+            sink.append(full_chunk)
+    return audio_buffer
+
+
+def run_ring(blocks, sink):
+    """リングバッファ実装 / Ring buffer implementation"""
+    buffer = PCMRingBuffer(int(RATE * 30.0))
+    chunker = FixedChunker(buffer, int(RATE * CHUNK_DURATION), int(RATE * OVERLAP_DURATION))
+    for data in blocks:
+        buffer.write(np.frombuffer(data, dtype=np.int16))
+        sink.extend(chunker.pop_chunks())
+    return buffer
+
+
+def measure(name, func, blocks, seconds):
+    """CPU時間とメモリを計測 / Measure CPU time and memory"""
+    # CPU計測（tracemallocなし） / CPU measurement without tracemalloc overhead
+    sink = []
+    cpu_start = time.process_time()
+    func(blocks, sink)
+    cpu = time.process_time() - cpu_start
+
+    # 割り当て計測 / Allocation measurement
+    sink = []
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    state = func(blocks, sink)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    blocks_allocated = sum(max(stat.count_diff, 0) for stat in stats)
+    retained = sum(stat.size_diff for stat in stats)
+    del state, sink
+
+    print(f"{name:>8}: CPU {cpu / seconds * 1e6:9.1f} us/audio-s | "
+          f"peak {peak / 1024:9.1f} KiB | retained {retained / 1024:9.1f} KiB | "
+          f"live blocks {blocks_allocated / seconds:9.1f} /audio-s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=120.0, help='simulated audio length in seconds')
+    args = parser.parse_args()
+
+    blocks = make_blocks(args.seconds)
+    print(f"{args.seconds:.0f}s of 16 kHz int16 audio, {FRAMES}-frame callbacks, "
+          f"{CHUNK_DURATION}s chunks / {OVERLAP_DURATION}s overlap")
+    measure('legacy', run_legacy, blocks, args.seconds)
+    measure('ring', run_ring, blocks, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""アップロード用エンコーダーの比較 / Compare upload encoders
+
+4.8秒のチャンク（音声に近い信号）を各形式でエンコードし、
+エンコード時間と送信サイズ、ビットレートを表示する。
+Encodes 4.8 s chunks of a speech-like signal in every format and reports
+encode time, payload size and bitrate.
+
+    python benchmarks/bench_encoding.py [--wav recording.wav]
+"""
+import argparse
+import os
+import sys
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_encoding import ENCODERS, EncoderStats, create_encoder, encode_chunk
+
+RATE = 16000
+CHUNK_SAMPLES = int(RATE * 4.8)
+
+
+def synthetic_speech(seconds):
+    """音声に近い合成信号（変調した倍音＋ノイズ） / Speech-like synthetic signal (modulated harmonics plus noise)"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * RATE)) / RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None)
+    return (3000 * voiced * envelope + rng.normal(0, 80, len(t))).astype(np.int16)
+
+
+def read_wav(path):
+    """16kHzモノラルWAVを読み込む / Read a 16 kHz mono WAV file"""
+    with wave.open(path, 'rb') as f:
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wav', help='16 kHz mono int16 WAV file to use instead of the synthetic signal')
+    parser.add_argument('--seconds', type=float, default=60.0)
+    args = parser.parse_args()
+
+    audio = read_wav(args.wav) if args.wav else synthetic_speech(args.seconds)
+    chunks = [audio[i:i + CHUNK_SAMPLES] for i in range(0, len(audio) - CHUNK_SAMPLES + 1, CHUNK_SAMPLES)]
+    for name in ENCODERS:
+        encoder = create_encoder(name, RATE)
+        if encoder.name != name:
+            continue
+        stats = EncoderStats()
+        for chunk in chunks:
+            encode_chunk(encoder, chunk, stats)
+        summary = stats.summary()
+        print(f"{name:>5}: {summary['encoded_bytes'] / summary['chunks'] / 1024:7.1f} KiB/chunk "
+              f"({summary['ratio'] * 100:5.1f}% of PCM, {summary['bitrate_kbps']:6.1f} kbps) | encode {summary['encode_ms_avg']:6.2f} ms/chunk")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""HTTP接続プールのベンチマーク / Benchmark for pooled HTTP connections
+
+ローカルのHTTPS代替サーバーに対し、リクエストごとに新規接続する方式（旧実装の requests.post）と
+事前接続済みの PooledHTTPSession の応答時間を比較する。
+Compares per-request connections (the old module-level requests.post) with a
+pre-warmed PooledHTTPSession against a local HTTPS stand-in server.
+
+    python benchmarks/bench_http_pool.py [--requests 50] [--workers 3]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_client import PooledHTTPSession
+from standin_server import StandInServer, make_self_signed_cert
+
+PAYLOAD = b'RIFF' + bytes(150 * 1024)   # 4.8秒WAV相当 / About one 4.8 s WAV chunk
+
+
+def post(send, url):
+    """1回分のmultipart POSTの所要時間（ミリ秒） / Duration of one multipart POST in milliseconds"""
+    files = {'file': ('audio.wav', io.BytesIO(PAYLOAD), 'audio/wav')}
+    data = {'model': 'gpt-4o-transcribe', 'response_format': 'json'}
+    start = time.perf_counter()
+    response = send(url, files=files, data=data, timeout=10)
+    response.raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+
+def run(name, send, url, count, workers):
+    """count 回のリクエストを workers 並列で送信して集計 / Send count requests with workers in parallel and summarize"""
+    first = post(send, url)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(lambda _: post(send, url), range(count)))
+    latencies.sort()
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    print(f"{name:>7}: first {first:7.1f} ms | p50 {statistics.median(latencies):7.1f} ms | "
+          f"p95 {p95:7.1f} ms | mean {statistics.mean(latencies):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50, help='requests per mode')
+    parser.add_argument('--workers', type=int, default=3, help='concurrent requests')
+    parser.add_argument('--latency', type=float, default=0.0, help='server-side latency in seconds')
+    args = parser.parse_args()
+
+    certfile = make_self_signed_cert()
+    server = StandInServer(latency=args.latency, certfile=certfile).start()
+    print(f"HTTPS stand-in at {server.url}, {len(PAYLOAD) // 1024} KiB payload, "
+          f"{args.requests} requests, {args.workers} concurrent")
+    try:
+        run('cold', lambda url, **kw: requests.post(url, verify=certfile, **kw),
+            server.url, args.requests, args.workers)
+
+        pooled = PooledHTTPSession(args.workers, verify=certfile)
+        pooled.warm_up(server.url)
+        run('pooled', pooled.post, server.url, args.requests, args.workers)
+        pooled.close()
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""録音ファイルを再生するエンドツーエンドのパイプラインベンチマーク / End-to-end pipeline benchmark driven by recorded audio
+
+参照用のWAVを実時間（または --speed 倍速）で audio_callback に流し込み、GUIと同じ
+TranscriptionEngine の process_audio → エンコード → transcribe_audio → 結果の解放の経路を通して、
+ローカルの代替APIサーバーに送信する。設定（CHUNK_DURATION:OVERLAP_DURATION）ごとに
+別プロセスで実行し、次の値を表にする：
+Replays reference WAV files into audio_callback at real time (or --speed
+times faster), through the same TranscriptionEngine path as the GUI
+(process_audio -> encode -> transcribe_audio -> release in capture order), against a
+local stand-in API server.
+Each CHUNK_DURATION:OVERLAP_DURATION setting runs in its own process and the
+table reports:
+
+  - 最初の字幕までの時間 / time to first subtitle
+  - チャンクごとのエンドツーエンド遅延（最後のサンプル捕捉 → 結果の解放、重なりの除去で空になった結果も含む）の分位点
+    per-chunk end-to-end latency percentiles (last sample captured -> result released,
+    including results the overlap stitching empties)
+  - --stream 時は最初の途中経過（partial イベント）までの遅延の中央値
+    with --stream, the median latency until the first partial event
+  - 実時間係数（処理時間 / 音声長） / real-time factor (processing time / audio duration)
+  - 音声1分あたりのCPU秒 / CPU seconds per audio minute
+  - ピークRSS / peak RSS
+
+--output で結果をJSONに保存し、--baseline で前回の結果と比較する（悪化があれば終了コード1）。
+--output saves the results as JSON; --baseline compares with an earlier run
+and exits with 1 when p95 latency or CPU regressed beyond --tolerance.
+
+PyAudio・GUI・表示環境は使わない。
+Neither PyAudio, the GUI nor a display is used.
+
+    python benchmarks/bench_pipeline.py meeting.wav --configs 4.0:0.8 3.0:0.5 2.0:0.4
+    python benchmarks/bench_pipeline.py --speed 4 --output today.json --baseline release.json
+    python benchmarks/bench_pipeline.py --latency 1.5 --stream
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from standin_server import API_PATH
+
+RATE = 16000
+RESULT_PREFIX = 'RESULT '
+
+
+def synthetic_wav(path, duration, seed=0):
+    """発話（雑音バースト）と無音が交互に続くWAVを作成 / Write a WAV alternating speech-like bursts and pauses"""
+    rng = np.random.default_rng(seed)
+    samples = rng.normal(0, 30, int(duration * RATE))
+    position = int(0.5 * RATE)
+    while position < len(samples):
+        length = int(rng.uniform(1.5, 4.0) * RATE)
+        samples[position:position + length] += rng.normal(0, 3000, len(samples[position:position + length]))
+        position += length + int(rng.uniform(0.6, 1.2) * RATE)
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(np.clip(samples, -32768, 32767).astype(np.int16).tobytes())
+    return path
+
+
+def peak_rss_mb():
+    """このプロセスのピークRSS（MB）、取得できなければ None / Peak RSS of this process in MB, None when unavailable"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024.0 * 1024.0)
+    return None
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * q / 100.0), len(values) - 1)]
+
+
+def run_one(spec):
+    """1設定・1ファイル分を実行し結果を返す（子プロセス内） / Run one setting on one file and return the results (child process)"""
+    import threading
+    from transcription_engine import TranscriptionEngine
+    from batch_transcribe import read_audio
+
+    samples = read_audio(spec['wav'])
+    # 最後の区間を閉じるため無音を1秒足す / Append a second of silence so the last segment closes
+    samples = np.concatenate([samples, np.zeros(RATE, dtype=np.int16)])
+    speed = spec['speed']
+
+    engine = TranscriptionEngine('sk-bench')
+    engine.api_url = spec['api_url']
+    engine.TRANSCRIPTION_BACKEND = 'openai'
+    engine.CHUNK_DURATION = spec['chunk']
+    engine.OVERLAP_DURATION = spec['overlap']
+    engine.SEGMENTATION_MODE = spec['mode']
+    engine.MAX_CONCURRENT_REQUESTS = spec['concurrency']
+    engine.UPLOAD_FORMAT = spec['format']
+    engine.ADAPTIVE_CHUNKING = spec['adaptive']
+    engine.STREAM_PARTIALS = spec['stream']
+
+    # 捕捉順に解放された結果ごとに時刻を記録（重なりの除去で空になったものも含む）
+    # Record when each result is released in capture order, including ones the overlap stitching empties
+    marks = []       # (チャンク終端サンプル, 解放時刻) / (chunk end sample, release time)
+    subtitles = []   # transcript イベントの時刻 / Times of transcript events
+    release = engine.on_transcription
+
+    def on_transcription(chunk, result):
+        release(chunk, result)
+        if result is not None and result.text:
+            marks.append((chunk.end_sample, time.monotonic()))
+
+    engine.on_transcription = on_transcription
+    engine.on('transcript', lambda event: subtitles.append(time.monotonic()))
+
+    # チャンクごとの最初の途中経過 / First partial of each chunk
+    first_partials = {}     # 番号 -> (チャンク終端サンプル, 時刻) / seq -> (chunk end sample, time)
+
+    def on_partial(event):
+        first_partials.setdefault(event.seq, (event.chunk.end_sample, time.monotonic()))
+
+    engine.on('partial', on_partial)
+
+    state = {'fed': False}
+    cpu_start = time.process_time()
+    started = time.monotonic()
+    engine.start_pipeline()
+
+    def feed():
+        """マイクの代わりに音声ブロックを audio_callback へ渡す / Hand audio blocks to audio_callback in place of the microphone"""
+        block = engine.CHUNK
+        for offset in range(0, len(samples), block):
+            data = samples[offset:offset + block]
+            if speed > 0:
+                # ブロックの最後のサンプルが「捕捉」されるまで待つ / Wait until the block's last sample has been "captured"
+                delay = started + (offset + len(data)) / RATE / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            now = time.monotonic()
+            engine.audio_callback(data.tobytes(), len(data),
+                                  {'input_buffer_adc_time': now, 'current_time': now}, 0)
+        state['fed'] = True
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    # すべてのチャンクが確定まで進んだら終了 / Finish once every chunk has been committed
+    deadline = started + len(samples) / RATE / (speed or 1e9) + spec['timeout']
+    idle_polls = 0
+    while idle_polls < 3 and time.monotonic() <= deadline:
+        time.sleep(0.1)
+        pool = engine.transcription_pool
+        settled = (state['fed'] and engine.audio_queue.empty() and engine.transcription_queue.empty()
+                   and engine.upload_queue.empty()
+                   and all(pool.reorder_for(source).next_seq == source.next_seq for source in engine.sources))
+        idle_polls = idle_polls + 1 if settled else 0
+    finished = time.monotonic()
+    engine.stop_pipeline()
+    cpu_seconds = time.process_time() - cpu_start
+    uploads = engine.encoder_stats.summary()
+    engine.close()
+
+    audio_seconds = len(samples) / RATE
+    latencies = [done - (started + end / RATE / (speed or 1e9)) for end, done in marks]
+    partial_latencies = [shown - (started + end / RATE / (speed or 1e9)) for end, shown in first_partials.values()]
+    last = marks[-1][1] if marks else finished
+    return {
+        'wav': os.path.basename(spec['wav']),
+        'mode': spec['mode'],
+        'chunk': spec['chunk'],
+        'overlap': spec['overlap'],
+        'speed': speed,
+        'stream': spec['stream'],
+        'audio_seconds': audio_seconds,
+        'chunks': sum(source.next_seq for source in engine.sources),
+        'results': len(marks),
+        'subtitles': len(subtitles),
+        'timed_out': finished > deadline,
+        'first_subtitle_s': marks[0][1] - started if marks else None,
+        'latency_p50_ms': (percentile(latencies, 50) or 0) * 1000,
+        'latency_p90_ms': (percentile(latencies, 90) or 0) * 1000,
+        'latency_p95_ms': (percentile(latencies, 95) or 0) * 1000,
+        'latency_p99_ms': (percentile(latencies, 99) or 0) * 1000,
+        'latency_max_ms': max(latencies) * 1000 if latencies else 0,
+        'partial_p50_ms': percentile(partial_latencies, 50) * 1000 if partial_latencies else None,
+        'real_time_factor': (last - started) / audio_seconds,
+        'cpu_s_per_audio_min': cpu_seconds / (audio_seconds / 60.0),
+        'peak_rss_mb': peak_rss_mb(),
+        'upload_kb': uploads['encoded_bytes'] / 1024.0,
+        'stages': engine.timeline_recorder.summary(),
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_standin(args):
+    """代替APIサーバーを別プロセスで起動（CPU計測に混ざらないように） / Start the stand-in API in its own process so it stays out of the CPU figures"""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, 'standin_server.py'), '--port', str(port),
+                                '--latency', str(args.latency), '--jitter', str(args.jitter)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}{API_PATH}"
+
+
+def run_child(spec):
+    """1回分を子プロセスで実行し結果を受け取る / Run one measurement in a child process and collect its result"""
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-one', json.dumps(spec)],
+                               capture_output=True, text=True, encoding='utf-8')
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    print(completed.stdout[-2000:])
+    print(completed.stderr[-2000:])
+    raise RuntimeError(f"benchmark run failed for {spec['wav']} {spec['chunk']}:{spec['overlap']}")
+
+
+def fmt(value, pattern, width):
+    return ('-' if value is None else pattern.format(value)).rjust(width)
+
+
+def print_table(results):
+    print(f"{'file':<18} {'chunk:ovl':>9} {'first':>7} {'partial':>7} {'p50':>7} {'p95':>7} {'p99':>7} "
+          f"{'RTF':>5} {'CPU s/min':>9} {'RSS MB':>7} {'chunks':>6}")
+    for r in results:
+        print(f"{r['wav'][:18]:<18} {r['chunk']:>4.1f}:{r['overlap']:<4.1f} "
+              f"{fmt(r['first_subtitle_s'], '{:.2f}s', 7)} {fmt(r.get('partial_p50_ms'), '{:.0f}ms', 7)} "
+              f"{r['latency_p50_ms']:6.0f}ms {r['latency_p95_ms']:6.0f}ms "
+              f"{r['latency_p99_ms']:6.0f}ms {r['real_time_factor']:5.2f} {r['cpu_s_per_audio_min']:9.2f} "
+              f"{fmt(r['peak_rss_mb'], '{:.0f}', 7)} {r['chunks']:>6}" + (' TIMEOUT' if r['timed_out'] else ''))
+
+
+def compare(results, baseline, tolerance):
+    """前回の結果と比較し、悪化した項目を表示 / Compare with a baseline and list regressions"""
+    key = lambda r: (r['wav'], r['mode'], r['chunk'], r['overlap'], r['speed'], r.get('stream', False))
+    previous = {key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get(key(r))
+        if old is None:
+            continue
+        for metric in ('latency_p95_ms', 'cpu_s_per_audio_min', 'peak_rss_mb'):
+            if old.get(metric) and r.get(metric) and r[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{r['wav']} {r['chunk']}:{r['overlap']} {metric}: "
+                                   f"{old[metric]:.1f} -> {r[metric]:.1f}")
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print(f"前回からの悪化なし / No regressions against baseline (tolerance {tolerance * 100:.0f}%)")
+    return not regressions
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--run-one':
+        print(RESULT_PREFIX + json.dumps(run_one(json.loads(sys.argv[2]))))
+        return 0
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('wavs', nargs='*', help='reference WAV/FLAC files (default: a synthetic 60 s recording)')
+    parser.add_argument('--configs', nargs='+', default=['4.0:0.8'], help='CHUNK_DURATION:OVERLAP_DURATION pairs')
+    parser.add_argument('--mode', default='fixed', choices=['fixed', 'vad'])
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed; 0 feeds as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=3)
+    parser.add_argument('--format', default='flac', choices=['flac', 'opus', 'wav'])
+    parser.add_argument('--adaptive', action='store_true', help='let the chunk duration controller adjust the configs')
+    parser.add_argument('--stream', action='store_true', help='stream partial transcripts over server-sent events')
+    parser.add_argument('--latency', type=float, default=0.5, help='stand-in API latency (s)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='stand-in API latency jitter (s)')
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds allowed after the audio ends')
+    parser.add_argument('--output', help='save results as JSON')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative regression')
+    args = parser.parse_args()
+
+    wavs = args.wavs
+    if not wavs:
+        wavs = [synthetic_wav(os.path.join(tempfile.mkdtemp(), 'synthetic.wav'), 60.0)]
+
+    standin, url = start_standin(args)
+    results = []
+    try:
+        for config in args.configs:
+            chunk, overlap = (float(value) for value in config.split(':'))
+            for wav in wavs:
+                results.append(run_child({'wav': os.path.abspath(wav), 'api_url': url, 'mode': args.mode,
+                                          'chunk': chunk, 'overlap': overlap, 'speed': args.speed,
+                                          'concurrency': args.concurrency, 'format': args.format,
+                                          'timeout': args.timeout, 'adaptive': args.adaptive,
+                                          'stream': args.stream}))
+    finally:
+        standin.terminate()
+        standin.wait()
+
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            return 0 if compare(results, json.load(f), args.tolerance) else 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""リサンプラーのスループット計測 / Resampler throughput benchmark
+
+デバイス本来のレート（既定 44.1/48 kHz ステレオ）のコールバック列を CaptureStream.split() に通し、
+ダウンミックスと 16 kHz への変換にかかる CPU 時間を1コアに対する割合で表示する。
+Feeds callback-sized blocks at native device rates (44.1/48 kHz stereo by
+default) through CaptureStream.split() and reports the CPU time spent on
+downmixing and resampling to 16 kHz as a share of one core.
+
+    python benchmarks/bench_resampler.py [--seconds 120] [--rates 44100 48000] [--channels 2]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capture_sources import AudioSource, CaptureStream
+
+OUT_RATE = 16000
+FRAMES = 1024
+
+
+def make_blocks(rate, channels, seconds):
+    """コールバック相当のインターリーブ済みバイト列（音声帯域の和音＋雑音） / Interleaved byte blocks like the callback (tones in the speech band plus noise)"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * rate)) / rate
+    mono = 6000 * np.sin(2 * np.pi * 220 * t) + 3000 * np.sin(2 * np.pi * 1800 * t) + rng.normal(0, 500, len(t))
+    frames = np.repeat(mono[:, None], channels, axis=1).astype(np.int16)
+    return [frames[offset:offset + FRAMES].tobytes() for offset in range(0, len(frames), FRAMES)]
+
+
+def measure(rate, channels, seconds):
+    source = AudioSource('bench')
+    capture = CaptureStream(None, [source], OUT_RATE, OUT_RATE)
+    capture.configure(rate, channels)
+    blocks = make_blocks(rate, channels, seconds)
+
+    produced = 0
+    cpu_start = time.process_time()
+    for data in blocks:
+        for _, samples in capture.split(data):
+            produced += len(samples)
+    cpu = time.process_time() - cpu_start
+
+    taps = capture.resamplers[source].taps if capture.resamplers else 0
+    print(f"{rate:>6} Hz x{channels}: {taps:3d} taps | {produced / seconds:8.0f} samples/s out | "
+          f"CPU {cpu / seconds * 1e6:8.1f} us/audio-s = {cpu / seconds * 100:.3f}% of one core")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=120.0, help='simulated audio length in seconds')
+    parser.add_argument('--rates', type=int, nargs='+', default=[44100, 48000], help='native capture rates')
+    parser.add_argument('--channels', type=int, default=2, help='channels per frame (downmixed to mono)')
+    args = parser.parse_args()
+
+    print(f"{args.seconds:.0f}s per rate, {FRAMES}-frame callbacks, resampled to {OUT_RATE} Hz")
+    for rate in args.rates:
+        measure(rate, args.channels, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
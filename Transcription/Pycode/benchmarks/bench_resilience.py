@@ -0,0 +1,88 @@
+"""障害注入下での再試行・ヘッジのベンチマーク / Retry and hedging benchmark under injected faults
+
+障害を注入した代替サーバーに対し、旧実装相当（1回だけ送信）と ResilientTransport を比較し、
+成功率と応答時間の分位点を表示する。
+Runs the old single-shot request and ResilientTransport against a
+fault-injecting stand-in server and reports success rate and latency percentiles.
+
+    python benchmarks/bench_resilience.py --chunks 200 --error-rate 0.1 --hang-rate 0.03
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_client import PooledHTTPSession, ResilientTransport, CircuitBreaker
+from standin_server import StandInServer
+
+PAYLOAD = bytes(150 * 1024)
+
+
+def one_chunk(send, url):
+    """1チャンク分の送信：（成功したか, 所要秒） / Send one chunk: (succeeded, seconds)"""
+    files = {'file': ('audio.wav', PAYLOAD, 'audio/wav')}
+    start = time.monotonic()
+    try:
+        response = send(url, files=files, data={'model': 'gpt-4o-transcribe'})
+        ok = response.status_code == 200
+    except Exception:
+        ok = False
+    return ok, time.monotonic() - start
+
+
+def report(name, results):
+    """成功率と分位点を表示 / Print success rate and percentiles"""
+    latencies = sorted(seconds for _, seconds in results)
+    succeeded = sum(1 for ok, _ in results if ok)
+
+    def pct(q):
+        return latencies[min(int(len(latencies) * q / 100.0), len(latencies) - 1)] * 1000
+
+    print(f"{name:>9}: success {succeeded / len(results) * 100:5.1f}% | p50 {pct(50):7.0f} ms | "
+          f"p95 {pct(95):7.0f} ms | p99 {pct(99):7.0f} ms | max {latencies[-1] * 1000:7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.1)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--retry-after', type=float, default=None)
+    parser.add_argument('--hang-rate', type=float, default=0.03)
+    parser.add_argument('--hang-time', type=float, default=10.0)
+    parser.add_argument('--deadline', type=float, default=6.0, help='per-chunk deadline in seconds')
+    args = parser.parse_args()
+
+    server = StandInServer(latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, error_status=args.error_status,
+                           retry_after=args.retry_after, hang_rate=args.hang_rate,
+                           hang_time=args.hang_time).start()
+    print(f"stand-in at {server.url}: {args.error_rate:.0%} HTTP {args.error_status}, "
+          f"{args.hang_rate:.0%} hangs of {args.hang_time:.0f}s, latency {args.latency}s +/- {args.jitter}s")
+
+    def run(send):
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            return list(pool.map(lambda _: one_chunk(send, server.url), range(args.chunks)))
+
+    try:
+        session = PooledHTTPSession(args.workers * 2)
+        report('single', run(lambda url, **kw: session.post(url, timeout=10, **kw)))
+
+        transport = ResilientTransport(session, deadline=args.deadline, attempt_timeout=args.deadline,
+                                       breaker=CircuitBreaker(failure_threshold=20), hedge=True)
+        report('resilient', run(transport.post))
+        print(f"transport stats: {transport.stats}")
+        transport.close()
+        session.close()
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
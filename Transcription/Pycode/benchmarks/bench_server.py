@@ -0,0 +1,160 @@
+"""WebSocket 文字起こしサーバーの同時接続ベンチマーク / Concurrent session benchmark for the WebSocket server
+
+代替APIサーバーに向けた RealtimeTranscriberServer に、合成音声を実時間で送る多数のクライアントを接続し、
+音声の終端から文字起こしが届くまでの遅延とスレッド数を表示する。
+--fast-clients で実時間より速く送るクライアントを混ぜ、背圧と公平性を確認できる。
+Connects many clients that stream synthetic speech in real time to a
+RealtimeTranscriberServer backed by the stand-in API (or the fake backend), then reports the delay
+from the end of each segment's audio to its transcript and the thread count.
+--fast-clients mixes in clients that send as fast as they can, to check
+backpressure and fairness.
+
+    python benchmarks/bench_server.py --sessions 200 --duration 20 --fast-clients 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from websockets.asyncio.client import connect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcriber_server import RealtimeTranscriberServer
+from standin_server import StandInServer
+
+RATE = 16000
+FRAME = 1024
+
+
+def synthetic_speech(duration, seed):
+    """発話（雑音バースト）と無音を交互に並べた音声 / Alternate speech-like noise bursts with pauses"""
+    rng = np.random.default_rng(seed)
+    samples = rng.normal(0, 30, int(duration * RATE))
+    position = int(rng.uniform(0.2, 1.0) * RATE)
+    while position < len(samples):
+        length = int(rng.uniform(1.5, 3.5) * RATE)
+        samples[position:position + length] += rng.normal(0, 3000, len(samples[position:position + length]))
+        position += length + int(rng.uniform(0.7, 1.2) * RATE)
+    return np.clip(samples, -32768, 32767).astype(np.int16)
+
+
+async def run_client(url, audio, realtime, latencies):
+    """音声を送り、受け取った文字起こしの遅延を記録 / Stream audio and record the delay of each transcript"""
+    async with connect(url, max_size=1 << 20) as connection:
+        await connection.send(json.dumps({'type': 'config', 'language': 'ja'}))
+        started = time.monotonic()
+
+        async def receive():
+            count = 0
+            async for message in connection:
+                event = json.loads(message)
+                if event['type'] == 'transcript':
+                    count += 1
+                    if realtime:
+                        latencies.append(time.monotonic() - started - event['end'])
+                elif event['type'] == 'done':
+                    return count
+            return count
+
+        receiver = asyncio.ensure_future(receive())
+        for offset in range(0, len(audio), FRAME):
+            await connection.send(audio[offset:offset + FRAME].tobytes())
+            if realtime:
+                # 実時間で送信 / Pace to real time
+                delay = started + (offset + FRAME) / RATE - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        await connection.send(json.dumps({'type': 'end'}))
+        count = await receiver
+        return count, time.monotonic() - started
+
+
+async def run(args):
+    server = RealtimeTranscriberServer('sk-test', 0, '127.0.0.1')
+    standin = None
+    if args.backend == 'fake':
+        server.TRANSCRIPTION_BACKEND = 'fake'
+        server.BACKEND_OPTIONS = {'latency': args.latency, 'jitter': args.jitter}
+    else:
+        standin = StandInServer(latency=args.latency, jitter=args.jitter, text="これはテストです。")
+        standin.start()
+        server.api_url = standin.url
+    server.MAX_CONCURRENT_REQUESTS = args.concurrency
+    server.UPLOAD_FORMAT = args.format
+    await server.start()
+    url = f"ws://127.0.0.1:{server.websocket_port}"
+
+    latencies = []
+    fast_latencies = []
+    clients = []
+    for i in range(args.sessions):
+        audio = synthetic_speech(args.duration, i)
+        clients.append(run_client(url, audio, True, latencies))
+    for i in range(args.fast_clients):
+        audio = synthetic_speech(args.duration, 10000 + i)
+        clients.append(run_client(url, audio, False, fast_latencies))
+
+    peak_threads = 0
+
+    async def watch_threads():
+        nonlocal peak_threads
+        while True:
+            # 代替APIサーバーの接続ごとのスレッドは数えない / Leave out the stand-in API's per-connection threads
+            threads = [t for t in threading.enumerate() if 'process_request' not in t.name]
+            peak_threads = max(peak_threads, len(threads))
+            await asyncio.sleep(0.5)
+
+    watcher = asyncio.ensure_future(watch_threads())
+    started = time.monotonic()
+    results = await asyncio.gather(*clients, return_exceptions=True)
+    elapsed = time.monotonic() - started
+    watcher.cancel()
+    await server.stop()
+    if standin:
+        standin.stop()
+
+    errors = [r for r in results if isinstance(r, Exception)]
+    finished = [r for r in results if not isinstance(r, Exception)]
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(int(len(latencies) * q / 100.0), len(latencies) - 1)] * 1000
+
+    print(f"sessions: {args.sessions} real-time + {args.fast_clients} fast | errors {len(errors)} | "
+          f"wall {elapsed:.1f}s for {args.duration:.0f}s of audio each")
+    if errors:
+        print(f"first error: {errors[0]!r}")
+    print(f"transcripts: {sum(count for count, _ in finished)} | peak sessions {server.stats['peak_sessions']} | "
+          f"peak threads {peak_threads}")
+    if latencies:
+        print(f"end-of-audio -> transcript: p50 {pct(50):.0f} ms | p95 {pct(95):.0f} ms | "
+              f"p99 {pct(99):.0f} ms | max {latencies[-1] * 1000:.0f} ms")
+    fast = finished[args.sessions:]
+    if fast:
+        slowest = max(seconds for _, seconds in fast)
+        print(f"fast clients: slowest finished in {slowest:.1f}s "
+              f"(throttled {server.stats['throttled_seconds']:.0f}s in total)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--fast-clients', type=int, default=0)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds of audio per client')
+    parser.add_argument('--concurrency', type=int, default=32, help='API requests in flight')
+    parser.add_argument('--latency', type=float, default=0.4)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--backend', default='standin', choices=['standin', 'fake'],
+                        help="'standin' goes over HTTP to a local stand-in API, 'fake' skips the network")
+    parser.add_argument('--format', default='flac', choices=['flac', 'opus', 'wav'])
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
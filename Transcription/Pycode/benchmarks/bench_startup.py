@@ -0,0 +1,71 @@
+"""起動時間の計測と回帰チェック / Startup time benchmark and regression check
+
+新しいインタープリタで RealTime_Transcription を繰り返し import し、所要時間の中央値と、
+import 時点で読み込まれてしまった重いモジュールを表示する。重いモジュールが読み込まれた場合や
+--max-ms を超えた場合は終了コード 1 を返すので、CI で回帰を検出できる。
+Imports RealTime_Transcription in fresh interpreters, prints the median
+import time and any heavy module that got loaded at import time. Exits with
+status 1 when a heavy module was loaded or the median exceeds --max-ms, so
+regressions can be caught in CI.
+
+ウィンドウ表示までのフェーズ別の時間はアプリを --startup-report 付きで起動して確認する。
+For per-phase times up to the window appearing, start the app with --startup-report.
+
+tkinter が import できる必要がある（PyAudio と表示環境は不要）。
+Needs tkinter importable (neither PyAudio nor a display is needed).
+
+    python benchmarks/bench_startup.py [--runs 7] [--max-ms 150]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 最初の録音まで読み込まないモジュール / Modules that must wait for the first recording
+HEAVY_MODULES = ['numpy', 'requests', 'pyaudio', 'soundfile', 'asyncio', 'websockets', 'http.server',
+                 'audio_processing', 'transcription_pipeline', 'audio_encoding', 'transcription_backends',
+                 'capture_sources', 'transcriber_server']
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import RealTime_Transcription
+elapsed = time.perf_counter() - started
+import startup
+print(json.dumps({'ms': elapsed * 1000, 'loaded': [name for name in %r if startup.is_loaded(name)]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_once():
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=APP_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"import failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7, help='fresh interpreters to start')
+    parser.add_argument('--max-ms', type=float, default=None, help='fail when the median import time exceeds this')
+    args = parser.parse_args()
+
+    samples = [measure_once() for _ in range(args.runs)]
+    times = sorted(sample['ms'] for sample in samples)
+    loaded = sorted({name for sample in samples for name in sample['loaded']})
+    print(f"import RealTime_Transcription: median {statistics.median(times):.1f} ms "
+          f"(min {times[0]:.1f}, max {times[-1]:.1f}, {args.runs} runs)")
+    print(f"heavy modules loaded at import: {', '.join(loaded) if loaded else 'none'}")
+
+    failed = bool(loaded)
+    if args.max_ms is not None and statistics.median(times) > args.max_ms:
+        print(f"median exceeds the {args.max_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""重なりテキスト結合のベンチマーク / Benchmark for transcript stitching
+
+長時間セッションで1チャンクあたりの処理時間を表示する。結果の正しさは tests/test_transcript_stitching.py で検証する。
+Reports time per chunk over a long session. Correctness is covered by
+tests/test_transcript_stitching.py.
+
+    python benchmarks/bench_stitching.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcript_stitching import TranscriptStitcher
+
+
+def main():
+    # 長時間セッションでの1チャンクあたりの処理時間 / Per-chunk cost over a long session
+    stitcher = TranscriptStitcher()
+    sentence = "これは長い会議の文字起こしのテストで、同じような文章が何度も繰り返されます。" * 3
+    rounds = 2000
+    start = time.perf_counter()
+    for i in range(rounds):
+        stitcher.stitch(sentence[i % 20:i % 20 + 60])
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"{elapsed * 1e6:.0f} us per stitched chunk")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""ローカルの文字起こしAPI代替サーバー / Local stand-in for the transcription API
+
+/v1/audio/transcriptions への multipart POST に固定テキストの JSON を返す。
+HTTP/1.1 Keep-Alive と、自己署名証明書による HTTPS に対応。
+Answers multipart POSTs to /v1/audio/transcriptions with canned JSON text.
+Supports HTTP/1.1 keep-alive and HTTPS with a self-signed certificate.
+障害注入（エラー応答・Retry-After 付き 429・応答停止）も可能。
+Faults can be injected: error responses, 429 with Retry-After, and hangs.
+stream=true のリクエストには、テキストを --stream-pieces 個の差分に分けて遅延の間に少しずつ
+server-sent events（transcript.text.delta → transcript.text.done）で返す。
+--stream-drop-rate は最初の差分の後で接続を切り、--stream-truncate-rate は transcript.text.done を送らずに正常終了する。
+Requests with stream=true are answered with server-sent events
+(transcript.text.delta ... transcript.text.done): the text is split into
+--stream-pieces deltas spread across the latency. --stream-drop-rate cuts
+that fraction of streams off after the first delta; --stream-truncate-rate
+ends that fraction cleanly after the first delta, without
+transcript.text.done.
+
+    python benchmarks/standin_server.py --port 8443 --tls --latency 0.3
+    python benchmarks/standin_server.py --error-rate 0.2 --error-status 429 --retry-after 1 --hang-rate 0.05
+    python benchmarks/standin_server.py --latency 1.0 --stream-pieces 8 --stream-drop-rate 0.1
+"""
+import argparse
+import json
+import os
+import random
+import re
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PATH = '/v1/audio/transcriptions'
+
+
+def form_field(body, name):
+    """multipart/form-data の本文から1つのフィールドの値を取り出す（なければ None） / Value of one field of a multipart/form-data body, None when absent"""
+    match = re.search(rb'name="' + re.escape(name.encode()) + rb'"\r\n\r\n(.*?)\r\n--', body, re.S)
+    return match.group(1).decode('utf-8', 'replace') if match else None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """代替APIのリクエストハンドラ / Request handler for the stand-in API"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload, headers=None):
+        """JSON応答を送信 / Send a JSON response"""
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self, events, drop=False, truncate=False):
+        """(待ち秒, イベント) の列を server-sent events として chunked で送信 / Send (delay, event) pairs as server-sent events over chunked encoding
+
+        drop なら最初のイベントの後で切断し、truncate なら最初のイベントの後でストリームを正常に閉じる。
+        drop cuts the connection after the first event; truncate ends the
+        stream cleanly after it.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for delay, event in events:
+            time.sleep(delay)
+            data = f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+            if drop:
+                self.close_connection = True
+                return
+            if truncate:
+                break
+        self.wfile.write(b'0\r\n\r\n')
+
+    def read_body(self):
+        """リクエストボディを読み切る（Keep-Aliveのため必須） / Read the whole request body (required for keep-alive)"""
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.path != API_PATH:
+            self.send_json(404, {'error': {'message': 'not found'}})
+            return
+        self.server.record_request(len(body))
+
+        # 障害注入 / Fault injection
+        fault = self.server.sample_fault()
+        if fault == 'hang':
+            time.sleep(self.server.hang_time)
+        elif fault == 'error':
+            headers = {}
+            if self.server.retry_after is not None:
+                headers['Retry-After'] = str(self.server.retry_after)
+            self.send_json(self.server.error_status, {'error': {'message': 'injected fault'}}, headers)
+            return
+
+        latency = self.server.sample_latency()
+        if form_field(body, 'stream') == 'true':
+            self.send_events(self.server.stream_events(latency),
+                             drop=random.random() < self.server.stream_drop_rate,
+                             truncate=random.random() < self.server.stream_truncate_rate)
+            return
+        time.sleep(latency)
+        self.send_json(200, {'text': self.server.text})
+
+
+class StandInServer(ThreadingHTTPServer):
+    """スレッド型の代替APIサーバー / Threaded stand-in API server"""
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 text='これはテストです。', certfile=None, handler=StandInHandler, verbose=False,
+                 error_rate=0.0, error_status=500, retry_after=None, hang_rate=0.0, hang_time=30.0,
+                 stream_pieces=4, stream_drop_rate=0.0, stream_truncate_rate=0.0):
+        super().__init__((host, port), handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.hang_rate = hang_rate
+        self.hang_time = hang_time
+        self.text = text
+        self.stream_pieces = max(int(stream_pieces), 1)
+        self.stream_drop_rate = stream_drop_rate
+        self.stream_truncate_rate = stream_truncate_rate
+        self.verbose = verbose
+        self.certfile = certfile
+        self.requests_served = 0
+        self.bytes_received = 0
+        self.stats_lock = threading.Lock()
+        self.thread = None
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    @property
+    def url(self):
+        """APIエンドポイントのURL / URL of the API endpoint"""
+        scheme = 'https' if self.certfile else 'http'
+        host, port = self.server_address[:2]
+        return f"{scheme}://{host}:{port}{API_PATH}"
+
+    def sample_latency(self):
+        """応答遅延（秒）をサンプリング / Sample a response latency in seconds"""
+        return max(self.latency + random.uniform(-self.jitter, self.jitter), 0.0)
+
+    def stream_events(self, latency):
+        """ストリーミング応答のイベント列（差分を遅延の間に均等に配置） / Events of a streamed response, deltas spread evenly across the latency"""
+        text = self.text
+        bounds = [len(text) * piece // self.stream_pieces for piece in range(self.stream_pieces + 1)]
+        events = [(latency / self.stream_pieces, {'type': 'transcript.text.delta', 'delta': text[start:end]})
+                  for start, end in zip(bounds, bounds[1:])]
+        events.append((0.0, {'type': 'transcript.text.done', 'text': text}))
+        return events
+
+    def sample_fault(self):
+        """注入する障害を選ぶ（'error'、'hang'、None） / Pick a fault to inject ('error', 'hang' or None)"""
+        roll = random.random()
+        if roll < self.error_rate:
+            return 'error'
+        if roll < self.error_rate + self.hang_rate:
+            return 'hang'
+        return None
+
+    def record_request(self, size):
+        with self.stats_lock:
+            self.requests_served += 1
+            self.bytes_received += size
+
+    def start(self):
+        """バックグラウンドで起動 / Serve in a background thread"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """停止 / Stop serving"""
+        self.shutdown()
+        self.server_close()
+
+
+def make_self_signed_cert(directory=None):
+    """openssl で localhost 用の自己署名証明書を作成 / Create a self-signed localhost certificate with openssl
+
+    証明書と鍵をまとめたPEMファイルのパスを返す。
+    Returns the path of a PEM file holding both certificate and key.
+    """
+    directory = directory or tempfile.mkdtemp(prefix='standin-tls-')
+    key_path = os.path.join(directory, 'key.pem')
+    cert_path = os.path.join(directory, 'cert.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+                    '-keyout', key_path, '-out', cert_path, '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1'],
+                   check=True, capture_output=True)
+    pem_path = os.path.join(directory, 'standin.pem')
+    with open(pem_path, 'w') as pem:
+        for path in (cert_path, key_path):
+            with open(path) as f:
+                pem.write(f.read())
+    return pem_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform latency jitter in seconds')
+    parser.add_argument('--text', default='これはテストです。', help='canned transcription text')
+    parser.add_argument('--tls', action='store_true', help='serve HTTPS with a self-signed certificate')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with an error')
+    parser.add_argument('--error-status', type=int, default=500, help='status code of injected errors')
+    parser.add_argument('--retry-after', type=float, default=None, help='Retry-After seconds sent with errors')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='fraction of requests that hang')
+    parser.add_argument('--hang-time', type=float, default=30.0, help='seconds a hung request stalls')
+    parser.add_argument('--stream-pieces', type=int, default=4, help='deltas per streamed response')
+    parser.add_argument('--stream-drop-rate', type=float, default=0.0, help='fraction of streams cut off after the first delta')
+    parser.add_argument('--stream-truncate-rate', type=float, default=0.0,
+                        help='fraction of streams ended cleanly after the first delta, without transcript.text.done')
+    args = parser.parse_args()
+
+    certfile = make_self_signed_cert() if args.tls else None
+    server = StandInServer(args.host, args.port, args.latency, args.jitter, args.text,
+                           certfile=certfile, verbose=True,
+                           error_rate=args.error_rate, error_status=args.error_status,
+                           retry_after=args.retry_after, hang_rate=args.hang_rate, hang_time=args.hang_time,
+                           stream_pieces=args.stream_pieces, stream_drop_rate=args.stream_drop_rate,
+                           stream_truncate_rate=args.stream_truncate_rate)
+    print(f"Stand-in transcription API on {server.url}")
+    if certfile:
+        print(f"Certificate: {certfile}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""複数入力の同時録音 / Concurrent capture from several inputs
+
+入力ソース（マイク1本、または多チャンネル機器の1チャンネル）ごとにリングバッファ・チャンカー・
+シーケンス番号・重複除去・文脈を持ち、ラベル付きで別々に文字起こしする。
+同じデバイスのソースは1本のストリームを共有し、フレームをチャンネルごとに分配する。
+Each input source (one microphone, or one channel of a multichannel
+interface) has its own ring buffer, chunker, sequence numbers, stitcher and
+prompt context, and is transcribed separately under its label. Sources on
+the same device share one stream whose frames are split per channel.
+ストリームはデバイス本来のレート（44.1/48 kHz など）で開き、ソースごとに 16 kHz へ変換する。
+Streams open at the device's native rate (44.1/48 kHz, ...) and each source
+is resampled to 16 kHz.
+
+    sources = [AudioSource('Host', 'USB', 0), AudioSource('Guest', 'USB', 1)]
+    for capture in group_sources(sources):
+        stream = audio.open(channels=capture.channels, input_device_index=find_input_device(audio, capture.device), ...)
+"""
+import numpy as np
+
+from audio_processing import StreamingResampler
+from transcript_stitching import TranscriptStitcher
+
+
+def label_text(label, text):
+    """ラベルがあれば先頭に付ける / Prefix the label, if any"""
+    return f"{label}: {text}" if label else text
+
+
+class AudioSource:
+    """1入力分のパイプライン状態 / Pipeline state for one input
+
+    device はデバイス番号・デバイス名の一部・None（既定のデバイス）、channel はデバイス内のチャンネル番号。
+    device is a device index, part of a device name, or None for the default
+    device; channel is the channel within that device.
+    """
+    def __init__(self, label='', device=None, channel=None, name=None):
+        self.label = label              # 字幕に付ける名前（空なら付けない） / Shown with each subtitle (nothing when empty)
+        self.name = name or label or 'input'    # メトリクス用の名前 / Name used in metrics
+        self.device = device
+        self.channel = channel
+        self.buffer = None
+        self.chunker = None
+        self.queue = None               # このソースの ChunkQueue / This source's ChunkQueue
+        self.prompt_builder = None
+        self.stitcher = TranscriptStitcher()
+        self.last_committed_end = 0     # 最後に表示したチャンクの終端サンプル / End sample of the last displayed chunk
+        self.next_seq = 0
+        self.captured_samples = 0
+        self.level = 0.0
+        self.lag = None                 # 直近の表示遅れ（秒） / Lag of the latest subtitle (s)
+        self.max_lag = 0.0
+        self.rendered = 0
+
+    def record_lag(self, lag):
+        """表示した字幕の遅れを記録 / Record the lag of a rendered subtitle"""
+        self.rendered += 1
+        if lag is not None:
+            self.lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def labelled(self, text):
+        """ラベル付きのテキスト / Text with the source label"""
+        return label_text(self.label, text)
+
+
+class CaptureStream:
+    """1デバイス分の入力ストリーム / Input stream of one device
+
+    channels はソースが使う最大のチャンネル番号＋1。チャンネル指定のないソースは全チャンネルの平均（ダウンミックス）。
+    rate は開いたストリームのレートで、出力レートと違えばソースごとにリサンプラーを持つ。
+    channels is one more than the highest channel any source uses; a source
+    without a channel gets all channels mixed down. rate is the rate the
+    stream was opened at; when it differs from the output rate each source
+    has its own resampler.
+    """
+    def __init__(self, device, sources, rate=16000, out_rate=16000):
+        self.device = device
+        self.sources = sources
+        self.channels = max(source.channel or 0 for source in sources) + 1
+        self.out_rate = out_rate
+        self.configure(rate)
+
+    def configure(self, rate, device_channels=1):
+        """デバイスに合わせてレートとチャンネル数を決める / Set the rate and channel count to suit the device
+
+        ダウンミックスするソースがあれば、デバイスが対応する範囲でステレオで開く。
+        When a source is mixed down, the stream opens in stereo if the device supports it.
+        """
+        self.rate = int(rate)
+        if any(source.channel is None for source in self.sources):
+            self.channels = max(self.channels, min(int(device_channels), 2))
+        self.mix = np.full(self.channels, 1.0 / self.channels, dtype=np.float32)   # ダウンミックスの重み / Downmix weights
+        self.resamplers = {source: StreamingResampler(self.rate, self.out_rate)
+                           for source in self.sources if self.rate != self.out_rate}
+
+    def split(self, in_data):
+        """インターリーブされたフレームをソースごとの出力レートのサンプルに分ける / Split interleaved frames into samples per source, at the output rate"""
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if self.channels == 1:
+            parts = [(source, samples) for source in self.sources]
+        else:
+            frames = samples[:len(samples) - len(samples) % self.channels].reshape(-1, self.channels)
+            mixed = frames.astype(np.float32) @ self.mix if any(source.channel is None for source in self.sources) else None
+            parts = [(source, mixed if source.channel is None else frames[:, source.channel])
+                     for source in self.sources]
+        if self.resamplers:
+            return [(source, self.resamplers[source].process(part)) for source, part in parts]
+        return [(source, part.astype(np.int16, copy=False)) for source, part in parts]
+
+
+def group_sources(sources, rate=16000):
+    """同じデバイスのソースを1本のストリームにまとめる（開くまでは rate のまま） / Group sources on the same device into one stream each (at rate until opened)"""
+    devices = {}
+    for source in sources:
+        devices.setdefault(source.device, []).append(source)
+    return [CaptureStream(device, members, rate, rate) for device, members in devices.items()]
+
+
+def input_device_info(audio, index):
+    """入力デバイスの情報（index が None なら既定のデバイス） / Info of an input device (the default device when index is None)"""
+    if index is None:
+        return audio.get_default_input_device_info()
+    return audio.get_device_info_by_index(index)
+
+
+def find_input_device(audio, device):
+    """デバイス番号または名前の一部から入力デバイス番号を得る（None は既定のデバイス） / Resolve a device index or part of a name to an input device index (None is the default device)"""
+    if device is None or isinstance(device, int):
+        return device
+    for index in range(audio.get_device_count()):
+        info = audio.get_device_info_by_index(index)
+        if info.get('maxInputChannels', 0) > 0 and str(device).lower() in info.get('name', '').lower():
+            return index
+    raise ValueError(f"input device not found: {device}")
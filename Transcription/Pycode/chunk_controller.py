@@ -0,0 +1,83 @@
+"""API遅延に応じたチャンク長の自動調整 / Adaptive chunk duration driven by measured API latency
+
+チャンクが長いほど音声がたまるまで字幕が遅れ、短いほどリクエストあたりの固定費が増えて追いつけなくなる。
+直近の往復時間と待ち行列の長さを見て、実効リアルタイム係数（API時間 ÷ (音声長 × 並列数)）が
+目標以下に収まる範囲でチャンクをできるだけ短くする。
+Longer chunks delay subtitles while audio accumulates; shorter ones pay the
+per-request overhead more often and can fall behind. From recent round-trip
+times and the queue depth, the controller keeps chunks as short as possible
+while the effective real-time factor (API time / (audio length x workers))
+stays below the target.
+"""
+import time
+from collections import deque
+
+
+class ChunkDurationController:
+    """フィードバックでチャンク長を決める / Pick the chunk duration by feedback
+
+    observe() は結果1件ごとに呼ぶ（1スレッドから）。duration はどのスレッドから読んでもよい。
+    Call observe() once per result (from one thread); duration may be read from any thread.
+
+    - 実効RTFが target_rtf を超える、または待ちチャンクが max_queued を超えたら長くする（×grow）
+      Grow (x grow) when the effective RTF exceeds target_rtf or more than max_queued chunks wait
+    - 実効RTFが target_rtf × shrink_below 未満で待ちがなければ step 秒短くする
+      Shrink by step seconds when it is below target_rtf x shrink_below and nothing waits
+    変更後は cooldown 件の結果を新しい長さで測ってから次を判断する。
+    After a change, cooldown results are measured at the new duration before deciding again.
+    """
+    def __init__(self, initial, minimum, maximum, workers=1, target_rtf=0.7, shrink_below=0.6,
+                 grow=1.25, step=0.5, max_queued=1, cooldown=4, window=8, on_change=None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.duration = self.clamp(initial)
+        self.workers = max(int(workers), 1)
+        self.target_rtf = target_rtf
+        self.shrink_below = shrink_below
+        self.grow = grow
+        self.step = step
+        self.max_queued = max_queued
+        self.cooldown = cooldown
+        self.ratios = deque(maxlen=window)  # 音声1秒あたりのAPI時間 / API seconds per audio second
+        self.on_change = on_change
+        self.history = deque(maxlen=100)   # 直近の変更記録 / Recent adjustments
+
+    def clamp(self, duration):
+        return round(min(max(duration, self.minimum), self.maximum), 2)
+
+    def effective_rtf(self):
+        """直近の実効リアルタイム係数（90パーセンタイル） / Recent effective real-time factor (90th percentile)"""
+        if not self.ratios:
+            return None
+        ratios = sorted(self.ratios)
+        return ratios[int(0.9 * (len(ratios) - 1))] / self.workers
+
+    def observe(self, audio_seconds, latency_seconds, queued):
+        """結果1件を反映し、長さを変えたら新しい値を返す / Take one result into account; return the new duration if it changed"""
+        if audio_seconds <= 0:
+            return None
+        self.ratios.append(latency_seconds / audio_seconds)
+        if len(self.ratios) < self.cooldown:
+            return None
+        rtf = self.effective_rtf()
+        if rtf > self.target_rtf or queued > self.max_queued:
+            reason = 'behind' if queued > self.max_queued else 'slow'
+            duration = self.clamp(max(self.duration * self.grow, self.duration + self.step))
+        elif rtf < self.target_rtf * self.shrink_below and queued == 0:
+            reason = 'fast'
+            duration = self.clamp(self.duration - self.step)
+        else:
+            return None
+        if duration == self.duration:
+            return None
+
+        record = {'type': 'chunk_duration', 'time': time.time(), 'from': self.duration, 'to': duration,
+                  'reason': reason, 'rtf': round(rtf, 3), 'queued': queued,
+                  'latency_s': round(latency_seconds, 3)}
+        self.history.append(record)
+        self.duration = duration
+        # 新しい長さで測り直す / Measure again at the new duration
+        self.ratios.clear()
+        if self.on_change:
+            self.on_change(record)
+        return duration
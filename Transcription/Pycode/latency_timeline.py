@@ -0,0 +1,220 @@
+"""チャンクごとの遅延タイムライン / Per-chunk latency timeline
+
+各チャンクは捕捉から字幕表示までの各段階の時刻（time.monotonic）を記録し、
+段階ごとの所要時間は直近の分布（ローリングヒストグラム）に集計される。
+Every chunk records a time.monotonic() stamp at each stage from capture to
+the rendered subtitle; the time spent in each stage feeds a rolling histogram.
+"""
+import bisect
+import json
+import threading
+import time
+from collections import deque
+
+# 記録する時刻（この順に進む） / Stamps, in pipeline order
+# 'partial' は最初の途中経過（ストリーミング時のみ） / 'partial' is the first in-progress text (streaming only)
+STAGES = ('captured', 'enqueued', 'encoded', 'sent', 'partial', 'received', 'released', 'rendered')
+
+# 段階名と、その開始・終了の時刻 / Stage name with the stamps it spans
+STAGE_INTERVALS = (
+    ('buffering', 'captured', 'enqueued'),      # 録音〜チャンク確定（チャンク長を含む） / Capture until the chunk is cut (includes its length)
+    ('encode', 'enqueued', 'encoded'),          # エンコード待ち＋エンコード / Encoder queue wait and encoding
+    ('upload_wait', 'encoded', 'sent'),         # ワーカー待ち / Waiting for a free worker
+    ('network', 'sent', 'received'),            # API往復（再試行を含む） / API round trip, retries included
+    ('first_partial', 'sent', 'partial'),       # 送信〜最初の途中経過 / Request until the first in-progress text
+    ('reorder', 'received', 'released'),        # 先行チャンクの完了待ち / Waiting for earlier chunks to finish
+    ('display', 'released', 'rendered'),        # Tkメインループ / Tk main loop
+    ('total', 'captured', 'rendered'),
+)
+
+# ヒストグラムの区切り（ミリ秒、約25%刻み、1ms〜約2分） / Bucket bounds in ms, ~25% apart, 1 ms to ~2 min
+BUCKET_BOUNDS_MS = tuple(round(1.25 ** i, 2) for i in range(53))
+
+# 累積ヒストグラム（メトリクス用）の区切り（秒） / Bucket bounds in seconds for the cumulative (metrics) histograms
+CUMULATIVE_BOUNDS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+
+class ChunkTimeline:
+    """1チャンク分の各段階の時刻 / Stage stamps for one chunk"""
+    __slots__ = ('seq', 'audio_seconds', 'stamps', 'outcome', 'source')
+
+    def __init__(self, seq=0, audio_seconds=0.0, source=None):
+        self.seq = seq
+        self.source = source   # 入力ソース名（複数入力時） / Input source name, with several inputs
+        self.audio_seconds = audio_seconds
+        self.stamps = {}
+        self.outcome = None    # 'rendered'、'empty'、'failed'
+
+    def mark(self, stage, when=None):
+        """段階の時刻を記録（既定は現在時刻） / Stamp a stage (now by default)"""
+        self.stamps[stage] = time.monotonic() if when is None else when
+
+    def interval(self, start, end):
+        """2つの時刻の差（秒）、どちらかがなければ None / Seconds between two stamps, None if either is missing"""
+        if start in self.stamps and end in self.stamps:
+            return self.stamps[end] - self.stamps[start]
+        return None
+
+    def stage_ms(self):
+        """段階ごとの所要時間（ミリ秒） / Time spent in each stage (ms)"""
+        stages = {}
+        for name, start, end in STAGE_INTERVALS:
+            seconds = self.interval(start, end)
+            if seconds is not None:
+                stages[name] = round(seconds * 1000.0, 1)
+        return stages
+
+    def lag(self):
+        """字幕表示時点での音声末尾からの遅れ（秒） / How far behind the end of the chunk's audio the subtitle appeared (s)"""
+        seconds = self.interval('captured', 'rendered')
+        return None if seconds is None else seconds - self.audio_seconds
+
+    def to_record(self):
+        """トレース用の辞書（時刻は captured からのミリ秒） / Trace record, stamps in ms since 'captured'"""
+        origin = self.stamps.get('captured', min(self.stamps.values(), default=0.0))
+        record = {
+            'type': 'chunk',
+            'seq': self.seq,
+            'outcome': self.outcome,
+            'audio_s': round(self.audio_seconds, 3),
+            'stamps': {stage: round((self.stamps[stage] - origin) * 1000.0, 1)
+                       for stage in STAGES if stage in self.stamps},
+            'stages': self.stage_ms(),
+        }
+        if self.source is not None:
+            record['source'] = self.source
+        return record
+
+
+class RollingHistogram:
+    """直近 window 件の値のヒストグラム / Histogram over the most recent `window` values
+
+    固定の対数区切りに数え、古い値は入れ替わりで差し引く。分位点は区切りの上端で返す。
+    Values are counted into fixed log-spaced buckets and the oldest value is
+    subtracted as a new one arrives. Percentiles are reported as bucket upper bounds.
+    """
+    def __init__(self, window=500, bounds=BUCKET_BOUNDS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.recent = deque(maxlen=window)
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.recent)
+
+    def add(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            if len(self.recent) == self.recent.maxlen:
+                old_index, old_value = self.recent[0]
+                self.counts[old_index] -= 1
+                self.total -= old_value
+            self.recent.append((index, value))
+            self.counts[index] += 1
+            self.total += value
+
+    def percentile(self, q):
+        """q（0〜100）分位点の区切り上端、値がなければ None / Upper bound of the q-th percentile bucket, None when empty"""
+        with self.lock:
+            count = len(self.recent)
+            if count == 0:
+                return None
+            rank = max(int(count * q / 100.0 + 0.5), 1)
+            seen = 0
+            for index, bucket in enumerate(self.counts):
+                seen += bucket
+                if seen >= rank:
+                    break
+            if index < len(self.bounds):
+                return self.bounds[index]
+            return max(value for _, value in self.recent)
+
+    def summary(self):
+        """件数・平均・分位点 / Count, mean and percentiles"""
+        with self.lock:
+            count = len(self.recent)
+            mean = self.total / count if count else None
+        return {'count': count, 'mean': mean, 'p50': self.percentile(50),
+                'p90': self.percentile(90), 'p99': self.percentile(99)}
+
+
+class CumulativeHistogram:
+    """起動からの累積ヒストグラム（Prometheus形式） / Histogram accumulated since start (Prometheus style)
+
+    書き込みは1スレッドのみ。読み取りはロックなしでコピーする。
+    Written from one thread only; readers copy it without taking a lock.
+    """
+    def __init__(self, bounds=CUMULATIVE_BOUNDS_S):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def snapshot(self):
+        """（各区切り以下の累積件数, 合計） / (cumulative counts per bound, sum)"""
+        cumulative = []
+        running = 0
+        for count in list(self.counts):
+            running += count
+            cumulative.append(running)
+        return cumulative, self.sum
+
+
+class TimelineRecorder:
+    """完了したタイムラインを段階別ヒストグラムとJSONLトレースに記録 / Record finished timelines into per-stage histograms and a JSONL trace
+
+    直近分のローリングヒストグラムに加え、メトリクス用に起動からの累積ヒストグラムも持つ。
+    record() と log_event() はロックで1つずつ書くので、どのスレッドから呼んでもよい（summary() も同様）。
+    Besides the rolling histograms of recent chunks it keeps cumulative
+    histograms since start for metrics. record() and log_event() write one
+    at a time under a lock, so any thread may call them (summary() too).
+    """
+    def __init__(self, window=500, trace_path=None):
+        self.histograms = {name: RollingHistogram(window) for name, _, _ in STAGE_INTERVALS}
+        self.cumulative = {name: CumulativeHistogram() for name, _, _ in STAGE_INTERVALS}
+        self.trace_file = None
+        self.outcomes = {}
+        self.last_rendered_audio_end = None    # 最後に表示したチャンクの音声末尾の時刻 / Capture time of the end of the last rendered chunk
+        self.lock = threading.Lock()
+        self.open_trace(trace_path)
+
+    def open_trace(self, trace_path):
+        """JSONLトレースを（追記で）開く、None なら何もしない / Open the JSONL trace for appending; no-op for None"""
+        self.close()
+        if trace_path:
+            self.trace_file = open(trace_path, 'a', encoding='utf-8', buffering=64 * 1024)
+
+    def record(self, timeline):
+        """1チャンク分を集計しトレースに書く / Aggregate one chunk and append it to the trace"""
+        with self.lock:
+            self.outcomes[timeline.outcome] = self.outcomes.get(timeline.outcome, 0) + 1
+            for name, milliseconds in timeline.stage_ms().items():
+                self.histograms[name].add(milliseconds)
+                self.cumulative[name].observe(milliseconds / 1000.0)
+            if timeline.outcome == 'rendered' and 'captured' in timeline.stamps:
+                self.last_rendered_audio_end = timeline.stamps['captured'] + timeline.audio_seconds
+            if self.trace_file:
+                self.trace_file.write(json.dumps(timeline.to_record()) + '\n')
+
+    def log_event(self, record):
+        """タイムライン以外の記録（設定の変更など）をトレースに書く / Append a non-timeline record (a setting change, ...) to the trace"""
+        with self.lock:
+            if self.trace_file:
+                self.trace_file.write(json.dumps(record) + '\n')
+
+    def summary(self):
+        """段階別の集計 / Per-stage aggregates"""
+        return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+    def close(self):
+        """集計をトレースの最後に書いて閉じる / Append the aggregates to the trace and close it"""
+        with self.lock:
+            if self.trace_file:
+                self.trace_file.write(json.dumps({'type': 'summary', 'outcomes': self.outcomes,
+                                                  'stages': self.summary()}) + '\n')
+                self.trace_file.close()
+                self.trace_file = None
@@ -0,0 +1,119 @@
+"""Prometheus/OpenMetrics 形式のメトリクス公開 / Prometheus text-format metrics endpoint
+
+GET /metrics ごとに collect(writer) を呼び、書き込まれた値をテキスト形式で返す。
+HTTPサーバーは専用のデーモンスレッドで動き、collect は値を読むだけなので、
+録音・文字起こしスレッドを待たせることはない。
+Every GET /metrics calls collect(writer) and returns what it wrote in the
+Prometheus text exposition format. The HTTP server runs on its own daemon
+thread and collect only reads values, so a scrape never holds up the
+capture or transcription threads.
+"""
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(int(value))
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + '}'
+
+
+class MetricWriter:
+    """メトリクスをテキスト形式で組み立てる / Build metrics in the text exposition format"""
+    def __init__(self):
+        self.lines = []
+        self.declared = set()
+
+    def declare(self, name, kind, help_text):
+        if name not in self.declared:
+            self.declared.add(name)
+            self.lines.append(f"# HELP {name} {help_text}")
+            self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, value, labels=None):
+        self.lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+    def counter(self, name, help_text, value, labels=None):
+        self.declare(name, 'counter', help_text)
+        self.sample(name, value, labels)
+
+    def gauge(self, name, help_text, value, labels=None):
+        self.declare(name, 'gauge', help_text)
+        self.sample(name, value, labels)
+
+    def histogram(self, name, help_text, bounds, cumulative, total, labels=None):
+        """cumulative は各区切り以下の累積件数（最後は +Inf） / cumulative holds counts at or below each bound, +Inf last"""
+        self.declare(name, 'histogram', help_text)
+        labels = dict(labels or {})
+        for bound, count in zip(list(bounds) + [float('inf')], cumulative):
+            self.sample(name + '_bucket', count, dict(labels, le=format_value(float(bound))))
+        self.sample(name + '_sum', total, labels)
+        self.sample(name + '_count', cumulative[-1] if cumulative else 0, labels)
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """/metrics のリクエストハンドラ / Request handler for /metrics"""
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        writer = MetricWriter()
+        try:
+            self.server.collect(writer)
+            body = writer.text().encode('utf-8')
+            status = 200
+        except Exception as e:
+            body = f"# collect failed: {e}\n".encode('utf-8')
+            status = 500
+        self.send_response(status)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """ローカルのメトリクスHTTPサーバー / Local metrics HTTP server"""
+    daemon_threads = True
+
+    def __init__(self, collect, host='127.0.0.1', port=9464):
+        super().__init__((host, port), MetricsHandler)
+        self.collect = collect
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,134 @@
+import re
+from collections import deque
+
+# キーワードプロンプトのテンプレート（GUI言語別） / Keyword prompt templates per GUI language
+KEYWORD_PROMPTS = {
+    'ja': "以下の音声は「{topic}」というキーワードに関連しています。このキーワードを念頭に置いて、正確に文字起こししてください。",
+    'en': "The following audio is related to the keyword '{topic}'. Please transcribe accurately while keeping this keyword in mind.",
+    'zh': "以下音频与关键词{topic}相关。请在记住此关键词的同时准确转录。",
+    'ko': "다음 오디오는 '{topic}' 키워드와 관련이 있습니다. 이 키워드를 염두에 두고 정확하게 전사해 주세요.",
+}
+
+# 用語集のテンプレート（予算付きプロンプト用の短い形） / Glossary templates (the compact form used by budgeted prompts)
+GLOSSARY_PROMPTS = {
+    'ja': "用語：{terms}。",
+    'en': "Terms: {terms}. ",
+    'zh': "术语：{terms}。",
+    'ko': "용어: {terms}. ",
+}
+
+# 文脈プロンプトのテンプレート / Context prompt templates
+CONTEXT_PROMPTS = {
+    'ja': "これは音声の続きです。前の文脈：{context}",
+    'en': "This is a continuation of audio. Previous context: {context}",
+    'zh': "这是音频的延续。之前的上下文：{context}",
+    'ko': "이것은 오디오의 연속입니다. 이전 컨텍스트: {context}",
+}
+
+
+def keyword_prompt(topic, lang='ja'):
+    """キーワードプロンプトを作成 / Build the keyword prompt"""
+    if not topic:
+        return ""
+    return KEYWORD_PROMPTS.get(lang, KEYWORD_PROMPTS['en']).format(topic=topic)
+
+
+def context_prompt(history, lang='ja'):
+    """直近の文字起こし結果を結合して文脈プロンプトを作成 / Build the context prompt by joining recent transcriptions"""
+    if not history:
+        return ""
+    return CONTEXT_PROMPTS.get(lang, CONTEXT_PROMPTS['en']).format(context=" ".join(history))
+
+
+def estimate_tokens(text):
+    """トークン数の簡易見積もり（CJK文字は1字1トークン、その他は約4字1トークン） / Cheap token estimate: one per CJK character, about four characters per token otherwise"""
+    wide = sum(1 for c in text if c >= '⺀')
+    return wide + (len(text) - wide + 3) // 4
+
+
+def split_keywords(keyword):
+    """キーワード欄を用語のリストに（読点・カンマ・改行区切り、重複なし） / Split the keyword field into terms (by 、 , ; or newline, without duplicates)"""
+    terms = []
+    for term in re.split(r'[,、，;；\n]+', keyword or ''):
+        term = term.strip()
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+class PromptBuilder:
+    """トークン予算付きのプロンプト作成 / Prompt builder with a token budget
+
+    キーワードの用語集はセッション開始時に一度だけ作り、予算のうち glossary_share までを常に確保する。
+    残りの予算には直近の文字起こしを新しい方から詰める。文字起こしを追加するたびに
+    連結済みの文脈とプロンプト全体を差分で更新し、build() は保存済みの文字列を返すだけにする。
+    The keyword glossary is compiled once per session and always gets up to
+    glossary_share of the budget. The rest holds the most recent
+    transcriptions. Each add() updates the joined context and the whole
+    prompt incrementally, so build() just returns the stored string.
+
+    add() は1つのスレッド（結果の解放順）から、build() はどのスレッドからでも呼べる。
+    add() is called from one thread (result release order); build() from any thread.
+    """
+    def __init__(self, lang='ja', keyword='', budget=200, glossary_share=0.4):
+        self.lang = lang
+        self.budget = budget
+        self.glossary = self.compile_glossary(split_keywords(keyword), int(budget * glossary_share))
+        head, _, tail = CONTEXT_PROMPTS.get(lang, CONTEXT_PROMPTS['en']).partition('{context}')
+        self.context_head = head
+        self.context_tail = tail
+        self.context_budget = max(budget - estimate_tokens(self.glossary) - estimate_tokens(head + tail), 0)
+        self.entries = deque()      # (テキスト, トークン数) / (text, tokens)
+        self.context = ''
+        self.context_tokens = 0
+        self.prompt = self.glossary
+
+    def compile_glossary(self, terms, budget):
+        """予算内に収まる分だけ用語を並べた用語集 / Glossary with as many terms as fit the budget"""
+        separator = '、' if self.lang in ('ja', 'zh') else ', '
+        template = GLOSSARY_PROMPTS.get(self.lang, GLOSSARY_PROMPTS['en'])
+        while terms:
+            glossary = template.format(terms=separator.join(terms))
+            if estimate_tokens(glossary) <= budget or len(terms) == 1:
+                return glossary
+            terms = terms[:-1]
+        return ''
+
+    def add(self, text):
+        """確定した文字起こしを文脈の末尾に追加 / Append a committed transcription to the context tail"""
+        text = text.strip()
+        if not text:
+            return
+        tokens = estimate_tokens(text)
+        self.entries.append((text, tokens))
+        self.context = f"{self.context} {text}" if self.context else text
+        self.context_tokens += tokens + (1 if len(self.entries) > 1 else 0)
+
+        # 予算を超えた古い文脈を先頭から落とす / Drop the oldest context beyond the budget
+        while self.context_tokens > self.context_budget and len(self.entries) > 1:
+            old, old_tokens = self.entries.popleft()
+            self.context = self.context[len(old) + 1:]
+            self.context_tokens -= old_tokens + 1
+        if self.context_tokens > self.context_budget:
+            # 1件だけで超える場合は末尾を残す / A single oversized entry keeps its end
+            keep = max(len(self.context) * self.context_budget // max(self.context_tokens, 1), 0)
+            self.context = self.context[len(self.context) - keep:] if keep else ''
+            self.context_tokens = estimate_tokens(self.context)
+            self.entries = deque([(self.context, self.context_tokens)]) if self.context else deque()
+        self.prompt = self.assemble()
+
+    def assemble(self):
+        if not self.context:
+            return self.glossary
+        return f"{self.glossary}{self.context_head}{self.context}{self.context_tail}"
+
+    def build(self):
+        """現在のプロンプト（保存済み） / Current prompt, already assembled"""
+        return self.prompt
+
+    def reset(self):
+        """文脈を消す（用語集は保持） / Clear the context, keeping the glossary"""
+        self.entries.clear()
+        self.context = ''
+        self.context_tokens = 0
+        self.prompt = self.glossary
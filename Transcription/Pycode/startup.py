@@ -0,0 +1,194 @@
+"""起動の高速化と起動時間の計測 / Fast startup and startup timing
+
+重いモジュール（numpy、requests、PyAudio など）は lazy_import() で名前だけ用意し、
+最初に属性を使ったとき（最初の録音開始時）に読み込む。ウィンドウはその前に表示される。
+Heavy modules (numpy, requests, PyAudio, ...) are bound with lazy_import()
+and only loaded when one of their attributes is first used, i.e. when the
+first recording starts; the window appears before that.
+
+起動レポート: --startup-report（または環境変数 TRANSCRIBER_STARTUP_REPORT=1）で起動すると、
+フェーズごとの時間と、そのフェーズ中の import（入れ子を含む時間）の上位を表示する。
+--startup-report=path.json なら同じ内容を JSON で保存する。
+Startup report: started with --startup-report (or
+TRANSCRIBER_STARTUP_REPORT=1), the time of each phase is printed together
+with the slowest imports during that phase (nested imports included).
+--startup-report=path.json also saves the same data as JSON.
+
+    import startup
+    startup.begin(sys.argv)     # アプリの import より前に / before the app's own imports
+    ...
+    startup.mark('imports')
+"""
+import builtins
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+
+START = time.perf_counter()
+REPORT_FLAG = '--startup-report'
+
+report = None   # 計測中の StartupReport（無効なら None） / Active StartupReport, None when disabled
+
+
+def lazy_import(name):
+    """属性に初めて触れたときに読み込まれるモジュール / A module that is loaded on first attribute access
+
+    見つからないモジュールはその場で ModuleNotFoundError（起動直後に分かるように）。
+    読み込み済みのモジュールや、遅延読み込みに対応しないローダーでは通常の import と同じ。
+    A missing module raises ModuleNotFoundError right away, so it still shows
+    at startup. Modules already loaded, and loaders without exec_module, are
+    imported normally.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    if spec.loader is None or not hasattr(spec.loader, 'exec_module'):
+        return importlib.import_module(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def is_loaded(name):
+    """モジュールが実際に実行済みか（遅延のまま、未読み込みなら False） / Whether a module has really been executed (False while lazy or absent)"""
+    module = sys.modules.get(name)
+    return module is not None and type(module).__name__ != '_LazyModule'
+
+
+class ImportTimer:
+    """メインスレッドの import ごとの所要時間 / Time taken by each import on the main thread
+
+    builtins.__import__ を包み、まだ読み込まれていないモジュールだけを記録する。
+    total は入れ子の import を含む時間、self はそれを除いた時間。
+    Wraps builtins.__import__ and records modules that were not loaded yet.
+    total includes nested imports; self excludes them.
+    """
+    def __init__(self):
+        self.records = []   # (名前, total秒, self秒, 深さ) / (name, total s, self s, depth)
+        self.stack = []     # 実行中の import ごとの子の合計 / Child time of each import in progress
+        self.original = None
+        self.thread = threading.main_thread()
+
+    def install(self):
+        if self.original is None:
+            self.original = builtins.__import__
+            builtins.__import__ = self.timed_import
+
+    def uninstall(self):
+        if self.original is not None:
+            builtins.__import__ = self.original
+            self.original = None
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules or threading.current_thread() is not self.thread:
+            return self.original(name, globals, locals, fromlist, level)
+        self.stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - started
+            children = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += total
+            self.records.append((name, total, total - children, len(self.stack)))
+
+
+class StartupReport:
+    """フェーズごとの起動時間と import の内訳 / Startup time per phase with its imports
+
+    mark(phase) は直前の mark からの時間をそのフェーズとして記録する。
+    finish() 以降の mark（最初の録音での遅延読み込みなど）はその場で1件ずつ表示する。
+    mark(phase) records the time since the previous mark as that phase.
+    Marks after finish() (such as the deferred loading on the first
+    recording) are printed one by one as they happen.
+    """
+    def __init__(self, path=None, top=8):
+        self.path = path
+        self.top = top
+        self.timer = ImportTimer()
+        self.phases = []    # (名前, 秒, 起動からの秒, import の記録) / (name, s, s since start, import records)
+        self.last = START
+        self.imported = 0   # 前のフェーズまでの import 記録数 / Import records taken by earlier phases
+        self.finished = False
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        records = self.timer.records[self.imported:]
+        self.imported = len(self.timer.records)
+        self.phases.append((phase, now - self.last, now - START, records))
+        self.last = now
+        if self.finished:
+            print(self.format_phase(self.phases[-1]))
+            self.save()
+
+    def format_phase(self, entry):
+        phase, seconds, elapsed, records = entry
+        lines = [f"  {phase:<24} {seconds * 1000:8.1f} ms   (at {elapsed * 1000:8.1f} ms)"]
+        slowest = sorted(records, key=lambda record: record[1], reverse=True)[:self.top]
+        for name, total, own, depth in slowest:
+            lines.append(f"      import {name:<32} {total * 1000:8.1f} ms total {own * 1000:8.1f} ms self"
+                         + ('' if depth == 0 else f"  (nested {depth})"))
+        return '\n'.join(lines)
+
+    def finish(self):
+        """ウィンドウ表示までのレポートを表示 / Print the report up to the window being shown"""
+        self.finished = True
+        lines = ["起動時間 / Startup timing:"]
+        lines += [self.format_phase(entry) for entry in self.phases]
+        lines.append(f"  {'total':<24} {(self.last - START) * 1000:8.1f} ms")
+        print('\n'.join(lines))
+        self.save()
+
+    def to_record(self):
+        return {'phases': [{'phase': phase, 'ms': round(seconds * 1000, 2), 'at_ms': round(elapsed * 1000, 2),
+                            'imports': [{'module': name, 'total_ms': round(total * 1000, 2),
+                                         'self_ms': round(own * 1000, 2), 'depth': depth}
+                                        for name, total, own, depth in records]}
+                           for phase, seconds, elapsed, records in self.phases]}
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_record(), f, ensure_ascii=False, indent=1)
+        except OSError as e:
+            print(f"起動レポートを保存できません / Could not save startup report: {e}")
+
+
+def begin(argv=()):
+    """指定があれば計測を始める（アプリの import より前に呼ぶ） / Start timing if requested (call before the app's imports)"""
+    global report
+    path = None
+    enabled = bool(os.environ.get('TRANSCRIBER_STARTUP_REPORT'))
+    for arg in argv:
+        if arg == REPORT_FLAG or arg.startswith(REPORT_FLAG + '='):
+            enabled = True
+            path = arg.partition('=')[2] or None
+    if enabled and report is None:
+        report = StartupReport(path)
+        report.timer.install()
+    return report
+
+
+def mark(phase):
+    """フェーズの区切り（計測していなければ何もしない） / End of a phase (no-op unless timing)"""
+    if report:
+        report.mark(phase)
+
+
+def finish():
+    """起動完了（ウィンドウ表示）でレポートを表示 / Print the report once the window is up"""
+    if report and not report.finished:
+        report.finish()
@@ -0,0 +1,79 @@
+"""SRT / WebVTT 字幕の書き出し / SRT and WebVTT subtitle export
+
+キューの時刻はチャンクのサンプル位置（セッション開始からの秒）から決まるため、
+表示時刻ではなく実際に話された時刻に揃う。キューは届いた順に1つずつ書き込み、フラッシュする。
+Cue times come from each chunk's sample offset (seconds since the session
+started), so they line up with when the words were spoken rather than when
+they were displayed. Cues are written and flushed one at a time as they arrive.
+
+    writer = SubtitleWriter('meeting.srt')
+    writer.add(chunk.start_sample / RATE, chunk.end_sample / RATE, text)
+    writer.close()
+"""
+import os
+import re
+
+FORMATS = ('srt', 'vtt')
+
+
+def format_timestamp(seconds, separator=','):
+    """秒を HH:MM:SS,mmm に（WebVTT は separator='.'） / Format seconds as HH:MM:SS,mmm (separator='.' for WebVTT)"""
+    milliseconds = max(int(round(seconds * 1000)), 0)
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def format_for_path(path):
+    """拡張子から形式を判定 / Pick the format from the file extension"""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension not in FORMATS:
+        raise ValueError(f"unknown subtitle format: {path} (use .srt or .vtt)")
+    return extension
+
+
+class SubtitleWriter:
+    """字幕ファイルへキューを逐次追記 / Append cues to a subtitle file as they come
+
+    重なりのあるチャンクでもキューが重ならないよう、開始は同じ track の直前のキューの終了以降にずらす。
+    複数の入力ソースは track を分けるため、話者どうしのキューは重なってよい。
+    Overlapping chunks would give overlapping cues, so each cue starts no
+    earlier than the previous cue of the same track ended. Input sources use
+    separate tracks, so different speakers' cues may overlap.
+    """
+    def __init__(self, path, format=None, min_duration=0.5):
+        self.path = path
+        self.format = format or format_for_path(path)
+        if self.format not in FORMATS:
+            raise ValueError(f"unknown subtitle format: {self.format}")
+        self.min_duration = min_duration
+        self.index = 0
+        self.last_end = {}      # track -> 直前のキューの終了 / end of the track's previous cue
+        self.file = open(path, 'w', encoding='utf-8')
+        if self.format == 'vtt':
+            self.file.write("WEBVTT\n\n")
+            self.file.flush()
+
+    def add(self, start, end, text, track=None):
+        """1つのキューを書き込む（時刻は秒） / Write one cue (times in seconds)"""
+        # 空行はキューの終わりを意味するため詰める / A blank line would end the cue early
+        text = re.sub(r'\n\s*\n', '\n', text.strip())
+        if not text:
+            return
+        if self.format == 'vtt':
+            text = text.replace('-->', '->')
+        start = max(start, self.last_end.get(track, 0.0))
+        end = max(end, start + self.min_duration)
+        self.index += 1
+        separator = ',' if self.format == 'srt' else '.'
+        header = f"{self.index}\n" if self.format == 'srt' else ''
+        self.file.write(f"{header}{format_timestamp(start, separator)} --> "
+                        f"{format_timestamp(end, separator)}\n{text}\n\n")
+        self.file.flush()
+        self.last_end[track] = end
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
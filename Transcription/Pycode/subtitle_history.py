@@ -0,0 +1,157 @@
+"""上限付きの字幕履歴 / Bounded subtitle history
+
+Text ウィジェットには最大 max_lines 行だけを置き、すべての行はディスク上の LineStore に書く。
+ユーザーが上端までスクロールすると古い行をページ単位で読み戻し、下端に戻ると新しい行を読み込む。
+長時間のセッションでもウィジェットの行数（メモリと描画コスト）は一定に保たれる。
+The Text widget holds at most max_lines lines; every line is also written to
+an on-disk LineStore. Scrolling to the top pages older lines back in, and
+scrolling back to the bottom pages newer ones in again, so the widget's size
+(memory and render cost) stays flat however long the session runs.
+"""
+import tempfile
+import tkinter as tk
+from array import array
+
+
+class LineStore:
+    """追記専用の行ファイル（行ごとのオフセットのみメモリに保持） / Append-only line file; only per-line offsets stay in memory
+
+    path が None なら閉じると消える一時ファイルを使う。
+    With path None a temporary file is used that disappears on close.
+    """
+    def __init__(self, path=None):
+        if path:
+            self.file = open(path, 'w+b')
+        else:
+            self.file = tempfile.TemporaryFile('w+b')
+        self.offsets = array('q', [0])   # 各行の開始位置と末尾 / Start of each line, plus the end
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def append(self, line):
+        data = line.replace('\n', ' ').encode('utf-8') + b'\n'
+        self.file.seek(self.offsets[-1])
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def lines(self, start, stop):
+        """start 行目から stop 行目の手前までを返す / Return lines start..stop-1"""
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        self.file.flush()
+        self.file.seek(self.offsets[start])
+        data = self.file.read(self.offsets[stop] - self.offsets[start])
+        return data.decode('utf-8').splitlines()
+
+    def close(self):
+        self.file.close()
+
+
+class SubtitleHistory:
+    """Text ウィジェットを LineStore の一部を映す窓として扱う / Treat a Text widget as a window onto a LineStore
+
+    ウィジェットには store の [first, last) 行が表示される。last が store の末尾なら新しい行を追記し続け、
+    ユーザーが古い行を読み込んでいる間は新しい行は store にだけ書かれる。メインスレッドからのみ呼ぶ。
+    The widget shows store lines [first, last). While last is the end of the
+    store new lines are appended to the widget; while the user has paged back
+    into older lines, new lines only go to the store. Main thread only.
+    """
+    def __init__(self, widget, scrollbar=None, max_lines=500, page_lines=100, spill_path=None):
+        self.widget = widget
+        self.scrollbar = scrollbar
+        self.max_lines = max_lines
+        self.page_lines = page_lines
+        self.store = LineStore(spill_path)
+        self.first = 0
+        self.last = 0
+        self.paging_scheduled = False
+        widget.configure(yscrollcommand=self.on_view_changed)
+
+    @property
+    def following(self):
+        """最新行まで表示しているか / Whether the widget reaches the newest line"""
+        return self.last == len(self.store)
+
+    def append(self, lines):
+        """行を追加（最新行を表示中ならウィジェットにも追加） / Add lines, and to the widget too when it shows the newest line"""
+        following = self.following
+        for line in lines:
+            self.store.append(line)
+        if not following or not lines:
+            return
+        at_bottom = self.widget.yview()[1] >= 0.999
+        top = self.top_line()
+        self.widget.insert(tk.END, ''.join(line.replace('\n', ' ') + '\n' for line in lines))
+        self.last = len(self.store)
+        removed = self.trim_top()
+        if at_bottom:
+            self.widget.see(tk.END)
+        else:
+            self.widget.yview(f"{max(top - removed, 1)}.0")
+
+    def top_line(self):
+        """表示中の先頭行（ウィジェットの行番号） / First visible line (widget line number)"""
+        return int(self.widget.index('@0,0').split('.')[0])
+
+    def trim_top(self):
+        """上限を超えた古い行をウィジェットから削除 / Drop the oldest lines beyond the cap from the widget"""
+        excess = (self.last - self.first) - self.max_lines
+        if excess <= 0:
+            return 0
+        self.widget.delete('1.0', f"{excess + 1}.0")
+        self.first += excess
+        return excess
+
+    def trim_bottom(self):
+        """上限を超えた新しい行をウィジェットから削除 / Drop the newest lines beyond the cap from the widget"""
+        excess = (self.last - self.first) - self.max_lines
+        if excess <= 0:
+            return 0
+        self.widget.delete(f"{self.max_lines + 1}.0", tk.END)
+        self.last -= excess
+        return excess
+
+    def on_view_changed(self, first, last):
+        """yscrollcommand: スクロールバーを更新し、端に達したらページ読み込みを予約 / Update the scrollbar and schedule paging at either edge"""
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        first, last = float(first), float(last)
+        at_top = first <= 0.0 and last < 1.0 and self.first > 0
+        at_bottom = last >= 1.0 and first > 0.0 and not self.following
+        if (at_top or at_bottom) and not self.paging_scheduled:
+            # 描画中の変更を避けるためアイドル時に実行 / Defer to idle time so the widget is not changed mid-redraw
+            self.paging_scheduled = True
+            self.widget.after_idle(self.page)
+
+    def page(self):
+        self.paging_scheduled = False
+        first, last = self.widget.yview()
+        if first <= 0.0 and self.first > 0:
+            self.page_older()
+        elif last >= 1.0 and not self.following:
+            self.page_newer()
+
+    def page_older(self):
+        """古い行を1ページ分先頭に読み戻す / Page older lines back in above the current view"""
+        start = max(self.first - self.page_lines, 0)
+        lines = self.store.lines(start, self.first)
+        self.widget.insert('1.0', ''.join(line + '\n' for line in lines))
+        self.first = start
+        self.trim_bottom()
+        # 読み込み前に見ていた行を先頭に保つ / Keep the line that was on top in view
+        self.widget.yview(f"{len(lines) + 1}.0")
+
+    def page_newer(self):
+        """新しい行を1ページ分末尾に読み込む / Page newer lines in below the current view"""
+        top = self.top_line()
+        lines = self.store.lines(self.last, self.last + self.page_lines)
+        self.widget.insert(tk.END, ''.join(line + '\n' for line in lines))
+        self.last += len(lines)
+        removed = self.trim_top()
+        self.widget.yview(f"{max(top - removed, 1)}.0")
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,148 @@
+"""チャンクキューの方針とラウンドロビン / Chunk queue policies and round-robin
+
+    python -m pytest tests
+"""
+import os
+import queue
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_processing import AudioChunk, PCMRingBuffer
+from transcription_pipeline import ChunkQueue, FairChunkQueue, ReorderBuffer
+
+RATE = 1000
+CHUNK = 1000    # 1秒 / One second
+
+
+def capture(buffer, seconds):
+    """リングバッファに無音を書き込む / Write silence into the ring buffer"""
+    buffer.write(np.zeros(int(seconds * RATE), dtype=np.int16))
+
+
+def make_chunk(buffer, seq, source=None):
+    """seq 番目の1秒チャンク（先に capture しておく） / The seq-th one-second chunk (capture it first)"""
+    start = seq * CHUNK
+    chunk = AudioChunk(buffer.view(start, CHUNK), start, buffer, seq)
+    chunk.source = source
+    return chunk
+
+
+def test_merged_chunk_keeps_last_seq():
+    buffer = PCMRingBuffer(RATE * 60)
+    removed = []
+    chunk_queue = ChunkQueue(RATE, maxsize=2, policy='merge', stale_after=30.0,
+                             on_drop=lambda chunk, reason: removed.append((chunk.seq, reason)))
+    capture(buffer, 3)
+    for seq in range(3):
+        chunk_queue.put(make_chunk(buffer, seq))
+
+    merged = chunk_queue.get(timeout=0)
+    assert merged.seq == 2
+    assert (merged.start_sample, merged.end_sample) == (0, 3 * CHUNK)
+    assert removed == [(0, 'merged'), (1, 'merged')]
+    assert chunk_queue.stats == {'dropped': 0, 'merged': 2}
+    assert chunk_queue.empty()
+
+
+def test_merged_away_seqs_are_skipped_in_order():
+    """まとめられた番号は空の結果で順番だけ進め、まとめたチャンクを待つ / Merged-away seqs only advance the order; the merged chunk is still awaited"""
+    buffer = PCMRingBuffer(RATE * 60)
+    released = []
+    reorder = ReorderBuffer(lambda chunk, result: released.append((chunk.seq, result)))
+    chunk_queue = ChunkQueue(RATE, maxsize=2, policy='merge', stale_after=30.0,
+                             on_drop=lambda chunk, reason: reorder.put(chunk.seq, chunk, None))
+    capture(buffer, 4)
+    for seq in range(3):
+        chunk_queue.put(make_chunk(buffer, seq))
+    merged = chunk_queue.get(timeout=0)
+    chunk_queue.put(make_chunk(buffer, 3))
+    later = chunk_queue.get(timeout=0)
+
+    # 後のチャンクが先に終わっても、まとめたチャンクより前には出ない / A later chunk finishing first still waits for the merged one
+    reorder.put(later.seq, later, 'later')
+    assert released == [(0, None), (1, None)]
+    reorder.put(merged.seq, merged, 'merged')
+    assert released == [(0, None), (1, None), (2, 'merged'), (3, 'later')]
+
+
+def test_drop_oldest_drops_only_stale_heads():
+    buffer = PCMRingBuffer(RATE * 60)
+    removed = []
+    chunk_queue = ChunkQueue(RATE, maxsize=8, policy='drop_oldest', stale_after=2.0,
+                             on_drop=lambda chunk, reason: removed.append((chunk.seq, reason)))
+    capture(buffer, 4)
+    for seq in range(4):
+        chunk_queue.put(make_chunk(buffer, seq))
+    capture(buffer, 1.5)
+
+    # 末尾は 5.5 秒、遅れは seq 0: 4.5s、1: 3.5s、2: 2.5s、3: 1.5s / Capture is at 5.5 s, so seqs 0-2 trail by more than 2 s
+    assert chunk_queue.get(timeout=0).seq == 3
+    assert removed == [(0, 'dropped'), (1, 'dropped'), (2, 'dropped')]
+    assert chunk_queue.stats == {'dropped': 3, 'merged': 0}
+
+
+def test_drop_oldest_keeps_fresh_chunks():
+    buffer = PCMRingBuffer(RATE * 60)
+    chunk_queue = ChunkQueue(RATE, maxsize=8, policy='drop_oldest', stale_after=5.0)
+    capture(buffer, 3)
+    for seq in range(3):
+        chunk_queue.put(make_chunk(buffer, seq))
+    assert [chunk_queue.get(timeout=0).seq for _ in range(3)] == [0, 1, 2]
+    assert chunk_queue.stats == {'dropped': 0, 'merged': 0}
+
+
+def test_skip_stale_sends_everything_until_full():
+    buffer = PCMRingBuffer(RATE * 60)
+    chunk_queue = ChunkQueue(RATE, maxsize=3, policy='skip_stale', stale_after=0.5)
+    capture(buffer, 4)
+    for seq in range(4):
+        chunk_queue.put(make_chunk(buffer, seq))
+    capture(buffer, 10)
+    # 上限超過で最古だけ捨て、遅れたチャンクもそのまま送る / Only the oldest goes past maxsize; stale chunks are still sent
+    assert [chunk_queue.get(timeout=0).seq for _ in range(3)] == [1, 2, 3]
+    assert chunk_queue.stats == {'dropped': 1, 'merged': 0}
+    with pytest.raises(queue.Empty):
+        chunk_queue.get(timeout=0)
+
+
+def test_round_robin_does_not_starve_a_source():
+    fair = FairChunkQueue()
+    noisy_buffer, quiet_buffer = PCMRingBuffer(RATE * 60), PCMRingBuffer(RATE * 60)
+    noisy = fair.add(RATE, maxsize=8, policy='skip_stale', stale_after=30.0)
+    quiet = fair.add(RATE, maxsize=8, policy='skip_stale', stale_after=30.0)
+    capture(noisy_buffer, 6)
+    capture(quiet_buffer, 2)
+    for seq in range(6):
+        noisy.put(make_chunk(noisy_buffer, seq, 'noisy'))
+    for seq in range(2):
+        quiet.put(make_chunk(quiet_buffer, seq, 'quiet'))
+
+    order = [fair.get(timeout=0) for _ in range(8)]
+    # 静かなソースは交互に順番が回る / The quiet source gets every other turn
+    assert [(chunk.source, chunk.seq) for chunk in order[:4]] == [('noisy', 0), ('quiet', 0), ('noisy', 1), ('quiet', 1)]
+    assert [chunk.seq for chunk in order[4:]] == [2, 3, 4, 5]
+    assert fair.empty()
+    with pytest.raises(queue.Empty):
+        fair.get(timeout=0)
+
+
+def test_round_robin_skips_a_source_emptied_by_staleness():
+    """古いチャンクしかないソースは捨てたうえで次のソースから取る / A source holding only stale chunks is emptied and the next source is served"""
+    fair = FairChunkQueue()
+    stale_buffer, live_buffer = PCMRingBuffer(RATE * 60), PCMRingBuffer(RATE * 60)
+    stale = fair.add(RATE, policy='drop_oldest', stale_after=2.0)
+    live = fair.add(RATE, policy='drop_oldest', stale_after=2.0)
+    capture(stale_buffer, 1)
+    stale.put(make_chunk(stale_buffer, 0, 'stale'))
+    capture(stale_buffer, 5)
+    capture(live_buffer, 1)
+    live.put(make_chunk(live_buffer, 0, 'live'))
+
+    chunk = fair.get(timeout=0)
+    assert chunk.source == 'live'
+    assert fair.stats == {'dropped': 1, 'merged': 0}
+    assert fair.empty()
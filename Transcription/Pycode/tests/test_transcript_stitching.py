@@ -0,0 +1,60 @@
+"""重なりテキスト結合のコーパス / Corpus for transcript stitching
+
+各ケースは (前のテキスト, 新しいテキスト, 期待する出力)。
+Each case is (previous text, new text, expected output).
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcript_stitching import TranscriptStitcher
+
+CORPUS = [
+    # 日本語：完全一致の重なり / Japanese, exact overlap
+    ("今日は会議の議題について説明します", "説明します。まず最初に予算の話です", "まず最初に予算の話です"),
+    # 日本語：句読点と表記ゆれ / Japanese, punctuation and small variation
+    ("それでは始めましょう。よろしくお願いします。", "よろしくお願いしますそれでは資料をご覧ください", "それでは資料をご覧ください"),
+    ("次の四半期の売上目標は", "売り上げ目標は前年比十パーセント増です", "前年比十パーセント増です"),
+    # 日本語：重なりなし / Japanese, no overlap
+    ("ありがとうございました", "次の発表者は田中さんです", "次の発表者は田中さんです"),
+    # 日本語：全体が重複 / Japanese, new text fully duplicated
+    ("本日はお集まりいただきありがとうございます", "ありがとうございます", ""),
+    # 全角・半角の違い / Full-width vs half-width
+    ("ＡＰＩの応答時間は", "APIの応答時間は200ミリ秒です", "200ミリ秒です"),
+    # 中国語 / Chinese
+    ("我们今天讨论一下项目进度", "项目进度，目前已经完成了一半", "目前已经完成了一半"),
+    # 韓国語（空白区切り） / Korean (space separated)
+    ("오늘 회의를 시작하겠습니다", "시작하겠습니다 먼저 일정을 확인하죠", "먼저 일정을 확인하죠"),
+    # 英語：単語単位の重なり / English, word overlap
+    ("Let's move on to the next item on the agenda", "on the agenda, which is the budget review", "which is the budget review"),
+    # 英語：大文字小文字・句読点の違い / English, case and punctuation differences
+    ("We need to finish this by Friday.", "by friday we also need the report", "we also need the report"),
+    # 英語：綴りのゆれ（あいまい一致） / English, spelling variation (fuzzy match)
+    ("the colour of the new logo", "color of the new logo is blue", "is blue"),
+    # 英語：単語の途中では切らない / English, never cut inside a word
+    ("I think it was a bit", "it is fine now", "it is fine now"),
+    # 英語：重なりなし / English, no overlap
+    ("Thank you everyone", "Next slide please", "Next slide please"),
+    # 空テキスト / Empty text
+    ("こんにちは", "", ""),
+]
+
+
+@pytest.mark.parametrize('previous, new, expected', CORPUS)
+def test_stitch_corpus(previous, new, expected):
+    stitcher = TranscriptStitcher()
+    stitcher.push(previous)
+    assert stitcher.stitch(new) == expected
+
+
+def test_stitch_commits_only_new_text():
+    """確定した部分は次のチャンクとの照合に使われる / The committed part is matched against the next chunk"""
+    stitcher = TranscriptStitcher()
+    stitcher.push("今日は会議の議題について説明します")
+    assert stitcher.stitch("説明します。まず最初に予算の話です") == "まず最初に予算の話です"
+    assert stitcher.stitch("予算の話です。次に日程です") == "次に日程です"
@@ -0,0 +1,502 @@
+"""WebSocket 文字起こしサーバー / WebSocket transcription server
+
+複数のクライアント（ノートPCなど）からマイクのPCMを受け取り、APIキーを持つ1台のサーバーで
+セッションごとにチャンク分割・文字起こしを行い、結果をJSONで返す。
+Many clients (laptops) stream microphone PCM to one box that holds the API
+key. Each session gets its own chunking and transcription pipeline and
+receives its transcripts back as JSON.
+
+すべてのセッションは1つの asyncio イベントループで処理し、スレッドは同時リクエスト数と
+エンコード用の分だけ使う（クライアントごとのスレッドはない）。
+All sessions run on one asyncio event loop; threads are only used for the
+bounded number of in-flight API requests and for encoding, never per client.
+
+プロトコル / Protocol
+  クライアント → サーバー / client -> server
+    {"type": "config", "language": "ja", "keyword": "...", "prompt_lang": "ja", "mode": "vad"}
+        任意、最初のメッセージ / optional, first message
+    バイナリフレーム: 16kHz モノラル int16 リトルエンディアンPCM
+        binary frames: 16 kHz mono int16 little-endian PCM
+    {"type": "end"}  残りを処理して終了 / flush the remaining audio and finish
+  サーバー → クライアント / server -> client
+    {"type": "ready", "session": id, "rate": 16000}
+    {"type": "transcript", "seq": n, "start": s, "end": s, "text": "...", "latency_ms": ms}
+    {"type": "error", "message": "..."}
+    {"type": "done"}
+
+    python transcriber_server.py --port 8765 --concurrency 16
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import websockets
+    from websockets.asyncio.server import serve
+except ImportError:  # サーバーを使う場合のみ必要 / Only needed to run the server
+    websockets = None
+
+from audio_processing import PCMRingBuffer, FixedChunker, VoiceActivitySegmenter
+from transcription_pipeline import TranscriptionResult, ReorderBuffer
+from audio_encoding import create_encoder, encode_chunk, EncoderStats
+from transcription_backends import create_backend
+from prompt_builder import PromptBuilder
+from transcript_stitching import TranscriptStitcher
+
+API_URL = "https://api.openai.com/v1/audio/transcriptions"
+LANGUAGES = ('ja', 'en', 'zh', 'ko', 'es', 'fr', 'de', 'ru', 'auto')
+
+
+class TranscriptionSession:
+    """1クライアント分のパイプライン状態 / Pipeline state for one client
+
+    イベントループのスレッドからのみ操作する。
+    Only touched from the event loop thread.
+    """
+    def __init__(self, session_id, connection, buffer, chunker, prompt_budget=160):
+        self.id = session_id
+        self.connection = connection
+        self.buffer = buffer
+        self.chunker = chunker
+        self.language = 'auto'
+        self.keyword = ''
+        self.prompt_lang = 'ja'
+
+        self.ready = deque()        # エンコード済み・送信待ちのチャンク / Encoded chunks waiting for a request slot
+        self.in_flight = 0
+        self.scheduled = False      # スケジューラの待ち行列に入っているか / Whether it sits in the scheduler's round-robin queue
+        self.closed = False
+        self.next_seq = 0
+        self.leftover = b''         # 奇数長フレームの端数バイト / Stray byte of an odd-length frame
+        self.reorder = ReorderBuffer(self.release)
+        self.progress = asyncio.Event()    # リクエスト完了ごとにセット / Set whenever a request finishes
+        self.outbox = asyncio.Queue()
+
+        self.stitcher = TranscriptStitcher()
+        self.last_committed_end = 0
+        self.prompt_budget = prompt_budget
+        self.prompts = PromptBuilder(self.prompt_lang, self.keyword, prompt_budget)
+
+        self.started = time.monotonic()
+        self.received_samples = 0
+        self.rate = 16000
+
+    @property
+    def backlog(self):
+        """送信待ち・処理中・順序待ちのチャンク数 / Chunks ready, in flight, or waiting for reordering"""
+        return len(self.ready) + self.in_flight + len(self.reorder)
+
+    def configure_prompt(self, keyword, prompt_lang):
+        """キーワードとプロンプト言語を変更（文脈は引き継ぐ） / Change the keyword and prompt language, keeping the context"""
+        if (keyword, prompt_lang) == (self.keyword, self.prompt_lang):
+            return
+        self.keyword = keyword
+        self.prompt_lang = prompt_lang
+        previous = self.prompts
+        self.prompts = PromptBuilder(prompt_lang, keyword, self.prompt_budget)
+        for text, _ in previous.entries:
+            self.prompts.add(text)
+
+    def build_prompt(self):
+        """用語集と直近の文脈（予算内） / Glossary plus recent context, within the budget"""
+        return self.prompts.build()
+
+    def release(self, chunk, result):
+        """捕捉順に並んだ結果を重複除去して送信キューへ / Stitch an in-order result and queue it for sending"""
+        if self.closed or result is None or not result.text:
+            return
+        if chunk.start_sample < self.last_committed_end:
+            text = self.stitcher.stitch(result.text)
+        else:
+            text = self.stitcher.push(result.text)
+        self.last_committed_end = chunk.end_sample
+        if not text:
+            return
+        self.prompts.add(text)
+        self.outbox.put_nowait({
+            'type': 'transcript',
+            'seq': chunk.seq,
+            'start': round(chunk.start_sample / self.rate, 3),
+            'end': round(chunk.end_sample / self.rate, 3),
+            'text': text,
+            'latency_ms': result.latency_ms,
+        })
+
+
+class FairScheduler:
+    """セッション間のラウンドロビンでリクエスト枠を割り当てる / Hand out request slots round-robin across sessions
+
+    送信待ちチャンクを持つセッションは待ち行列に1回だけ並び、1チャンク送ると末尾に戻る。
+    1セッションの同時リクエスト数は per_session に制限されるため、
+    大量に送ってくるクライアントが他のセッションを待たせることはない。
+    A session with ready chunks sits in the queue once and goes back to the
+    end after each chunk it sends. Each session is also capped at per_session
+    requests in flight, so a chatty client cannot starve the others.
+    """
+    def __init__(self, dispatch, slots, per_session=2):
+        self.dispatch = dispatch
+        self.slots = asyncio.Semaphore(slots)
+        self.per_session = per_session
+        self.queue = deque()
+        self.wakeup = asyncio.Event()
+
+    def notify(self, session):
+        """送信可能になったセッションを待ち行列へ / Queue a session that can send now"""
+        if (not session.scheduled and not session.closed and session.ready
+                and session.in_flight < self.per_session):
+            session.scheduled = True
+            self.queue.append(session)
+            self.wakeup.set()
+
+    async def run(self):
+        """枠が空くたびに次のセッションのチャンクを1つ送る / Send the next session's chunk whenever a slot frees up"""
+        while True:
+            await self.slots.acquire()
+            while not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            session = self.queue.popleft()
+            session.scheduled = False
+            if session.closed or not session.ready:
+                self.slots.release()
+                continue
+            chunk = session.ready.popleft()
+            session.in_flight += 1
+            self.notify(session)
+            asyncio.ensure_future(self.run_one(session, chunk))
+
+    async def run_one(self, session, chunk):
+        try:
+            await self.dispatch(session, chunk)
+        finally:
+            session.in_flight -= 1
+            self.slots.release()
+            session.progress.set()
+            self.notify(session)
+
+
+class RealtimeTranscriberServer:
+    """サーバー側実装 / Server-side implementation - WebSocket streaming transcription service"""
+    def __init__(self, api_key, websocket_port=8765, host='0.0.0.0'):
+        self.api_key = api_key
+        self.websocket_port = websocket_port
+        self.host = host
+        self.api_url = API_URL
+        self.model = 'gpt-4o-transcribe'
+        self.TRANSCRIPTION_BACKEND = 'openai'  # 'openai' または オフライン用の 'fake' / 'openai', or 'fake' for offline runs
+        self.BACKEND_OPTIONS = {}
+
+        # 音声・分割設定（GUIと同じ既定値） / Audio and segmentation settings (same defaults as the GUI)
+        self.RATE = 16000
+        self.SEGMENTATION_MODE = 'vad'     # 'vad' または 'fixed' / 'vad' or 'fixed'
+        self.CHUNK_DURATION = 4.0
+        self.OVERLAP_DURATION = 0.8
+        self.MIN_SEGMENT_DURATION = 1.0
+        self.MAX_SEGMENT_DURATION = 10.0
+        self.SILENCE_DURATION = 0.5
+        self.UPLOAD_FORMAT = 'flac'
+
+        # 容量・公平性の設定 / Capacity and fairness settings
+        self.MAX_SESSIONS = 500                # 同時接続数の上限 / Maximum concurrent sessions
+        self.MAX_CONCURRENT_REQUESTS = 16      # サーバー全体の同時APIリクエスト数 / API requests in flight across all sessions
+        self.SESSION_CONCURRENT_REQUESTS = 2   # 1セッションあたりの同時リクエスト数 / API requests in flight per session
+        self.ENCODER_THREADS = min(os.cpu_count() or 1, 4)
+
+        # 背圧の設定 / Backpressure settings
+        self.MAX_PENDING_CHUNKS = 6     # これを超えたらクライアントからの読み取りを止める / Stop reading from a client past this many pending chunks
+        self.REALTIME_FACTOR = 1.5      # 実時間の何倍まで受け付けるか / How much faster than real time a client may send
+        self.BURST_DURATION = 5.0       # 実時間を超えて先行できる秒数 / Seconds of audio a client may send ahead of real time
+        self.API_MAX_RETRIES = 3
+        self.API_ATTEMPT_TIMEOUT = 8.0
+        self.CHUNK_DEADLINE = 15.0
+        self.PROMPT_TOKEN_BUDGET = 160  # プロンプトのトークン上限（用語集＋文脈） / Prompt token budget (glossary + context)
+
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.stats = {'sessions': 0, 'peak_sessions': 0, 'rejected': 0, 'chunks': 0,
+                      'failed': 0, 'throttled_seconds': 0.0}
+        self.encoder_stats = EncoderStats()
+        self.backend = None
+        self.request_executor = None
+        self.encode_executor = None
+        self.encoder = None
+        self.scheduler = None
+        self.scheduler_task = None
+        self.server = None
+
+    def create_chunker(self, buffer, mode=None):
+        """区切り方式に応じたチャンカーを作成 / Create the chunker for the segmentation mode"""
+        if (mode or self.SEGMENTATION_MODE) == 'vad':
+            return VoiceActivitySegmenter(buffer, self.RATE,
+                                          silence_duration=self.SILENCE_DURATION,
+                                          min_segment=self.MIN_SEGMENT_DURATION,
+                                          max_segment=self.MAX_SEGMENT_DURATION)
+        return FixedChunker(buffer, int(self.RATE * self.CHUNK_DURATION), int(self.RATE * self.OVERLAP_DURATION))
+
+    def create_backend(self):
+        """設定に応じた文字起こしバックエンドを作成 / Create the transcription backend from the settings"""
+        if self.TRANSCRIPTION_BACKEND == 'openai':
+            return create_backend('openai',
+                                  api_key=self.api_key,
+                                  url=self.api_url,
+                                  model=self.model,
+                                  pool_size=self.MAX_CONCURRENT_REQUESTS,
+                                  max_retries=self.API_MAX_RETRIES,
+                                  attempt_timeout=self.API_ATTEMPT_TIMEOUT,
+                                  deadline=self.CHUNK_DEADLINE,
+                                  hedge=True,
+                                  failure_threshold=10)
+        return create_backend(self.TRANSCRIPTION_BACKEND, **self.BACKEND_OPTIONS)
+
+    def create_session(self, connection):
+        """セッションを作成 / Create a session
+
+        チャンクは切り出し直後にエンコードされるため、バッファは最長チャンク分より少し大きければよい。
+        Chunks are encoded right after they are cut, so the buffer only needs
+        to hold one longest chunk plus some margin; this keeps memory per
+        session small.
+        """
+        longest = max(self.CHUNK_DURATION + self.OVERLAP_DURATION, self.MAX_SEGMENT_DURATION)
+        buffer = PCMRingBuffer(int(self.RATE * (longest + 2.0)))
+        session = TranscriptionSession(next(self.session_ids), connection, buffer, self.create_chunker(buffer),
+                                       self.PROMPT_TOKEN_BUDGET)
+        session.rate = self.RATE
+        return session
+
+    async def start(self):
+        """サーバーとスケジューラを起動 / Start the server and the scheduler"""
+        if websockets is None:
+            raise RuntimeError("websockets パッケージが必要です / The websockets package is required")
+        self.backend = self.create_backend()
+        self.backend.warm_up()
+        self.request_executor = ThreadPoolExecutor(self.MAX_CONCURRENT_REQUESTS, thread_name_prefix='transcribe')
+        self.encode_executor = ThreadPoolExecutor(self.ENCODER_THREADS, thread_name_prefix='encode')
+        self.encoder = create_encoder(self.UPLOAD_FORMAT, self.RATE)
+        self.scheduler = FairScheduler(self.dispatch, self.MAX_CONCURRENT_REQUESTS, self.SESSION_CONCURRENT_REQUESTS)
+        self.scheduler_task = asyncio.ensure_future(self.scheduler.run())
+        # max_queue を小さくして、読み取りを止めたらすぐTCPで送信側を待たせる。
+        # PCMはほとんど圧縮できないため permessage-deflate は使わない。
+        # A small max_queue makes TCP push back on the client as soon as we stop
+        # reading. PCM barely compresses, so permessage-deflate is turned off.
+        self.server = await serve(self.handle_client, self.host, self.websocket_port,
+                                  max_size=1 << 20, max_queue=4, compression=None)
+        self.websocket_port = self.server.sockets[0].getsockname()[1]
+        print(f"文字起こしサーバーを起動しました / Transcription server listening on {self.host}:{self.websocket_port}")
+        return self.server
+
+    async def stop(self):
+        """サーバーを停止 / Stop the server"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.scheduler_task:
+            self.scheduler_task.cancel()
+            self.scheduler_task = None
+        for executor in (self.request_executor, self.encode_executor):
+            if executor:
+                executor.shutdown(wait=False)
+        if self.backend:
+            self.backend.close()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await asyncio.Future()
+        finally:
+            await self.stop()
+
+    def run(self):
+        """サーバーを実行（Ctrl+Cで終了） / Run the server until Ctrl+C"""
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            print("\nサーバーを停止しました / Server stopped")
+
+    async def handle_client(self, connection):
+        """1クライアントの受信ループ / Receive loop for one client"""
+        if len(self.sessions) >= self.MAX_SESSIONS:
+            self.stats['rejected'] += 1
+            await connection.close(1013, 'server full')
+            return
+        session = self.create_session(connection)
+        self.sessions[session.id] = session
+        self.stats['sessions'] += 1
+        self.stats['peak_sessions'] = max(self.stats['peak_sessions'], len(self.sessions))
+        sender = asyncio.ensure_future(self.send_loop(session))
+        session.outbox.put_nowait({'type': 'ready', 'session': session.id, 'rate': self.RATE})
+        try:
+            async for message in connection:
+                if isinstance(message, str):
+                    if not self.handle_control(session, message):
+                        break
+                else:
+                    await self.receive_audio(session, message)
+            else:
+                # 切断された場合は送信待ちを破棄 / Client went away: drop whatever is still waiting
+                session.closed = True
+            if not session.closed:
+                await self.finish(session)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            print(f"セッション{session.id}でエラーが発生しました / Session {session.id} error: {e}")
+        finally:
+            session.closed = True
+            session.ready.clear()
+            session.outbox.put_nowait(None)
+            await sender
+            del self.sessions[session.id]
+
+    def handle_control(self, session, message):
+        """制御メッセージを処理、終了要求なら False / Handle a control message, False on end"""
+        try:
+            control = json.loads(message)
+        except json.JSONDecodeError:
+            session.outbox.put_nowait({'type': 'error', 'message': 'invalid JSON'})
+            return True
+        kind = control.get('type')
+        if kind == 'end':
+            return False
+        if kind == 'config':
+            language = control.get('language', session.language)
+            if language not in LANGUAGES:
+                session.outbox.put_nowait({'type': 'error', 'message': f'unsupported language: {language}'})
+            else:
+                session.language = language
+            session.configure_prompt(str(control.get('keyword', session.keyword))[:200],
+                                     control.get('prompt_lang', session.prompt_lang))
+            mode = control.get('mode')
+            if mode in ('vad', 'fixed') and session.received_samples == 0:
+                session.chunker = self.create_chunker(session.buffer, mode)
+        return True
+
+    async def throttle(self, session, count):
+        """背圧：処理待ちが多いか実時間より速すぎる場合は読み取りを待たせる / Backpressure: hold off reading while too much is pending or the client is too far ahead of real time"""
+        # 処理待ちチャンクが捌けるまで待つ / Wait for pending chunks to drain
+        while session.backlog >= self.MAX_PENDING_CHUNKS and not session.closed:
+            session.progress.clear()
+            await session.progress.wait()
+
+        # 実時間×REALTIME_FACTOR＋バースト分を超えたら待つ / Pace to REALTIME_FACTOR x real time plus a burst allowance
+        rate = self.RATE * self.REALTIME_FACTOR
+        allowed = (time.monotonic() - session.started) * rate + self.BURST_DURATION * self.RATE
+        excess = session.received_samples + count - allowed
+        if excess > 0:
+            delay = excess / rate
+            self.stats['throttled_seconds'] += delay
+            await asyncio.sleep(delay)
+
+    async def receive_audio(self, session, message):
+        """PCMフレームをバッファに書き込み、切り出したチャンクをエンコードして送信待ちへ / Buffer a PCM frame, then encode and queue the chunks it completes"""
+        if session.leftover:
+            message = session.leftover + message
+            session.leftover = b''
+        if len(message) % 2:
+            session.leftover = message[-1:]
+            message = message[:-1]
+        samples = np.frombuffer(message, dtype='<i2')
+        if len(samples) == 0:
+            return
+        await self.throttle(session, len(samples))
+        session.buffer.write(samples)
+        session.received_samples += len(samples)
+        await self.enqueue(session, session.chunker.pop_chunks())
+
+    async def enqueue(self, session, chunks):
+        """チャンクをエンコードして送信待ちへ / Encode chunks and queue them for the scheduler
+
+        エンコードが終わるまで次のフレームを書き込まないので、ビューが上書きされることはない。
+        No further frames are written until encoding finishes, so views are never overwritten.
+        """
+        loop = asyncio.get_running_loop()
+        for chunk in chunks:
+            chunk.seq = session.next_seq
+            session.next_seq += 1
+            chunk.payload = await loop.run_in_executor(self.encode_executor, encode_chunk,
+                                                       self.encoder, chunk.samples, self.encoder_stats)
+            session.ready.append(chunk)
+            self.scheduler.notify(session)
+
+    async def dispatch(self, session, chunk):
+        """1チャンクを文字起こしし、結果を順序バッファへ / Transcribe one chunk and hand the result to the reorder buffer"""
+        prompt = session.build_prompt()
+        loop = asyncio.get_running_loop()
+        start_time = time.time()
+        try:
+            text = await loop.run_in_executor(self.request_executor, self.backend.transcribe,
+                                              chunk.payload, session.language, prompt)
+            result = TranscriptionResult(text, int((time.time() - start_time) * 1000), len(prompt))
+        except Exception as e:
+            print(f"セッション{session.id}のチャンク{chunk.seq}が失敗しました / Session {session.id} chunk {chunk.seq} failed: {e}")
+            self.stats['failed'] += 1
+            result = None
+        self.stats['chunks'] += 1
+        # 失敗しても順序を進める / Advance ordering even on failure
+        session.reorder.put(chunk.seq, chunk, result)
+
+    async def finish(self, session):
+        """残りの音声を処理し、すべての結果を返してから終了 / Flush remaining audio and wait for every result"""
+        await self.enqueue(session, session.chunker.flush())
+        while session.backlog and not session.closed:
+            session.progress.clear()
+            await session.progress.wait()
+        session.outbox.put_nowait({'type': 'done'})
+
+    async def send_loop(self, session):
+        """送信キューの内容を順にクライアントへ送る / Send queued messages to the client in order"""
+        while True:
+            message = await session.outbox.get()
+            if message is None:
+                return
+            try:
+                await session.connection.send(json.dumps(message, ensure_ascii=False))
+            except websockets.exceptions.ConnectionClosed:
+                session.closed = True
+                return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, default=16, help='API requests in flight across all sessions')
+    parser.add_argument('--max-sessions', type=int, default=500)
+    parser.add_argument('--mode', default='vad', choices=['vad', 'fixed'], help='default segmentation mode')
+    parser.add_argument('--format', default='flac', choices=['flac', 'opus', 'wav'], help='upload encoding')
+    parser.add_argument('--backend', default='openai', choices=['openai', 'fake'],
+                        help="'fake' answers offline with canned text")
+    parser.add_argument('--api-url', default=API_URL)
+    parser.add_argument('--api-key-file', default='API_Key.txt')
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key and args.backend == 'openai':
+        try:
+            with open(args.api_key_file, 'r', encoding='utf-8') as f:
+                api_key = f.read().strip()
+        except OSError as e:
+            print(f"APIキーを読み込めません / Cannot read API key: {e}")
+            return 1
+
+    server = RealtimeTranscriberServer(api_key, args.port, args.host)
+    server.api_url = args.api_url
+    server.MAX_CONCURRENT_REQUESTS = args.concurrency
+    server.MAX_SESSIONS = args.max_sessions
+    server.SEGMENTATION_MODE = args.mode
+    server.UPLOAD_FORMAT = args.format
+    server.TRANSCRIPTION_BACKEND = args.backend
+    server.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
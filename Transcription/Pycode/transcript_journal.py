@@ -0,0 +1,206 @@
+"""追記専用の文字起こしジャーナル / Append-only transcript journal
+
+確定した文字起こしを1行1レコードの JSONL に書く。書き込みは専用スレッドが行い、
+溜まったレコードをまとめて1回で書き（グループコミット）、fsync は一定間隔でのみ行うため、
+文字起こしスレッドがディスクI/Oを待つことはない。
+Committed transcripts are written as one JSON record per line. A dedicated
+writer thread drains whatever has queued up into a single write (group
+commit) and fsyncs only every fsync_interval seconds, so the transcription
+threads never wait on disk I/O.
+
+レコード / Records:
+    {"type": "session_start", "session": ..., "time": ..., "info": {...}}
+    {"type": "transcript", "session": ..., "seq": n, "start": s, "end": s, "text": ..., "time": ...}
+    （複数入力時は "source": ... も / plus "source": ... with several inputs）
+    {"type": "session_end", "session": ..., "time": ...}
+
+session_end のないセッションは異常終了したもので、次回起動時に recover_incomplete() で取り出せる。
+A session without session_end ended abnormally; recover_incomplete() returns it on the next start.
+
+開いているセッションがなくなる（正常終了、または復元したセッションを閉じる）たびにファイルを
+path.1 に移して新しく始めるため、ジャーナルと起動時の読み込みは直近のセッション分に収まる。
+Whenever no session is left open (a clean end, or closing a recovered
+session) the file moves to path.1 and a new one starts, so the journal,
+and what recovery reads at startup, stays within the latest session.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+_STOP = object()
+_ROTATE = object()
+
+
+def read_journal(path):
+    """ジャーナルのレコードを順に返す（途中で切れた最終行などは読み飛ばす） / Yield journal records, skipping a torn last line or other damage"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        for raw in f:
+            try:
+                record = json.loads(raw.decode('utf-8'))
+            except (UnicodeDecodeError, ValueError):
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def recover_incomplete(path):
+    """最後に異常終了したセッションを返す / Return the last session that never ended
+
+    戻り値は (session_start レコード, transcript レコードのリスト)、なければ None。
+    Returns (session_start record, list of transcript records), or None.
+    """
+    sessions = {}
+    order = []
+    for record in read_journal(path):
+        session = record.get('session')
+        kind = record.get('type')
+        if kind == 'session_start':
+            sessions[session] = (record, [])
+            order.append(session)
+        elif kind == 'transcript' and session in sessions:
+            sessions[session][1].append(record)
+        elif kind == 'session_end':
+            sessions.pop(session, None)
+    for session in reversed(order):
+        if session in sessions:
+            return sessions[session]
+    return None
+
+
+class TranscriptJournal:
+    """バックグラウンドで書き込む JSONL ジャーナル / JSONL journal written by a background thread
+
+    append() はどのスレッドからでも呼べ、キューに入れるだけで戻る。
+    append() may be called from any thread; it only enqueues the record.
+    """
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = path
+        self.previous_path = path + '.1'   # 直前の世代 / Previous generation
+        self.fsync_interval = fsync_interval
+        self.records = queue.SimpleQueue()
+        self.session = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8')
+        if self.file.tell() > 0 and not self.ends_with_newline():
+            # 異常終了で途中まで書かれた行を閉じる / Terminate a line torn by a crash
+            self.file.write('\n')
+        self.last_fsync = time.monotonic()
+        self.dirty = False     # fsync していない書き込みがあるか / Written but not yet fsynced
+        self.stats = {'records': 0, 'writes': 0, 'fsyncs': 0, 'rotations': 0}
+        self.thread = threading.Thread(target=self.writer_loop, name='journal', daemon=True)
+        self.thread.start()
+
+    def ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def append(self, record):
+        record.setdefault('time', datetime.now().isoformat(timespec='milliseconds'))
+        self.records.put(record)
+
+    def begin_session(self, **info):
+        """新しいセッションを開始 / Start a new session"""
+        if self.session:
+            self.end_session()
+        self.session = uuid.uuid4().hex[:12]
+        self.append({'type': 'session_start', 'session': self.session, 'info': info})
+        return self.session
+
+    def end_session(self, session=None, **info):
+        """セッションを正常終了として記録（開いているセッションがなくなればファイルを切り替える） / Mark a session as cleanly ended, rotating the file once no session is open"""
+        session = session or self.session
+        if session == self.session:
+            self.session = None
+        if session:
+            record = {'type': 'session_end', 'session': session}
+            record.update(info)
+            self.append(record)
+            if self.session is None:
+                self.records.put(_ROTATE)
+
+    def add_transcript(self, seq, text, start=None, end=None, source=None):
+        """確定した文字起こしを記録（source は複数入力時の入力名） / Record a committed transcript (source names the input when there are several)"""
+        record = {'type': 'transcript', 'session': self.session, 'seq': seq,
+                  'start': start, 'end': end, 'text': text}
+        if source:
+            record['source'] = source
+        self.append(record)
+
+    def writer_loop(self):
+        """書き込みスレッド本体 / Writer thread body"""
+        stopping = False
+        while not stopping:
+            try:
+                record = self.records.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                self.sync_if_due()
+                continue
+            # 溜まっている分をまとめて書く / Group-commit everything queued so far
+            batch = []
+            rotate = False
+            while True:
+                if record is _STOP:
+                    stopping = True
+                    break
+                if record is _ROTATE:
+                    rotate = True
+                    break
+                batch.append(json.dumps(record, ensure_ascii=False) + '\n')
+                try:
+                    record = self.records.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self.file.write(''.join(batch))
+                    self.file.flush()
+                    self.dirty = True
+                    self.stats['records'] += len(batch)
+                    self.stats['writes'] += 1
+                except OSError as e:
+                    print(f"ジャーナル書き込みエラー / Journal write error: {e}")
+            if rotate:
+                self.rotate()
+            else:
+                self.sync_if_due(force=stopping)
+
+    def rotate(self):
+        """同期して path.1 に移し、新しいファイルを開く（書き込みスレッド） / Sync, move the file to path.1 and open a new one (writer thread)"""
+        try:
+            self.sync_if_due(force=True)
+            self.file.close()
+            os.replace(self.path, self.previous_path)
+            self.stats['rotations'] += 1
+        except OSError as e:
+            print(f"ジャーナル切り替えエラー / Journal rotation error: {e}")
+        finally:
+            if self.file.closed:
+                self.file = open(self.path, 'a', encoding='utf-8')
+
+    def sync_if_due(self, force=False):
+        """未同期の書き込みがあり fsync_interval 秒経っていれば fsync / fsync pending writes once fsync_interval has passed"""
+        if self.dirty and (force or time.monotonic() - self.last_fsync >= self.fsync_interval):
+            self.dirty = False
+            try:
+                os.fsync(self.file.fileno())
+                self.stats['fsyncs'] += 1
+            except OSError as e:
+                print(f"ジャーナル同期エラー / Journal sync error: {e}")
+            self.last_fsync = time.monotonic()
+
+    def close(self):
+        """残りを書き出して閉じる / Write out what is left and close"""
+        if self.session:
+            self.end_session()
+        self.records.put(_STOP)
+        self.thread.join()
+        self.file.close()
@@ -0,0 +1,146 @@
+import unicodedata
+
+
+def is_unspaced(ch):
+    """単語を空白で区切らない文字（かな・漢字）か / Whether ch belongs to a script written without spaces (kana, CJK)"""
+    code = ord(ch)
+    return (0x3040 <= code <= 0x30FF      # ひらがな・カタカナ / Hiragana, Katakana
+            or 0x3400 <= code <= 0x4DBF   # CJK拡張A / CJK Extension A
+            or 0x4E00 <= code <= 0x9FFF   # CJK統合漢字 / CJK Unified Ideographs
+            or 0xF900 <= code <= 0xFAFF)  # CJK互換漢字 / CJK Compatibility Ideographs
+
+
+def normalize_with_index(text):
+    """照合用に正規化した文字列と元の位置の対応を返す / Normalize text for matching and keep original positions
+
+    NFKC・小文字化し、空白と句読点を除く。CJK文字はそのまま1文字ずつ残る。
+    Applies NFKC and lowercasing and drops whitespace and punctuation. CJK
+    characters stay as single characters, so no word segmentation is needed.
+    戻り値は（正規化文字, 元テキストでの終端位置, 単語の先頭か）の3つのリスト。
+    Returns three lists: normalized characters, end offset of each in the
+    original text, and whether each one starts a word.
+    """
+    chars = []
+    ends = []
+    starts = []
+    separated = True
+    for i, c in enumerate(text):
+        for n in unicodedata.normalize('NFKC', c).lower():
+            if n.isspace() or unicodedata.category(n)[0] in 'PSZ':
+                separated = True
+                continue
+            starts.append(separated or is_unspaced(n) or (bool(chars) and is_unspaced(chars[-1])))
+            chars.append(n)
+            ends.append(i + 1)
+            separated = False
+    return chars, ends, starts
+
+
+def align_overlap(previous, previous_starts, current, current_starts, max_error=0.3, min_overlap=2):
+    """previous の末尾と current の先頭の重なり長（正規化文字数）を求める / Find how much of current's head repeats previous's tail
+
+    previous の任意の位置から始まる接尾辞と current の接頭辞の編集距離を動的計画法で計算し、
+    誤り率 max_error 以下で最も良く一致する接頭辞の長さを返す（なければ0）。
+    一致の両端は単語境界に限る（かな・漢字は全位置が境界）。
+    Semi-global edit-distance alignment: a suffix of previous (free start)
+    against a prefix of current (free end). Returns the length of the best
+    matching prefix whose error rate is at most max_error, or 0. Both ends of
+    the match must fall on word boundaries; every kana/CJK position is one.
+    計算量は O(len(previous) * len(current))。呼び出し側で長さを制限する。
+    Work is O(len(previous) * len(current)); callers bound both lengths.
+    """
+    m = len(previous)
+    n = len(current)
+    if m == 0 or n == 0:
+        return 0
+
+    # row[j] = previous の接尾辞と current[:j] の最小編集距離、origin[j] = その接尾辞の開始位置
+    # row[j] = min edit distance of a previous suffix vs current[:j]; origin[j] = where that suffix starts
+    row = list(range(n + 1))
+    origin = [0] * (n + 1)
+    for i in range(1, m + 1):
+        prev_char = previous[i - 1]
+        diagonal = row[0]
+        diagonal_origin = origin[0]
+        # previous の単語境界からなら開始できる / Alignment may start at any word boundary of previous
+        row[0] = 0 if i < m and previous_starts[i] else n + m
+        origin[0] = i
+        for j in range(1, n + 1):
+            above = row[j]
+            above_origin = origin[j]
+            cost = diagonal if current[j - 1] == prev_char else diagonal + 1
+            source = diagonal_origin
+            if above + 1 < cost:
+                cost = above + 1
+                source = above_origin
+            if row[j - 1] + 1 < cost:
+                cost = row[j - 1] + 1
+                source = origin[j - 1]
+            row[j] = cost
+            origin[j] = source
+            diagonal = above
+            diagonal_origin = above_origin
+
+    best = 0
+    best_score = 0
+    for j in range(min_overlap, n + 1):
+        errors = row[j]
+        if errors > max_error * j:
+            continue
+        if origin[j] > 0 and not previous_starts[origin[j]]:
+            continue
+        if j < len(current_starts) and not current_starts[j]:
+            continue
+        score = j - 2 * errors
+        if score >= best_score:
+            best = j
+            best_score = score
+    return best
+
+
+class TranscriptStitcher:
+    """重なり音声による重複テキストを取り除く / Remove text duplicated by overlapping audio
+
+    確定済みテキストの末尾 window 文字と新しいテキストの先頭 window 文字だけを照合するため、
+    1チャンクあたりの処理量は一定。
+    Only the last `window` normalized characters of the committed text and the
+    first `window` of the new text are aligned, so work per chunk is bounded.
+    """
+    def __init__(self, window=48, max_error=0.3, min_overlap=2):
+        self.window = window
+        self.max_error = max_error
+        self.min_overlap = min_overlap
+        self.tail = []           # 確定済みテキスト末尾の正規化文字 / Normalized tail of the committed text
+        self.tail_starts = []    # 各文字が単語の先頭か / Whether each tail character starts a word
+
+    def reset(self):
+        self.tail = []
+        self.tail_starts = []
+
+    def commit(self, chars, starts):
+        self.tail = (self.tail + chars)[-self.window:]
+        self.tail_starts = (self.tail_starts + starts)[-self.window:]
+
+    def push(self, text):
+        """重なりのないテキストをそのまま確定 / Commit text that has no audio overlap"""
+        chars, _, starts = normalize_with_index(text)
+        self.commit(chars, starts)
+        return text
+
+    def stitch(self, text):
+        """重なり部分を除いた新しいテキストを返し確定 / Return and commit only the new part of text"""
+        chars, ends, starts = normalize_with_index(text)
+        overlap = align_overlap(self.tail, self.tail_starts, chars[:self.window], starts,
+                                self.max_error, self.min_overlap)
+        self.commit(chars[overlap:], starts[overlap:])
+        if overlap == 0:
+            return text
+        if overlap >= len(chars):
+            return ''
+        # 重なりの直後から切り出し、先頭の空白・句読点を除く / Cut right after the overlap, trimming leading spaces and punctuation
+        remainder = text[ends[overlap - 1]:]
+        start = 0
+        while start < len(remainder) and (remainder[start].isspace()
+                                          or unicodedata.category(remainder[start])[0] == 'P'):
+            start += 1
+        return remainder[start:]
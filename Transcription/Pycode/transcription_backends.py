@@ -0,0 +1,174 @@
+"""文字起こしバックエンド / Transcription backends
+
+パイプラインは TranscriptionBackend.transcribe() だけを呼ぶため、
+API の URL・モデル・リクエスト形式はバックエンドの中に閉じている。
+The pipeline only calls TranscriptionBackend.transcribe(), so the API URL,
+model and request format stay inside the backend.
+
+- 'openai': gpt-4o-transcribe への HTTP リクエスト（途中経過は server-sent events で受信）
+            HTTP requests to gpt-4o-transcribe, in-progress text streamed as server-sent events
+- 'fake':   オフライン用の決定的な代替（遅延分布・エラー率・固定テキストを設定可能）
+            deterministic offline stand-in with configurable latency
+            distribution, error rate and canned text
+"""
+import hashlib
+import random
+import threading
+import time
+
+from api_client import (PooledHTTPSession, ResilientTransport, CircuitBreaker, TranscriptionAPIError,
+                        request_transcription)
+
+OPENAI_API_URL = "https://api.openai.com/v1/audio/transcriptions"
+
+
+class TranscriptionBackend:
+    """文字起こしバックエンドの基底クラス / Base class for transcription backends
+
+    transcribe() は複数のワーカースレッドから同時に呼ばれる。
+    失敗時は TranscriptionAPIError（またはその他の例外）を送出する。
+    ストリーミングに対応するバックエンドは、on_partial があれば途中までのテキストで呼ぶ（対応しなければ無視）。
+    transcribe() is called from several worker threads at once and raises
+    TranscriptionAPIError (or any other exception) on failure. Backends that
+    can stream call on_partial, when given, with the text so far; others ignore it.
+    """
+    name = None
+
+    def warm_up(self):
+        """最初のチャンクの前に接続などを準備（任意） / Prepare connections before the first chunk (optional)"""
+
+    def transcribe(self, payload, language='auto', prompt='', on_partial=None):
+        """エンコード済み音声（EncodedAudio）を文字起こししてテキストを返す / Transcribe an EncodedAudio and return its text"""
+        raise NotImplementedError
+
+    def close(self):
+        """リソースを解放 / Release resources"""
+
+    @property
+    def stats(self):
+        """バックエンド固有の統計 / Backend-specific counters"""
+        return {}
+
+
+class OpenAIBackend(TranscriptionBackend):
+    """OpenAI 文字起こしAPI（接続プール＋再試行付き） / OpenAI transcription API over the pooled, resilient transport"""
+    name = 'openai'
+
+    def __init__(self, api_key, url=OPENAI_API_URL, model='gpt-4o-transcribe', pool_size=3,
+                 max_retries=3, attempt_timeout=10.0, deadline=15.0, hedge=False, failure_threshold=5):
+        self.api_key = api_key
+        self.url = url
+        self.model = model
+        self.pool_size = pool_size
+        # ヘッジは同じリクエストをもう1本送るため、接続も2倍用意する / A hedge sends a second copy of the request, so twice the connections
+        self.session = PooledHTTPSession(pool_size * 2 if hedge else pool_size)
+        self.transport = ResilientTransport(self.session,
+                                            max_retries=max_retries,
+                                            deadline=deadline,
+                                            attempt_timeout=attempt_timeout,
+                                            breaker=CircuitBreaker(failure_threshold=failure_threshold),
+                                            hedge=hedge)
+
+    def warm_up(self):
+        self.session.warm_up_async(self.url)
+
+    def transcribe(self, payload, language='auto', prompt='', on_partial=None):
+        return request_transcription(self.transport, self.url, self.api_key, payload,
+                                     language, prompt, self.model, on_partial)
+
+    def close(self):
+        self.transport.close()
+        self.session.close()
+
+    @property
+    def stats(self):
+        with self.transport.stats_lock:
+            return dict(self.transport.stats)
+
+
+class FakeBackend(TranscriptionBackend):
+    """ネットワークを使わない決定的な代替バックエンド / Deterministic backend that never touches the network
+
+    遅延・エラーの有無・返すテキストは seed と音声データのハッシュから決まるため、
+    同じ入力なら呼び出し順やスレッド数に関係なく同じ結果になる。
+    Latency, whether the call fails and which text comes back are all derived
+    from seed and a hash of the audio bytes, so the same input gives the same
+    result regardless of call order or thread count.
+    on_partial があれば、遅延を STREAM_PIECES 回に分けてテキストを少しずつ渡す。
+    With on_partial the text is handed over in STREAM_PIECES steps spread across the latency.
+
+    distribution:
+      'fixed'      常に latency 秒 / always latency seconds
+      'uniform'    latency ± jitter
+      'normal'     平均 latency、標準偏差 jitter / mean latency, std dev jitter
+      'lognormal'  中央値 latency、対数標準偏差 jitter（裾の重い分布） / median latency, log std dev jitter (heavy tail)
+    """
+    name = 'fake'
+    DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'lognormal')
+    STREAM_PIECES = 4
+
+    def __init__(self, latency=0.3, jitter=0.1, distribution='normal', error_rate=0.0,
+                 text="これはテスト用の文字起こしです。", seed=0):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"unknown latency distribution: {distribution}")
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self.texts = [text] if isinstance(text, str) else list(text)
+        self.seed = seed
+        self.calls = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def rng_for(self, payload):
+        """音声データごとの乱数生成器 / Random generator keyed by the audio bytes"""
+        digest = hashlib.blake2b(payload.data, digest_size=8, key=str(self.seed).encode()).digest()
+        return random.Random(int.from_bytes(digest, 'big'))
+
+    def sample_latency(self, rng):
+        """設定された分布から遅延（秒）を引く / Draw a latency in seconds from the configured distribution"""
+        if self.distribution == 'fixed':
+            return self.latency
+        if self.distribution == 'uniform':
+            return max(rng.uniform(self.latency - self.jitter, self.latency + self.jitter), 0.0)
+        if self.distribution == 'normal':
+            return max(rng.gauss(self.latency, self.jitter), 0.0)
+        return rng.lognormvariate(0.0, self.jitter) * self.latency
+
+    def transcribe(self, payload, language='auto', prompt='', on_partial=None):
+        rng = self.rng_for(payload)
+        delay = self.sample_latency(rng)
+        failed = rng.random() < self.error_rate
+        text = self.texts[rng.randrange(len(self.texts))]
+        with self.lock:
+            self.calls += 1
+            if failed:
+                self.errors += 1
+        pieces = self.STREAM_PIECES if on_partial is not None and not failed else 1
+        for piece in range(1, pieces + 1):
+            time.sleep(delay / pieces)
+            if piece < pieces:
+                on_partial(text[:len(text) * piece // pieces])
+        if failed:
+            raise TranscriptionAPIError("503 - injected by fake backend")
+        return text
+
+    @property
+    def stats(self):
+        with self.lock:
+            return {'attempts': self.calls, 'attempt_failures': self.errors, 'failures': self.errors}
+
+
+BACKENDS = {
+    'openai': OpenAIBackend,
+    'fake': FakeBackend,
+}
+
+
+def create_backend(name, **options):
+    """名前からバックエンドを作成 / Create a backend by name"""
+    backend_class = BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"unknown transcription backend: {name} (choose from {', '.join(BACKENDS)})")
+    return backend_class(**options)
@@ -0,0 +1,795 @@
+"""GUIに依存しない文字起こしエンジン / Transcription engine without any GUI
+
+録音・チャンク分割・プロンプト作成・API呼び出し・重複除去・ジャーナル・メトリクスを1つにまとめ、
+結果はイベントで渡す。Tk を使わないため、サービスやバッチ処理・ベンチマークに組み込め、
+1プロセスで複数のエンジンを動かせる。GUI（RealTime_Transcription.py）はこのエンジンの薄いクライアント。
+Capture, chunking, prompt building, API calls, stitching, the journal and
+metrics in one place, with results handed out as events. Nothing here
+touches Tk, so the engine embeds in services, batch jobs and benchmarks,
+and several engines can run in one process. The GUI
+(RealTime_Transcription.py) is a thin client of it.
+
+コールバック / Callbacks (called on the engine's threads):
+
+    engine = TranscriptionEngine(api_key)
+    engine.on('transcript', lambda event: print(event.text))
+    engine.open()
+    engine.start()          # マイクから / from the microphone(s)
+    ...
+    engine.stop()
+    engine.close()
+
+非同期イテレータ / Async iterator (ends when the engine stops):
+
+    async for event in engine.stream():
+        print(event.kind, event.text)
+
+マイクの代わりに PCM を渡す場合は start_pipeline() の後に feed() を呼ぶ。
+To hand in PCM instead of a microphone, call feed() after start_pipeline().
+
+イベント / Events
+  'transcript'  TranscriptEvent（確定した字幕） / TranscriptEvent, a committed subtitle
+  'partial'     TranscriptEvent（途中経過、STREAM_PARTIALS 時でストリーミング対応のバックエンドのみ）
+                同じ source・seq の 'transcript' で置き換える
+                in-progress text (with STREAM_PARTIALS, streaming backends only),
+                replaced by the 'transcript' with the same source and seq
+  'level'       最も大きい入力の音量（0〜1） / level of the loudest input (0..1)
+  'chunk_duration'  チャンク長の変更記録 / chunk duration change record
+  'recovered'   (開始記録, 文字起こし記録のリスト) 異常終了したセッション / (start record, transcript records) of a session that ended abnormally
+  'stopped'     None
+"""
+import queue
+import threading
+import time
+from datetime import datetime
+from functools import partial
+
+import startup
+from startup import lazy_import
+from prompt_builder import PromptBuilder
+from latency_timeline import ChunkTimeline, TimelineRecorder, CUMULATIVE_BOUNDS_S
+from transcript_journal import TranscriptJournal, recover_incomplete
+from subtitle_export import SubtitleWriter
+from chunk_controller import ChunkDurationController
+
+# 重いモジュールは最初の録音開始時に読み込む（PyAudio は start() で、feed() だけなら不要）
+# Heavy modules load when recording first starts (PyAudio in start(); not needed with feed() alone)
+np = lazy_import('numpy')
+audio_processing = lazy_import('audio_processing')
+transcription_pipeline = lazy_import('transcription_pipeline')
+audio_encoding = lazy_import('audio_encoding')
+api_client = lazy_import('api_client')
+transcription_backends = lazy_import('transcription_backends')
+capture_sources = lazy_import('capture_sources')
+metrics_server = lazy_import('metrics_server')   # METRICS_PORT 指定時のみ / Only with METRICS_PORT
+
+PA_CONTINUE = 0  # pyaudio.paContinue（コールバックで PyAudio を読み込まないよう定数で） / pyaudio.paContinue, kept as a constant so the callback never triggers loading PyAudio
+EVENTS = ('transcript', 'partial', 'level', 'chunk_duration', 'recovered', 'stopped')
+
+
+class TranscriptEvent:
+    """1チャンク分の字幕（途中経過または確定） / Subtitle of one chunk, in progress or committed
+
+    start と end はセッション開始からの秒。text は入力ソースのラベル付き。
+    start and end are seconds since the session started; text carries the input's label.
+    """
+    __slots__ = ('kind', 'text', 'source', 'seq', 'start', 'end', 'overlay', 'chunk', 'result')
+
+    def __init__(self, kind, text, chunk, result=None, overlay=True, rate=16000):
+        self.kind = kind            # 'partial' または 'final' / 'partial' or 'final'
+        self.text = text
+        self.source = chunk.source.name
+        self.seq = chunk.seq
+        self.start = chunk.start_sample / rate
+        self.end = chunk.end_sample / rate
+        self.overlay = overlay      # 浮動字幕に出すか（遅れすぎた結果は False） / Whether it belongs on the overlay (False when too late)
+        self.chunk = chunk
+        self.result = result
+
+    def to_record(self):
+        """JSON にできる辞書 / Dict ready for JSON"""
+        record = {'type': self.kind, 'source': self.source, 'seq': self.seq,
+                  'start': round(self.start, 3), 'end': round(self.end, 3), 'text': self.text}
+        if self.result is not None:
+            record['latency_ms'] = self.result.latency_ms
+        return record
+
+
+class EventStream:
+    """エンジンのイベントを asyncio で受け取る非同期イテレータ / Async iterator over engine events for asyncio
+
+    イベントはエンジンのスレッドから call_soon_threadsafe でループに渡す。エンジンが止まるか close() で終わる。
+    Events are handed to the loop from the engine's threads with
+    call_soon_threadsafe. Iteration ends when the engine stops or on close().
+    """
+    END = object()
+
+    def __init__(self, engine, kinds, loop, queue):
+        self.engine = engine
+        self.kinds = kinds
+        self.loop = loop
+        self.queue = queue
+
+    def push(self, kind, event):
+        """どのスレッドからでも / From any thread"""
+        if kind in self.kinds or event is self.END:
+            try:
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+            except RuntimeError:   # ループが閉じている / The loop is closed
+                self.engine.event_streams.discard(self)
+
+    def close(self):
+        self.engine.event_streams.discard(self)
+        self.push(None, self.END)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.queue.get()
+        if event is self.END:
+            self.engine.event_streams.discard(self)
+            raise StopAsyncIteration
+        return event
+
+
+class TranscriptionEngine:
+    """録音から確定字幕までのパイプライン / Pipeline from capture to committed subtitles
+
+    設定は大文字の属性で、start() / start_pipeline() の前に変更する。
+    Settings are the upper-case attributes; change them before start() / start_pipeline().
+    """
+    def __init__(self, api_key, audio=None):
+        # オーディオ設定 / Audio configuration
+        self.CHUNK = 1024
+        self.FORMAT = 'paInt16'    # PyAudio のサンプル形式名（PyAudio は最初の録音開始時に読み込む） / PyAudio sample format name (PyAudio loads when recording first starts)
+        self.CHANNELS = 1
+        self.RATE = 16000
+        self.CHUNK_DURATION = 4.0    # 各チャンクの長さ（秒） / Each chunk duration (seconds)
+        self.OVERLAP_DURATION = 0.8    # 重なり部分の長さ（秒） / Overlap duration (seconds)
+        self.BUFFER_DURATION = 30.0    # リングバッファに保持する最低限の長さ（秒） / Minimum audio history held in the ring buffer (seconds)
+        # 入力（空なら既定のマイク1本）。複数あればソースごとに文字起こしし、ラベル付きで表示
+        # Inputs (empty = the default microphone). With several, each is transcribed separately and shown with its label
+        # device はデバイス番号か名前の一部、channel は多チャンネル機器のチャンネル番号
+        # device is an index or part of the device name; channel picks one channel of a multichannel interface
+        # 例 / e.g. [{'label': 'Host', 'device': 'USB', 'channel': 0}, {'label': 'Guest', 'device': 'USB', 'channel': 1}]
+        self.INPUT_SOURCES = []
+        # デバイス本来のレート（44.1/48 kHz など）で録音し、16 kHz に変換する（False なら 16 kHz で開く）
+        # Capture at the device's native rate (44.1/48 kHz, ...) and resample to 16 kHz (False opens at 16 kHz)
+        self.NATIVE_RATE_CAPTURE = True
+
+        # 区切り方式 / Segmentation mode ('fixed' = CHUNK_DURATION + OVERLAP_DURATION, 'vad' = split at pauses)
+        self.SEGMENTATION_MODE = 'vad'
+        self.MIN_SEGMENT_DURATION = 1.0    # VAD区間の最小長（秒） / Minimum VAD segment length (seconds)
+        self.MAX_SEGMENT_DURATION = 10.0   # VAD区間の最大長（秒） / Maximum VAD segment length (seconds)
+        self.SILENCE_DURATION = 0.5        # 区間を閉じる無音の長さ（秒） / Pause length that ends a segment (seconds)
+
+        # API遅延に応じてチャンク長（VADでは最大区間長）を調整 / Adapt the chunk length (max segment length for VAD) to API latency
+        self.ADAPTIVE_CHUNKING = True
+        self.MIN_CHUNK_DURATION = 2.0      # 調整の下限（秒） / Lower bound (seconds)
+        self.MAX_CHUNK_DURATION = 10.0     # 調整の上限（秒） / Upper bound (seconds)
+        self.TARGET_RTF = 0.7              # 目標の実効リアルタイム係数 / Target effective real-time factor
+        self.chunk_controller = None
+
+        # 同時に送信するリクエスト数 / Number of transcription requests kept in flight
+        self.MAX_CONCURRENT_REQUESTS = 3
+
+        # 送信待ちキュー / Transcription queue
+        # 'drop_oldest' = 古いチャンクを捨てる / drop old chunks, 'merge' = 待っているチャンクをまとめて送る / merge pending chunks,
+        # 'skip_stale' = すべて送り、遅れた結果は浮動字幕に出さない / send all, keep late results off the overlay
+        self.QUEUE_POLICY = 'merge'
+        self.MAX_QUEUED_CHUNKS = 8      # キューの上限（入力ソースごと） / Queue bound (per input source)
+        self.STALE_DEADLINE = 8.0       # ライブ音声からこれ以上遅れたら古いとみなす（秒） / Seconds behind live audio before a chunk counts as stale
+        self.MAX_MERGED_DURATION = 20.0 # まとめたチャンクの最大長（秒） / Longest merged chunk (seconds)
+        self.overlay_skipped = 0        # 浮動字幕に出さなかった結果の数 / Results kept off the overlay
+
+        # API設定 / API configuration
+        self.api_key = api_key
+        self.api_url = "https://api.openai.com/v1/audio/transcriptions"
+        self.TRANSCRIPTION_BACKEND = 'openai'  # 'openai' または オフライン用の 'fake' / 'openai', or 'fake' for offline runs
+        self.BACKEND_OPTIONS = {}              # 'fake' の設定（latency、error_rate など） / Settings for 'fake' (latency, error_rate, ...)
+        self.backend = None  # 録音開始時に作成・事前接続 / Created and warmed when recording starts
+        self.backend_settings = None
+        self.API_MAX_RETRIES = 3        # 最大再試行回数 / Maximum retries per chunk
+        self.API_ATTEMPT_TIMEOUT = 8.0  # 1回の試行のタイムアウト（秒） / Timeout of a single attempt (seconds)
+        self.CHUNK_DEADLINE = 15.0      # チャンクごとの期限（秒） / Per-chunk deadline (seconds)
+        self.HEDGE_REQUESTS = True      # p95超過時に複製リクエストを送る / Send a duplicate request past p95 latency
+        self.STREAM_PARTIALS = True     # 途中経過をストリーミングで受け取る（ヘッジはしない） / Stream in-progress text (such requests are not hedged)
+        self.UPLOAD_FORMAT = 'flac'     # 送信形式（'flac'、'opus'、'wav'） / Upload encoding ('flac', 'opus', 'wav')
+        self.encoder_stats = None       # 送信量の統計（最初の録音開始時に作成） / Upload size counters, created when recording first starts
+        self.TRACE_FILE = None          # チャンクごとの遅延をJSONLで記録するパス / Path of the per-chunk latency JSONL trace
+        self.timeline_recorder = TimelineRecorder()  # 段階別の遅延分布 / Per-stage latency histograms
+        self.METRICS_PORT = None        # Prometheusメトリクスのポート（例 9464、None で無効） / Port for Prometheus metrics (e.g. 9464; None disables)
+        self.METRICS_HOST = '127.0.0.1'
+        self.metrics_server = None
+        self.captured_samples = 0       # 録音したサンプル数（起動から累積） / Samples captured since start
+        self.JOURNAL_FILE = None        # 文字起こしのジャーナル（None で無効） / Transcript journal (None disables it)
+        self.JOURNAL_FSYNC_INTERVAL = 1.0  # fsync の間隔（秒） / Seconds between fsyncs
+        self.journal = None
+        # 字幕ファイル（.srt/.vtt、strftime 書式可、例 'subtitles_%Y%m%d_%H%M%S.srt'） / Subtitle export (.srt/.vtt, strftime codes allowed)
+        self.SUBTITLE_EXPORT_FILE = None
+        self.subtitle_writer = None
+
+        # 文字起こしの言語・キーワード・プロンプトの言語 / Transcription language, keyword and prompt language
+        self.language = 'ja'       # 'auto' で自動検出、録音中に変えてもよい / 'auto' detects; may change while recording
+        self.keyword = ""
+        self.prompt_lang = 'ja'
+        self.PROMPT_TOKEN_BUDGET = 160          # プロンプトのトークン上限（用語集＋直近の文脈） / Prompt token budget (keyword glossary + recent context)
+
+        # 状態管理 / State management
+        self.is_recording = False
+        self.stopped = False                    # 一度録音して止めたか / Whether a recording has been stopped
+        self.results_closed = False             # 停止処理で出力先を閉じた後は結果を捨てる / Results are dropped once stopping has closed the sinks
+        self.audio_queue = queue.Queue()
+        self.transcription_queue = queue.Queue()  # 録音開始時に入力ソースごとのキューに置き換え / Replaced by per-source queues when recording starts
+        self.upload_queue = queue.Queue()  # エンコード済みチャンク / Encoded chunks waiting for upload
+        self.sources = []                       # 入力ソース（録音開始時に作成） / Input sources, created when recording starts
+        self.captures = []                      # デバイスごとの入力 / Inputs grouped per device
+
+        # PyAudio は最初の録音開始時に初期化（open_audio）。渡されたものは共有し、終了しない
+        # PyAudio is initialized when recording first starts (open_audio); one passed in is shared and never terminated
+        self.audio = audio
+        self.owns_audio = audio is None
+        self.streams = []
+
+        # スレッド管理 / Thread management
+        self.processing_thread = None
+        self.transcription_pool = None
+        self.encoding_stage = None
+
+        # イベント / Events
+        self.handlers = {kind: [] for kind in EVENTS}
+        self.event_streams = set()      # stream() の購読者 / Subscribers from stream()
+        # True ならクライアントが字幕を表示した後に rendered() を呼ぶ（表示までの遅延も測る）
+        # When True the client calls rendered() after showing transcripts, so the delay until display is measured too
+        self.client_renders = False
+
+    def on(self, kind, handler):
+        """イベントのハンドラを登録（エンジンのスレッドから呼ばれる） / Register an event handler (called on the engine's threads)"""
+        if kind not in self.handlers:
+            raise ValueError(f"unknown event: {kind}")
+        self.handlers[kind].append(handler)
+        return handler
+
+    def emit(self, kind, event):
+        """ハンドラと非同期イテレータにイベントを渡す / Hand an event to the handlers and async iterators"""
+        for handler in self.handlers[kind]:
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"イベント処理エラー / Event handler error ({kind}): {e}")
+        for stream in list(self.event_streams):
+            stream.push(kind, event)
+
+    def stream(self, kinds=('partial', 'transcript')):
+        """イベントの非同期イテレータ（実行中のイベントループから呼ぶ） / Async iterator over events (call from a running event loop)"""
+        import asyncio
+        stream = EventStream(self, set(kinds), asyncio.get_running_loop(), asyncio.Queue())
+        self.event_streams.add(stream)
+        return stream
+
+    def open(self):
+        """ジャーナルとメトリクスを開く（異常終了したセッションは 'recovered' で渡す） / Open the journal and metrics; a session that ended abnormally is handed out as 'recovered'"""
+        self.journal = self.open_journal()
+        self.start_metrics_server()
+
+    def close(self):
+        """止めてすべてのリソースを解放 / Stop and release every resource"""
+        if self.is_recording:
+            self.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.backend:
+            self.backend.close()
+            self.backend = None
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        if self.audio and self.owns_audio:
+            self.audio.terminate()
+            self.audio = None
+        for stream in list(self.event_streams):
+            stream.close()
+
+    def audio_callback(self, in_data, frame_count, time_info, status, capture=None):
+        """オーディオストリームコールバック（capture 省略時は最初の入力） / Audio stream callback (the first input when capture is omitted)"""
+        if self.is_recording:
+            capture = capture or self.captures[0]
+            # バッファ先頭のADC時刻を monotonic 時計に換算 / Convert the ADC time of the buffer's first sample to the monotonic clock
+            now = time.monotonic()
+            adc_time = time_info.get('input_buffer_adc_time') if time_info else None
+            current_time = time_info.get('current_time') if time_info else None
+            if adc_time and current_time:
+                captured_at = now - (current_time - adc_time)
+            else:
+                captured_at = now - frame_count / capture.rate
+            self.audio_queue.put((capture, in_data, captured_at))
+        return (in_data, PA_CONTINUE)
+
+    def feed(self, in_data, capture=None):
+        """マイクの代わりに int16 PCM を渡す（start_pipeline() の後、どのスレッドからでも） / Hand in int16 PCM in place of a microphone (after start_pipeline(), from any thread)"""
+        capture = capture or self.captures[0]
+        self.audio_callback(in_data, len(in_data) // 2 // capture.channels, None, 0, capture)
+
+    def start(self):
+        """録音開始（失敗したら止めて False） / Start recording; stops again and returns False on failure"""
+        self.start_pipeline()
+
+        # 入力デバイスごとにストリームを開く / Open one audio stream per input device
+        try:
+            self.open_audio()
+            import pyaudio
+            for capture in self.captures:
+                device_index = capture_sources.find_input_device(self.audio, capture.device)
+                if self.NATIVE_RATE_CAPTURE:
+                    info = capture_sources.input_device_info(self.audio, device_index)
+                    capture.configure(int(info['defaultSampleRate']), info['maxInputChannels'])
+                self.streams.append(self.audio.open(
+                    format=getattr(pyaudio, self.FORMAT),
+                    channels=capture.channels,
+                    rate=capture.rate,
+                    input=True,
+                    input_device_index=device_index,
+                    frames_per_buffer=self.CHUNK,
+                    stream_callback=partial(self.audio_callback, capture=capture)
+                ))
+        except (ImportError, OSError, ValueError) as e:
+            print(f"入力デバイスを開けません / Could not open input device: {e}")
+            self.stop()
+            return False
+        return True
+
+    def open_audio(self):
+        """PyAudio を読み込んで初期化（最初の録音開始時に一度だけ） / Import and initialize PyAudio, once, when recording first starts"""
+        if self.audio is None:
+            import pyaudio
+            self.audio = pyaudio.PyAudio()
+            startup.mark('first recording: PyAudio')
+        return self.audio
+
+    def start_pipeline(self):
+        """処理・エンコード・文字起こしスレッドを起動 / Start the processing, encoding and transcription threads
+
+        audio_callback / feed に渡された音声がここから流れる。マイクを使わないベンチマークからも呼ばれる。
+        Audio handed to audio_callback / feed flows from here on; also used by benchmarks that replay files instead of a microphone.
+        """
+        self.is_recording = True
+        self.stopped = False
+        self.results_closed = False
+        first_start = self.encoder_stats is None
+
+        # バックエンドを用意し、最初のチャンクより前に接続を確立 / Prepare the backend and connect before the first chunk
+        backend_settings = (self.TRANSCRIPTION_BACKEND, self.MAX_CONCURRENT_REQUESTS)
+        if self.backend is None or self.backend_settings != backend_settings:
+            if self.backend:
+                self.backend.close()
+            self.backend = self.create_backend()
+            self.backend_settings = backend_settings
+        self.backend.warm_up()
+
+        # スレッド起動 / Start processing and transcription threads
+        self.audio_queue = queue.Queue()
+        # 入力ソースごとのキューをラウンドロビンで送る / Per-source queues, sent round-robin
+        self.transcription_queue = transcription_pipeline.FairChunkQueue()
+        # 送信待ちはワーカー数まで（滞留は transcription_queue 側で扱う） / At most one upload per worker waits here; backlog is handled by transcription_queue
+        self.upload_queue = queue.Queue(maxsize=self.MAX_CONCURRENT_REQUESTS)
+        self.sources = self.create_sources()
+        self.captures = capture_sources.group_sources(self.sources, self.RATE)
+        self.timeline_recorder.open_trace(self.TRACE_FILE)
+        if self.journal:
+            self.journal.begin_session(keyword=self.keyword, mode=self.SEGMENTATION_MODE,
+                                       backend=self.TRANSCRIPTION_BACKEND)
+        if self.SUBTITLE_EXPORT_FILE:
+            try:
+                self.subtitle_writer = SubtitleWriter(datetime.now().strftime(self.SUBTITLE_EXPORT_FILE))
+            except (OSError, ValueError) as e:
+                print(f"字幕ファイルを開けません / Could not open subtitle file: {e}")
+
+        # チャンク長の自動調整 / Adaptive chunk duration
+        self.chunk_controller = None
+        if self.ADAPTIVE_CHUNKING:
+            initial = self.MAX_SEGMENT_DURATION if self.SEGMENTATION_MODE == 'vad' else self.CHUNK_DURATION
+            self.chunk_controller = ChunkDurationController(initial, self.MIN_CHUNK_DURATION, self.MAX_CHUNK_DURATION,
+                                                            workers=self.MAX_CONCURRENT_REQUESTS,
+                                                            target_rtf=self.TARGET_RTF,
+                                                            on_change=self.on_chunk_duration_change)
+
+        # 並列文字起こしワーカー（結果はソースごとに捕捉順に表示） / Concurrent transcription workers (results shown in capture order per source)
+        self.transcription_pool = transcription_pipeline.TranscriptionWorkerPool(self.upload_queue,
+                                                                                 self.transcribe_audio,
+                                                                                 self.on_transcription,
+                                                                                 workers=self.MAX_CONCURRENT_REQUESTS)
+        self.transcription_pool.start()
+
+        # エンコード段（ネットワークスレッドとは別） / Encoding stage, kept off the network threads
+        if first_start:
+            self.encoder_stats = audio_encoding.EncoderStats()
+        encoder = audio_encoding.create_encoder(self.UPLOAD_FORMAT, self.RATE, self.CHANNELS)
+        self.encoding_stage = transcription_pipeline.EncodingStage(self.transcription_queue, self.upload_queue,
+                                                                   lambda samples: audio_encoding.encode_chunk(encoder, samples, self.encoder_stats),
+                                                                   on_drop=self.transcription_pool.skip)
+        self.encoding_stage.start()
+
+        self.processing_thread = threading.Thread(target=self.process_audio, daemon=True)
+        self.processing_thread.start()
+        if first_start:
+            startup.mark('first recording: pipeline')
+
+    def stop(self):
+        """録音停止 / Stop recording"""
+        self.is_recording = False
+
+        # オーディオストリームを閉じる / Close audio streams
+        self.close_streams()
+        self.stop_pipeline()
+
+    def close_streams(self):
+        """開いている入力ストリームをすべて閉じる / Close every open input stream"""
+        for stream in self.streams:
+            try:
+                stream.stop_stream()
+                stream.close()
+            except OSError as e:
+                print(f"入力ストリームを閉じられません / Could not close input stream: {e}")
+        self.streams = []
+
+    def stop_pipeline(self):
+        """処理・エンコード・文字起こしスレッドを停止 / Stop the processing, encoding and transcription threads"""
+        self.is_recording = False
+        if self.stopped:
+            return
+        self.stopped = True
+
+        # ワーカーを停止し、送信中のリクエストの結果を期限まで待つ / Stop the workers and wait up to the chunk deadline for requests in flight
+        if self.encoding_stage:
+            self.encoding_stage.stop()
+        if self.transcription_pool:
+            abandoned = self.transcription_pool.stop(self.CHUNK_DEADLINE)
+            if abandoned:
+                print(f"{abandoned} 件のリクエストが期限内に終わりませんでした / {abandoned} requests did not finish before the deadline")
+            # 結果の解放中でなくなってから出力先を閉じる / Close the sinks only while no result is being released
+            with self.transcription_pool.release_lock:
+                self.results_closed = True
+        else:
+            self.results_closed = True
+
+        # 文脈をクリア / Clear the prompt context
+        for source in self.sources:
+            source.prompt_builder.reset()
+        self.timeline_recorder.close()
+        if self.journal:
+            self.journal.end_session()
+        if self.subtitle_writer:
+            self.subtitle_writer.close()
+            self.subtitle_writer = None
+        self.emit('stopped', None)
+        for stream in list(self.event_streams):
+            stream.close()
+
+    def open_journal(self):
+        """ジャーナルを開き、前回異常終了したセッションを 'recovered' で渡す / Open the journal and hand out a session that ended abnormally as 'recovered'"""
+        if not self.JOURNAL_FILE:
+            return None
+        try:
+            recovered = recover_incomplete(self.JOURNAL_FILE)
+            journal = TranscriptJournal(self.JOURNAL_FILE, self.JOURNAL_FSYNC_INTERVAL)
+        except OSError as e:
+            print(f"ジャーナルを開けません / Could not open journal: {e}")
+            return None
+        if recovered:
+            start, transcripts = recovered
+            self.emit('recovered', recovered)
+            print(f"{len(transcripts)} 件の文字起こしを復元しました / Recovered {len(transcripts)} transcripts")
+            # 再び復元しないよう終了を記録 / Mark it ended so it is not recovered again
+            journal.end_session(start['session'], recovered=True)
+        return journal
+
+    def start_metrics_server(self):
+        """METRICS_PORT が設定されていればメトリクスを公開 / Serve metrics when METRICS_PORT is set"""
+        if self.METRICS_PORT is None:
+            return
+        try:
+            self.metrics_server = metrics_server.MetricsServer(self.collect_metrics, self.METRICS_HOST, self.METRICS_PORT).start()
+            print(f"メトリクス / Metrics: {self.metrics_server.url}")
+        except OSError as e:
+            print(f"メトリクスサーバーを起動できません / Could not start metrics server: {e}")
+
+    def collect_metrics(self, writer):
+        """現在の値を書き出す（メトリクススレッドで実行、ロックはほぼ取らない） / Write current values (runs on the metrics thread and takes almost no locks)
+
+        キューの長さは Queue.queue を直接読み、カウンタは各スレッドが書いたものをそのまま読む。
+        Queue depths read Queue.queue directly and counters are read as their owning threads left them.
+        """
+        writer.gauge('transcriber_recording', 'Whether audio is being captured', int(self.is_recording))
+        for name, work_queue in (('audio', self.audio_queue),
+                                 ('upload', self.upload_queue)):
+            writer.gauge('transcriber_queue_depth', 'Items waiting in each pipeline queue',
+                         len(work_queue.queue), {'queue': name})
+        writer.gauge('transcriber_queue_depth', 'Items waiting in each pipeline queue',
+                     self.transcription_queue.qsize(), {'queue': 'transcription'})
+        pool = self.transcription_pool
+        if self.chunk_controller:
+            writer.gauge('transcriber_chunk_duration_seconds', 'Current chunk duration chosen by the controller',
+                         self.chunk_controller.duration)
+        writer.gauge('transcriber_requests_in_flight', 'Transcription requests currently in flight',
+                     pool.in_flight if pool else 0)
+
+        # 音声量（秒） / Audio amounts in seconds
+        sources = list(self.sources)
+        encoder_stats = self.encoder_stats
+        writer.counter('transcriber_audio_captured_seconds_total', 'Audio captured from the microphone',
+                       self.captured_samples / self.RATE)
+        writer.counter('transcriber_audio_uploaded_seconds_total', 'Audio encoded and handed to the API',
+                       (encoder_stats.raw_bytes if encoder_stats else 0) / 2 / self.CHANNELS / self.RATE)
+        writer.counter('transcriber_audio_skipped_seconds_total', 'Silent audio never uploaded',
+                       sum(getattr(source.chunker, 'skipped_samples', 0) for source in sources) / self.RATE)
+        writer.counter('transcriber_audio_dropped_seconds_total', 'Audio overwritten in the ring buffer before it was read',
+                       sum(source.buffer.dropped for source in sources) / self.RATE)
+        writer.counter('transcriber_uploaded_bytes_total', 'Encoded bytes sent to the API',
+                       encoder_stats.encoded_bytes if encoder_stats else 0)
+        queue_stats = getattr(self.transcription_queue, 'stats', {})
+        for reason in ('dropped', 'merged'):
+            writer.counter('transcriber_queue_removed_chunks_total', 'Chunks dropped or merged away by the queue policy',
+                           queue_stats.get(reason, 0), {'reason': reason})
+        writer.counter('transcriber_overlay_skipped_total', 'Late results kept off the floating overlay',
+                       self.overlay_skipped)
+
+        # API呼び出し / API calls
+        stats = self.backend.stats if self.backend else {}
+        for key, help_text in (('attempts', 'HTTP attempts, retries and hedges included'),
+                               ('retries', 'Retried attempts'),
+                               ('hedges', 'Hedged duplicate requests'),
+                               ('attempt_failures', 'Failed HTTP attempts, retried ones included'),
+                               ('failures', 'Chunks that failed after all retries'),
+                               ('rejected', 'Chunks rejected by the open circuit breaker')):
+            if key in stats:
+                writer.counter(f'transcriber_api_{key}_total', help_text, stats[key])
+        for outcome, count in list(self.timeline_recorder.outcomes.items()):
+            writer.counter('transcriber_chunks_total', 'Chunks by outcome', count, {'outcome': outcome})
+
+        # 遅延 / Latency
+        for stage, histogram in self.timeline_recorder.cumulative.items():
+            cumulative, total = histogram.snapshot()
+            writer.histogram('transcriber_stage_seconds', 'Time spent in each pipeline stage (network = API round trip)',
+                             CUMULATIVE_BOUNDS_S, cumulative, total, {'stage': stage})
+        audio_end = self.timeline_recorder.last_rendered_audio_end
+        lag = time.monotonic() - audio_end if self.is_recording and audio_end is not None else None
+        writer.gauge('transcriber_lag_seconds', 'How far the last rendered subtitle trails live audio', lag)
+
+        # 入力ソースごと（形式上、同じメトリクスのサンプルは連続させる） / Per input source, one metric at a time since a family's samples must be contiguous
+        for source in sources:
+            writer.counter('transcriber_source_audio_seconds_total', 'Audio captured per input source',
+                           source.captured_samples / self.RATE, {'source': source.name})
+        for source in sources:
+            writer.gauge('transcriber_source_queue_depth', 'Chunks waiting per input source',
+                         len(source.queue.queue), {'source': source.name})
+        for source in sources:
+            for reason in ('dropped', 'merged'):
+                writer.counter('transcriber_source_removed_chunks_total', 'Chunks dropped or merged away per input source',
+                               source.queue.stats[reason], {'source': source.name, 'reason': reason})
+        for source in sources:
+            writer.gauge('transcriber_source_lag_seconds', 'Lag of the latest subtitle per input source',
+                         source.lag, {'source': source.name})
+        for source in sources:
+            writer.gauge('transcriber_source_max_lag_seconds', 'Worst subtitle lag per input source this session',
+                         source.max_lag, {'source': source.name})
+
+    def create_backend(self):
+        """設定に応じた文字起こしバックエンドを作成 / Create the transcription backend from the settings"""
+        if self.TRANSCRIPTION_BACKEND == 'openai':
+            return transcription_backends.create_backend('openai',
+                                                         api_key=self.api_key,
+                                                         url=self.api_url,
+                                                         pool_size=self.MAX_CONCURRENT_REQUESTS,
+                                                         max_retries=self.API_MAX_RETRIES,
+                                                         attempt_timeout=self.API_ATTEMPT_TIMEOUT,
+                                                         deadline=self.CHUNK_DEADLINE,
+                                                         hedge=self.HEDGE_REQUESTS)
+        return transcription_backends.create_backend(self.TRANSCRIPTION_BACKEND, **self.BACKEND_OPTIONS)
+
+    def create_audio_buffer(self):
+        """録音用リングバッファを作成 / Create the ring buffer for captured PCM
+
+        キュー内のチャンクはバッファのビューなので、キューが満杯でも上書きされないよう
+        （キューの上限＋エンコード中＋録音中）× 最長チャンク分を確保する。
+        Queued chunks are views into the buffer, so it holds (queue bound +
+        the chunk being encoded + the one being recorded) x the longest chunk,
+        and a full queue is never overwritten.
+        """
+        longest = max(self.CHUNK_DURATION, self.MAX_SEGMENT_DURATION,
+                      self.MAX_CHUNK_DURATION if self.ADAPTIVE_CHUNKING else 0.0) + self.OVERLAP_DURATION
+        capacity = int(self.RATE * max(self.BUFFER_DURATION, (self.MAX_QUEUED_CHUNKS + 2) * longest))
+        return audio_processing.PCMRingBuffer(capacity)
+
+    def create_chunker(self, buffer):
+        """区切り方式に応じたチャンカーを作成 / Create the chunker for the current segmentation mode"""
+        if self.SEGMENTATION_MODE == 'vad':
+            return audio_processing.VoiceActivitySegmenter(buffer, self.RATE,
+                                                           silence_duration=self.SILENCE_DURATION,
+                                                           min_segment=self.MIN_SEGMENT_DURATION,
+                                                           max_segment=self.MAX_SEGMENT_DURATION)
+        return audio_processing.FixedChunker(buffer,
+                                             int(self.RATE * self.CHUNK_DURATION),
+                                             int(self.RATE * self.OVERLAP_DURATION))
+
+    def create_sources(self):
+        """INPUT_SOURCES から入力ソースを作成（バッファ・チャンカー・キュー・文脈付き） / Create the input sources from INPUT_SOURCES, each with its buffer, chunker, queue and context"""
+        specs = self.INPUT_SOURCES or [{}]
+        sources = []
+        for index, spec in enumerate(specs):
+            source = capture_sources.AudioSource(spec.get('label', ''), spec.get('device'), spec.get('channel'),
+                                                 name=spec.get('label') or f"input{index}")
+            source.buffer = self.create_audio_buffer()
+            source.chunker = self.create_chunker(source.buffer)
+            source.queue = self.transcription_queue.add(self.RATE,
+                                                       maxsize=self.MAX_QUEUED_CHUNKS,
+                                                       policy=self.QUEUE_POLICY,
+                                                       stale_after=self.STALE_DEADLINE,
+                                                       max_merged_seconds=self.MAX_MERGED_DURATION,
+                                                       on_drop=self.on_chunk_dropped)
+            # 用語集はセッションごとに一度だけ作る / The glossary is compiled once per session
+            source.prompt_builder = PromptBuilder(self.prompt_lang, self.keyword, self.PROMPT_TOKEN_BUDGET)
+            sources.append(source)
+        return sources
+
+    @property
+    def pending(self):
+        """送信待ち・処理中・順序待ちのチャンク数 / Chunks waiting, in flight or waiting for reordering"""
+        pool = self.transcription_pool
+        return self.transcription_queue.qsize() + (pool.backlog if pool else 0)
+
+    def process_audio(self):
+        """オーディオデータを処理し、チャンクを転写キューに投入 / Process audio data and enqueue chunks for transcription"""
+        applied_duration = None
+
+        while self.is_recording:
+            try:
+                capture, audio_data, captured_at = self.audio_queue.get(timeout=0.1)
+
+                # 調整されたチャンク長を反映 / Apply an adjusted chunk duration
+                controller = self.chunk_controller
+                if controller and controller.duration != applied_duration:
+                    applied_duration = controller.duration
+                    for source in self.sources:
+                        source.chunker.set_target_length(self.RATE * applied_duration)
+
+                # チャンネルごとに各ソースへ / Hand each channel to its source
+                for source, audio_array in capture.split(audio_data):
+                    self.feed_source(source, audio_array, captured_at)
+
+                # 最も大きい入力の音量 / Level of the loudest input
+                self.emit('level', max(source.level for source in self.sources))
+            except queue.Empty:
+                continue
+            except Exception as e:
+                print(f"音声処理エラー / Audio processing error: {e}")
+
+    def feed_source(self, source, audio_array, captured_at):
+        """1入力分の音声ブロックをリングバッファに書き、切り出したチャンクをキューへ / Write one input's block to its ring buffer and enqueue the chunks it completes"""
+        chunker = source.chunker
+        block_start = chunker.buffer.write_pos
+        source.level = np.abs(audio_array).mean() / 32768.0
+
+        # リングバッファに追加 / Add to ring buffer
+        chunker.buffer.write(audio_array)
+        source.captured_samples += len(audio_array)
+        self.captured_samples += len(audio_array)
+
+        # チャンクをビューとして切り出し転写キューに追加（VADでは無音のみの区間は送らない） / Cut chunks as views and enqueue them (VAD never enqueues silence-only audio)
+        for chunk in chunker.pop_chunks():
+            chunk.source = source
+            chunk.seq = source.next_seq
+            source.next_seq += 1
+            # 先頭サンプルの捕捉時刻は最新ブロックの時刻から逆算 / Capture time of the first sample, counted back from the latest block
+            chunk.timeline = ChunkTimeline(chunk.seq, len(chunk) / self.RATE,
+                                           source.name if len(self.sources) > 1 else None)
+            chunk.timeline.mark('captured', captured_at + (chunk.start_sample - block_start) / self.RATE)
+            chunk.timeline.mark('enqueued')
+            source.queue.put(chunk)
+
+    def transcribe_audio(self, audio_chunk):
+        """エンコード済みの1チャンクを文字起こし（gpt-4o-transcribeを使用、ワーカースレッドで実行） / Transcribe one encoded chunk using gpt-4o-transcribe (runs on a worker thread)"""
+        # キーワードの用語集＋このソースの直近の文脈 / Keyword glossary plus this source's recent context
+        prompt = self.build_context_prompt(audio_chunk.source)
+
+        # API呼び出し / Call API for transcription
+        start_time = time.time()
+        audio_chunk.timeline.mark('sent')
+        on_partial = partial(self.on_partial, audio_chunk) if self.STREAM_PARTIALS else None
+        transcription = self.call_transcription_api(audio_chunk.payload, prompt, on_partial)
+        audio_chunk.timeline.mark('received')
+        latency = int((time.time() - start_time) * 1000)
+        return transcription_pipeline.TranscriptionResult(transcription, latency, len(prompt or ''))
+
+    def on_partial(self, audio_chunk, text):
+        """ストリーミング中の途中経過を通知（ワーカースレッド） / Announce in-progress text while the response streams in (worker thread)"""
+        if 'partial' not in audio_chunk.timeline.stamps:
+            audio_chunk.timeline.mark('partial')
+        if text:
+            self.emit('partial', TranscriptEvent('partial', audio_chunk.source.labelled(text), audio_chunk, rate=self.RATE))
+
+    def on_chunk_dropped(self, audio_chunk, reason):
+        """キューで捨てた・まとめたチャンクの順番を進める / Advance ordering past a chunk the queue dropped or merged away"""
+        if audio_chunk.timeline is not None:
+            audio_chunk.timeline.outcome = reason
+        self.transcription_pool.skip(audio_chunk)
+
+    def on_chunk_duration_change(self, record):
+        """チャンク長の変更を記録 / Log a chunk duration change"""
+        print(f"チャンク長 / Chunk duration: {record['from']:.2f}s -> {record['to']:.2f}s "
+              f"({record['reason']}, RTF {record['rtf']:.2f}, queued {record['queued']})")
+        self.timeline_recorder.log_event(record)
+        self.emit('chunk_duration', record)
+
+    def on_transcription(self, audio_chunk, result):
+        """捕捉順に並べ直された結果を処理 / Handle a result released in capture order"""
+        if self.results_closed:
+            # 停止の期限を過ぎて届いた結果 / A result that arrived after stopping gave up waiting
+            return
+        timeline = audio_chunk.timeline
+        timeline.mark('released')
+        if result is not None and self.chunk_controller:
+            self.chunk_controller.observe(len(audio_chunk) / self.RATE, result.latency_ms / 1000.0,
+                                          self.transcription_queue.qsize() + self.upload_queue.qsize())
+        if result is None or not result.text:
+            timeline.outcome = timeline.outcome or 'failed'
+            self.timeline_recorder.record(timeline)
+            return
+
+        # 前のチャンクと音声が重なっていれば重複部分を除去 / Drop text repeated from the previous chunk when the audio overlaps
+        source = audio_chunk.source
+        if audio_chunk.start_sample < source.last_committed_end:
+            text = source.stitcher.stitch(result.text)
+        else:
+            text = source.stitcher.push(result.text)
+        source.last_committed_end = audio_chunk.end_sample
+        if not text:
+            timeline.outcome = 'empty'
+            self.timeline_recorder.record(timeline)
+            return
+
+        # コンテキスト履歴を更新 / Update context history
+        source.prompt_builder.add(text)
+        # セッション開始からのサンプル位置で時刻を付ける / Time stamps from the sample offset since the session started
+        start, end = audio_chunk.start_sample / self.RATE, audio_chunk.end_sample / self.RATE
+        if self.journal:
+            self.journal.add_transcript(audio_chunk.seq, text, start, end, source.label)
+        text = source.labelled(text)
+        if self.subtitle_writer:
+            self.subtitle_writer.add(start, end, text, source.name)
+
+        # 遅れすぎた結果は記録するが浮動字幕には出さない / Late results are still logged but kept off the overlay
+        overlay = True
+        if self.QUEUE_POLICY == 'skip_stale' and audio_chunk.lag_samples() > self.STALE_DEADLINE * self.RATE:
+            overlay = False
+            self.overlay_skipped += 1
+
+        event = TranscriptEvent('final', text, audio_chunk, result, overlay, self.RATE)
+        self.emit('transcript', event)
+        if not self.client_renders:
+            self.rendered([event])
+
+    def rendered(self, events):
+        """字幕を表示した時点でタイムラインを記録（client_renders の場合はクライアントが呼ぶ） / Record timelines once subtitles are shown (called by the client with client_renders)"""
+        for event in events:
+            timeline = event.chunk.timeline
+            timeline.mark('rendered')
+            timeline.outcome = 'rendered'
+            self.timeline_recorder.record(timeline)
+            event.chunk.source.record_lag(timeline.lag())
+
+    def build_context_prompt(self, source):
+        """ソースのコンテキストプロンプトを取得（結果ごとに組み立て済み） / Get the source's context prompt, already assembled as results arrive"""
+        return source.prompt_builder.build()
+
+    def call_transcription_api(self, payload, prompt, on_partial=None):
+        """設定されたバックエンドで文字起こし / Transcribe through the configured backend"""
+        try:
+            return self.backend.transcribe(payload, self.language, prompt, on_partial)
+        except api_client.TranscriptionAPIError as e:
+            print(f"APIエラー / API error: {e}")
+            return None
+        except Exception as e:
+            print(f"API呼び出しに失敗しました / Failed to call API: {e}")
+            return None
@@ -0,0 +1,383 @@
+import threading
+import queue
+import time
+from collections import deque
+
+from audio_processing import AudioChunk
+from latency_timeline import ChunkTimeline
+
+
+class TranscriptionResult:
+    """1チャンク分の文字起こし結果 / Transcription result for one chunk"""
+    __slots__ = ('text', 'latency_ms', 'prompt_length')
+
+    def __init__(self, text=None, latency_ms=0, prompt_length=0):
+        self.text = text
+        self.latency_ms = latency_ms
+        self.prompt_length = prompt_length
+
+
+class ReorderBuffer:
+    """結果を捕捉順（シーケンス番号順）に解放する / Release results strictly in capture (sequence) order
+
+    ワーカーは任意の順序で put() し、連続した番号が揃った分だけ release(chunk, result) が呼ばれる。
+    Workers put() in any order; release(chunk, result) is called for each
+    contiguous run of sequence numbers, always from inside the lock so that
+    releases never interleave. Buffers that share a lock never release at the same time either.
+    """
+    def __init__(self, release, first_seq=0, lock=None):
+        self.release = release
+        self.next_seq = first_seq
+        self.pending = {}
+        self.lock = lock or threading.Lock()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, seq, chunk, result):
+        """結果を登録し、解放可能な分を解放 / Register a result and release whatever is now in order"""
+        with self.lock:
+            self.pending[seq] = (chunk, result)
+            while self.next_seq in self.pending:
+                chunk, result = self.pending.pop(self.next_seq)
+                self.next_seq += 1
+                try:
+                    self.release(chunk, result)
+                except Exception as e:
+                    print(f"結果の解放に失敗しました / Failed to release result: {e}")
+
+
+class ChunkQueue:
+    """遅延を考慮した上限付きチャンクキュー / Bounded chunk queue that keeps live captions fresh
+
+    queue.Queue と同じ put/get/qsize/empty を持つが、put() は待たない。
+    上限 maxsize を超えたときと、先頭のチャンクが stale_after 秒以上ライブ音声から遅れたときの扱いを policy で選ぶ:
+    Same put/get/qsize/empty as queue.Queue, but put() never blocks. policy
+    decides what happens when more than maxsize chunks are queued and when
+    the head chunk trails live audio by more than stale_after seconds:
+
+      'drop_oldest'  古いチャンクを捨てる（遅れたチャンクも送らない） / Drop the oldest chunks; stale ones are never sent
+      'merge'        待っている隣接チャンクを1つのリクエストにまとめる / Merge adjacent pending chunks into one request
+      'skip_stale'   すべて送る（上限超過時のみ最古を捨てる）。遅れた結果を字幕オーバーレイに出さないのは呼び出し側
+                     Send everything (dropping the oldest only past maxsize);
+                     the caller keeps stale results off the overlay
+
+    捨てた・まとめたチャンクは on_drop(chunk, reason) に渡される（ロックの外で呼ぶ）。
+    condition を渡すと複数のキューで1つのロックを共有する（FairChunkQueue 用）。
+    Dropped or merged-away chunks go to on_drop(chunk, reason), called outside the lock.
+    Passing condition shares one lock between several queues (for FairChunkQueue).
+    """
+    POLICIES = ('drop_oldest', 'merge', 'skip_stale')
+
+    def __init__(self, rate, maxsize=8, policy='merge', stale_after=8.0, max_merged_seconds=20.0, on_drop=None,
+                 condition=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"unknown queue policy: {policy} (choose from {', '.join(self.POLICIES)})")
+        self.rate = rate
+        self.maxsize = max(int(maxsize), 1)
+        self.policy = policy
+        self.stale_after = stale_after
+        self.max_merged_samples = int(max_merged_seconds * rate)
+        self.on_drop = on_drop
+        self.queue = deque()
+        self.not_empty = condition or threading.Condition()
+        self.stats = {'dropped': 0, 'merged': 0}
+
+    def qsize(self):
+        return len(self.queue)
+
+    def empty(self):
+        return not self.queue
+
+    def is_stale(self, chunk):
+        """ライブ音声から stale_after 秒以上遅れているか / Whether the chunk trails live audio by more than stale_after"""
+        return chunk.lag_samples() > self.stale_after * self.rate
+
+    def put(self, chunk):
+        removed = []
+        with self.not_empty:
+            self.queue.append(chunk)
+            if len(self.queue) > self.maxsize:
+                if self.policy == 'merge':
+                    removed = self.merge_pending()
+                while len(self.queue) > self.maxsize:
+                    removed.append((self.queue.popleft(), 'dropped'))
+            self.not_empty.notify()
+        self.report(removed)
+
+    def get(self, timeout=None):
+        with self.not_empty:
+            if not self.not_empty.wait_for(lambda: self.queue, timeout):
+                raise queue.Empty
+            chunk, removed = self.take()
+        self.report(removed)
+        if chunk is None:
+            raise queue.Empty
+        return chunk
+
+    def take(self):
+        """古さの方針を適用して先頭を取り出す（ロック内で呼ぶ） / Apply the staleness policy and pop the head (call with the lock held)
+
+        戻り値は (チャンクまたは None, 捨てた・まとめたチャンク)。
+        Returns (chunk or None, removed chunks).
+        """
+        removed = []
+        if self.queue and self.is_stale(self.queue[0]):
+            if self.policy == 'drop_oldest':
+                while self.queue and self.is_stale(self.queue[0]):
+                    removed.append((self.queue.popleft(), 'dropped'))
+            elif self.policy == 'merge':
+                removed = self.merge_pending()
+        chunk = self.queue.popleft() if self.queue else None
+        return chunk, removed
+
+    def merge_pending(self):
+        """先頭から続くチャンクを1つにまとめる（ロック内で呼ぶ） / Merge the chunks at the head into one (call with the lock held)
+
+        まとめたチャンクは最後のチャンクの番号を引き継ぎ、前のチャンクは空の結果として順番だけ進める。
+        The merged chunk takes the last chunk's sequence number; the earlier
+        ones only advance ordering, with an empty result.
+        """
+        removed = []
+        # 上書きされたチャンクはまとめられない / Overwritten chunks cannot be merged
+        while self.queue and not self.queue[0].is_intact():
+            removed.append((self.queue.popleft(), 'dropped'))
+        if len(self.queue) < 2:
+            return removed
+        first = self.queue[0]
+        count = 1
+        while (count < len(self.queue) and self.queue[count].buffer is first.buffer
+               and self.queue[count].end_sample - first.start_sample <= self.max_merged_samples):
+            count += 1
+        if count < 2:
+            return removed
+        last = self.queue[count - 1]
+        try:
+            samples = first.buffer.view(first.start_sample, last.end_sample - first.start_sample)
+        except ValueError:
+            return removed
+        merged = AudioChunk(samples, first.start_sample, first.buffer, last.seq)
+        merged.source = first.source
+        if first.timeline is not None:
+            # 最初のチャンクの捕捉時刻を引き継ぐ / Keep the first chunk's capture stamps
+            merged.timeline = ChunkTimeline(last.seq, len(samples) / self.rate, first.timeline.source)
+            merged.timeline.stamps = dict(first.timeline.stamps)
+        # 最後のチャンクはまとめたチャンクに置き換わる / The last chunk is replaced by the merged one
+        for _ in range(count):
+            chunk = self.queue.popleft()
+            if chunk is not last:
+                removed.append((chunk, 'merged'))
+        self.queue.appendleft(merged)
+        return removed
+
+    def report(self, removed):
+        for chunk, reason in removed:
+            self.stats[reason] += 1
+            if self.on_drop:
+                try:
+                    self.on_drop(chunk, reason)
+                except Exception as e:
+                    print(f"チャンク破棄の処理に失敗しました / Failed to handle dropped chunk: {e}")
+
+
+class FairChunkQueue:
+    """入力ソースごとの ChunkQueue をラウンドロビンで取り出す / Take from one ChunkQueue per input source, round-robin
+
+    各ソースのキューは上限と方針を個別に持つため、チャンクを大量に出すソースは自分のキューで
+    捨てられ・まとめられるだけで、他のソースの順番を奪うことはない。get() は queue.Queue と同じ。
+    Each source's queue has its own bound and policy, so a source that emits
+    a flood of chunks only drops or merges within its own queue and never
+    takes turns from the others. get() behaves like queue.Queue.get().
+    """
+    def __init__(self):
+        self.not_empty = threading.Condition()
+        self.queues = []
+        self.turn = 0
+
+    def add(self, rate, **options):
+        """ソース用のキューを追加して返す / Add and return a queue for one source"""
+        chunk_queue = ChunkQueue(rate, condition=self.not_empty, **options)
+        with self.not_empty:
+            self.queues.append(chunk_queue)
+        return chunk_queue
+
+    def qsize(self):
+        return sum(len(chunk_queue.queue) for chunk_queue in self.queues)
+
+    def empty(self):
+        return not any(chunk_queue.queue for chunk_queue in self.queues)
+
+    @property
+    def stats(self):
+        """全ソースの合計 / Totals over all sources"""
+        totals = {'dropped': 0, 'merged': 0}
+        for chunk_queue in self.queues:
+            for key in totals:
+                totals[key] += chunk_queue.stats[key]
+        return totals
+
+    def get(self, timeout=None):
+        with self.not_empty:
+            if not self.not_empty.wait_for(lambda: not self.empty(), timeout):
+                raise queue.Empty
+            removed = []
+            chunk = None
+            count = len(self.queues)
+            for i in range(count):
+                chunk_queue = self.queues[(self.turn + i) % count]
+                if not chunk_queue.queue:
+                    continue
+                chunk, dropped = chunk_queue.take()
+                removed.append((chunk_queue, dropped))
+                if chunk is not None:
+                    # 次は隣のソースから / The next source goes first next time
+                    self.turn = (self.turn + i + 1) % count
+                    break
+        for chunk_queue, dropped in removed:
+            chunk_queue.report(dropped)
+        if chunk is None:
+            raise queue.Empty
+        return chunk
+
+
+class TranscriptionWorkerPool:
+    """並列文字起こしワーカープール / Concurrent transcription worker pool
+
+    work_queue からチャンクを取り出し、最大 workers 件のリクエストを同時に処理する。
+    結果は入力ソース（chunk.source）ごとの ReorderBuffer を通して捕捉順に release に渡される。
+    あるソースの遅いチャンクが他のソースの結果を止めることはない。
+    Pulls chunks from work_queue and keeps up to `workers` requests in flight.
+    Results are handed to `release` in capture order through one ReorderBuffer
+    per input source (chunk.source), so a slow chunk of one source never holds
+    back the results of another.
+    """
+    def __init__(self, work_queue, transcribe, release, workers=3):
+        self.work_queue = work_queue
+        self.transcribe = transcribe
+        self.release = release
+        self.reorders = {}              # ソース -> ReorderBuffer / source -> ReorderBuffer
+        self.release_lock = threading.RLock()   # release は同時に1つだけ（release 内から stop しても詰まらない） / One release at a time (re-entrant, so stopping from inside release cannot deadlock)
+        self.workers = max(int(workers), 1)
+        self.threads = []
+        self.running = False
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def reorder_for(self, source):
+        """ソースの ReorderBuffer（なければ作る） / The source's ReorderBuffer, created on first use"""
+        reorder = self.reorders.get(source)
+        if reorder is None:
+            with self.lock:
+                reorder = self.reorders.get(source)
+                if reorder is None:
+                    reorder = self.reorders[source] = ReorderBuffer(self.release, lock=self.release_lock)
+        return reorder
+
+    def start(self):
+        """ワーカースレッドを起動 / Start worker threads"""
+        self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.worker_loop, name=f"transcription-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        """ワーカーに停止を指示し、処理中のリクエストの終了を最大 timeout 秒待つ / Tell workers to stop and wait up to timeout seconds for requests in flight
+
+        戻り値は時間内に終わらなかったワーカーの数。
+        Returns the number of workers still running when the wait ended.
+        """
+        self.running = False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(None if deadline is None else max(deadline - time.monotonic(), 0.0))
+        alive = sum(thread.is_alive() for thread in self.threads)
+        self.threads = []
+        return alive
+
+    def skip(self, chunk):
+        """送信しないチャンクの順番を進める / Advance ordering past a chunk that will not be sent"""
+        self.reorder_for(chunk.source).put(chunk.seq, chunk, None)
+
+    @property
+    def backlog(self):
+        """未処理・処理中・順序待ちのチャンク数 / Chunks queued, in flight, or waiting for reordering"""
+        return self.work_queue.qsize() + self.in_flight + sum(len(reorder) for reorder in list(self.reorders.values()))
+
+    def worker_loop(self):
+        """ワーカースレッド本体 / Worker thread body"""
+        while self.running:
+            try:
+                chunk = self.work_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            with self.lock:
+                self.in_flight += 1
+            try:
+                result = self.transcribe(chunk)
+            except Exception as e:
+                print(f"文字起こしエラー / Transcription error: {e}")
+                result = None
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+            # 失敗したチャンクも順序を進めるため必ず登録 / Always register, even failures, so ordering never stalls
+            self.reorder_for(chunk.source).put(chunk.seq, chunk, result)
+
+
+class EncodingStage:
+    """アップロード前のエンコード段（専用スレッド） / Pre-upload encoding stage on its own thread
+
+    input_queue のチャンクをエンコードして chunk.payload に格納し output_queue に渡す。
+    ネットワーク用ワーカーはエンコード済みのチャンクだけを受け取るため、
+    エンコードが送信中のリクエストを遅らせることはない。
+    Encodes chunks from input_queue into chunk.payload and forwards them to
+    output_queue. Network workers only ever see encoded chunks, so encoding
+    never delays an in-flight request.
+    on_drop(chunk) はリングバッファ上で上書きされたチャンクに対して呼ばれる。
+    on_drop(chunk) is called for chunks overwritten in the ring buffer.
+    """
+    def __init__(self, input_queue, output_queue, encode, on_drop=None):
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.encode = encode
+        self.on_drop = on_drop
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='encoder', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        while self.running:
+            try:
+                chunk = self.input_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                chunk.payload = self.encode(chunk.samples)
+            except Exception as e:
+                print(f"エンコードエラー / Encoding error: {e}")
+                chunk.payload = None
+            if chunk.timeline is not None:
+                chunk.timeline.mark('encoded')
+            # エンコード中に上書きされていないか確認 / Make sure the view was not overwritten while encoding
+            if chunk.payload is None or not chunk.is_intact():
+                if chunk.payload is not None:
+                    print("チャンクが上書きされたため破棄します / Dropping chunk overwritten in ring buffer")
+                if self.on_drop:
+                    self.on_drop(chunk)
+                continue
+            # 送信待ちに空きができるまで待ち、滞留は入力側のキューに溜める / Wait for room so any backlog stays in the input queue
+            while self.running:
+                try:
+                    self.output_queue.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
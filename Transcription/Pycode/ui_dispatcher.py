@@ -0,0 +1,98 @@
+"""GUI更新のまとめ役 / Coalescing GUI update dispatcher
+
+ワーカースレッドは値を書き込むだけで Tk を呼ばない。メインスレッドが一定間隔（フレーム）ごとに
+最新の値だけを反映し、溜まった追加分（字幕など）はまとめて1回で処理する。
+Worker threads only write values and never call Tk. The main thread flushes
+once per frame: each key is applied with its latest value only, and items
+appended since the last frame (subtitles, ...) are handed over as one batch.
+
+    ui = UIDispatcher(root, frame_ms=50)
+    ui.on_update('level', update_level)       # handler(value)
+    ui.on_batch('subtitle', render_subtitles)  # handler([item, ...])
+    ui.start()
+    ui.update('level', 0.3)                    # どのスレッドからでも / from any thread
+    ui.append('subtitle', text)
+"""
+import time
+from collections import deque
+
+
+class UIDispatcher:
+    """フレーム単位でGUIを更新 / Apply GUI updates once per frame
+
+    update() と append() はロックを取らない（dict の代入と deque.append は GIL 下で原子的）。
+    update() and append() take no lock: dict assignment and deque.append are
+    atomic under the GIL, so producers never wait on the Tk thread.
+    """
+    def __init__(self, root, frame_ms=50):
+        self.root = root
+        self.frame_ms = frame_ms
+        self.latest = {}         # key -> 最新の値 / latest value
+        self.pending = deque()   # (key, item) の追加分 / appended (key, item) pairs
+        self.update_handlers = {}
+        self.batch_handlers = {}
+        self.running = False
+        self.frames = 0
+        self.coalesced = 0       # 反映されずに上書きされた値の数 / Values overwritten before they were shown
+
+    def on_update(self, key, handler):
+        """最新値だけを渡すハンドラを登録 / Register a handler that receives only the latest value"""
+        self.update_handlers[key] = handler
+
+    def on_batch(self, key, handler):
+        """フレーム内の追加分をリストで渡すハンドラを登録 / Register a handler that receives a frame's items as a list"""
+        self.batch_handlers[key] = handler
+
+    def update(self, key, value):
+        """値を設定（前フレーム以降の古い値は捨てる） / Set a value, replacing any not yet shown"""
+        if key in self.latest:
+            self.coalesced += 1
+        self.latest[key] = value
+
+    def append(self, key, item):
+        """次のフレームでまとめて処理する項目を追加 / Queue an item for the next frame's batch"""
+        self.pending.append((key, item))
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.root.after(self.frame_ms, self.flush)
+
+    def stop(self):
+        self.running = False
+
+    def flush(self):
+        """溜まった更新を反映し、次のフレームを予約（メインスレッド） / Apply pending updates and schedule the next frame (main thread)"""
+        started = time.monotonic()
+        try:
+            self.drain()
+        finally:
+            if self.running:
+                # 処理にかかった分だけ次のフレームを早める / Keep a steady frame rate despite the time spent here
+                spent_ms = (time.monotonic() - started) * 1000.0
+                self.root.after(max(int(self.frame_ms - spent_ms), 1), self.flush)
+
+    def drain(self):
+        """更新と追加分を今すぐ反映 / Apply updates and batches right now"""
+        self.frames += 1
+        batches = {}
+        for _ in range(len(self.pending)):
+            key, item = self.pending.popleft()
+            batches.setdefault(key, []).append(item)
+        for key, items in batches.items():
+            try:
+                self.batch_handlers[key](items)
+            except Exception as e:
+                print(f"GUI更新エラー / GUI update error ({key}): {e}")
+
+        # popitem は原子的なので、取り出し中に書かれた値は次のフレームに残る
+        # popitem is atomic, so a value written while draining waits for the next frame
+        while self.latest:
+            try:
+                key, value = self.latest.popitem()
+            except KeyError:
+                break
+            try:
+                self.update_handlers[key](value)
+            except Exception as e:
+                print(f"GUI更新エラー / GUI update error ({key}): {e}")